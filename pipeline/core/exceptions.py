@@ -1,2 +1,10 @@
+import requests
+
+
 class SecretNotFound(KeyError):
     pass
+
+
+class CircuitOpen(requests.ConnectionError):
+    """Raised instead of calling a provider whose circuit breaker is open, see `core.resilience`"""
+    pass
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from subtitles.cues import Cue, parse_vtt, write_vtt
+
+
+class Command(BaseCommand):
+    help = 'Measures parsing and serializing of synthetic transcripts of growing length'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+        parser.add_argument('--cue-duration', type=int, default=3000, help='Duration of one cue in milliseconds')
+
+    def handle(self, *args, **options):
+        for hours in options['hours']:
+            cues = [
+                Cue(start, start + options['cue_duration'] - 1, f"Cue number {number} of the transcript\nsecond line",
+                    str(number))
+                for number, start in enumerate(range(0, hours * 60 * 60 * 1000, options['cue_duration']), start=1)
+            ]
+
+            start = time.perf_counter()
+            content = write_vtt(cues)
+            write_duration = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parsed = parse_vtt(content)
+            parse_duration = time.perf_counter() - start
+
+            assert parsed == cues
+
+            # Linear scaling keeps the time per cue constant across the lengths
+            self.stdout.write(f"{hours:>3}h, {len(cues):>6} cues, {len(content) / 1024 / 1024:6.1f} MiB: "
+                              f"write {write_duration:.3f}s ({write_duration / len(cues) * 1e6:.2f} us/cue), "
+                              f"parse {parse_duration:.3f}s ({parse_duration / len(cues) * 1e6:.2f} us/cue)")
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from subtitles.api.xikolo_client import XikoloClient
+from subtitles.api.xikolo_stub import XikoloStubServer
+
+
+class Command(BaseCommand):
+    help = 'Measures the throughput of the Xikolo client against a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--latency', type=float, default=0.02, help='Simulated latency per request in seconds')
+
+    def handle(self, *args, **options):
+        paths = [f"videos/video-{i}" for i in range(options['requests'])]
+
+        with XikoloStubServer(latency=options['latency']) as server:
+            client = XikoloClient(server.base_url, 'benchmark', options['workers'])
+
+            self.measure("sequential (sync)", server, lambda: [client.get(path) for path in paths])
+            self.measure("concurrent (async)", server, lambda: asyncio.run(self.get_many(client, paths)))
+
+    async def get_many(self, client, paths):
+        try:
+            return await client.aget_many(paths)
+        finally:
+            await client.aclose()
+
+    def measure(self, name, server, fn):
+        server.requests = 0
+        server.connections.clear()
+
+        start = time.perf_counter()
+        responses = fn()
+        duration = time.perf_counter() - start
+
+        assert all(response.status_code == 200 for response in responses)
+
+        self.stdout.write(f"{name}: {len(responses)} requests in {duration:.2f}s "
+                          f"({len(responses) / duration:.0f} req/s, {len(server.connections)} connections)")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from subtitles.models import Subtitle, SubtitleFile
+
+
+class Command(BaseCommand):
+    help = 'Stores the older versions of all subtitles as deltas, see SubtitleFile'
+
+    def handle(self, *args, **options):
+        subtitles = Subtitle.objects.annotate(full_versions=Count('subtitlefile', filter=Q(subtitlefile__blob__isnull=False))) \
+            .filter(full_versions__gt=1)
+
+        compacted = 0
+        for subtitle in subtitles.iterator():
+            compacted += SubtitleFile.objects.compact_history(subtitle)
+
+        self.stdout.write(f"Replaced {compacted} subtitle versions by deltas")
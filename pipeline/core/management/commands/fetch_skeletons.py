@@ -1,51 +1,57 @@
-from pprint import pprint
-
 from django.core.management.base import BaseCommand, CommandError
 
 from core.models import Tenant
-from subtitles.api.xikolo_api import get_course_list
+from core.utils import bounded_thread_map
+from subtitles.api.xikolo_api import iter_course_list_pages
 from subtitles.models import Course, IsoLanguage
 from subtitles.models.course import SyncStatusChoices
 
 
 class Command(BaseCommand):
-    help = 'Fetches something'
+    help = 'Fetches the course list of the given tenants from Xikolo and stores new courses as skeletons'
 
     def add_arguments(self, parser):
         parser.add_argument('tenant_slugs', nargs='+', type=str)
+        parser.add_argument('--workers', type=int, default=4, help='Number of tenants that are fetched in parallel')
 
     def handle(self, *args, **options):
+        tenants = []
         for tenant_slug in options['tenant_slugs']:
             try:
-                tenant = Tenant.objects.get(slug=tenant_slug)
+                tenants.append(Tenant.objects.get(slug=tenant_slug))
             except Tenant.DoesNotExist:
                 raise CommandError(f'Tenant with slug {tenant_slug} does not exist.')
 
-
-            l = get_course_list(tenant)
-
-            for course_entry in l:
-                iso_language_code = course_entry["language"][0:5]
-                print("Language code: " + iso_language_code)
-                try:
-                    language = IsoLanguage.objects.get(iso_code=iso_language_code)
-                except IsoLanguage.DoesNotExist:
-                    language = IsoLanguage.objects.get(iso_code='en')
-
-                try:
-                    course = Course.objects.get(tenant=tenant, ext_id=course_entry['id'])
-                except Course.DoesNotExist:
-                    course = Course(
-                        tenant=tenant,
-                        ext_id=course_entry['id'],
-                        sync_status=SyncStatusChoices.SKELETON,
-                    )
-
-                course.title = course_entry["title"]
-                course.abstract = course_entry["abstract"]
-                course.start_date = course_entry["start-date"]
-                course.end_date = course_entry["end-date"]
-                course.status = course_entry["status"]
-                course.language = language
-
-                course.save()
\ No newline at end of file
+        languages = IsoLanguage.objects.in_bulk()
+
+        def fetch_skeletons(tenant):
+            return tenant, sum(self.upsert_courses(tenant, page, languages) for page in iter_course_list_pages(tenant))
+
+        for tenant, number_of_courses in bounded_thread_map(fetch_skeletons, tenants, options['workers']):
+            self.stdout.write(f"{tenant.slug}: {number_of_courses} courses")
+
+    def upsert_courses(self, tenant, course_entries, languages):
+        """
+        Writes one page of the course list with a single bulk upsert.
+        New courses are created as skeletons, the sync status of existing courses is kept.
+        """
+
+        courses = [
+            Course(
+                tenant=tenant,
+                ext_id=course_entry['id'],
+                sync_status=SyncStatusChoices.SKELETON,
+                title=course_entry["title"],
+                abstract=course_entry["abstract"],
+                start_date=course_entry["start-date"],
+                end_date=course_entry["end-date"],
+                status=course_entry["status"],
+                language=languages.get(course_entry["language"][0:5]) or languages['en'],
+            )
+            for course_entry in course_entries
+        ]
+
+        Course.objects.bulk_create(courses, update_conflicts=True, unique_fields=['tenant', 'ext_id'],
+                                   update_fields=['title', 'abstract', 'start_date', 'end_date', 'status', 'language'])
+
+        return len(courses)
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from subtitles.models import Course
+from subtitles.timings import fix_course_timings
+
+
+class Command(BaseCommand):
+    help = 'Shifts, scales or de-overlaps the timings of all subtitles of a course, see fix_course_timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant_slug', type=str)
+        parser.add_argument('course_id', type=str, help='External id of the course')
+        parser.add_argument('--user', required=True, help='Username the new subtitle versions are stored for')
+        parser.add_argument('--offset', type=int, default=0, help='Shift in milliseconds')
+        parser.add_argument('--factor', type=float, default=1.0, help='Scale factor, e.g. 25/23.976')
+        parser.add_argument('--clip-overlaps', action='store_true', help='Let every cue end when the next one starts')
+        parser.add_argument('--min-gap', type=int, help='Report gaps of at least this many milliseconds')
+        parser.add_argument('--language', action='append', dest='languages', help='Only fix subtitles in this language')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(tenant__slug=options['tenant_slug'], ext_id=options['course_id'])
+        except Course.DoesNotExist:
+            raise CommandError(f"Course {options['course_id']} of tenant {options['tenant_slug']} does not exist.")
+
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        result = fix_course_timings(course, user, offset=options['offset'], factor=options['factor'],
+                                    clip=options['clip_overlaps'], min_gap=options['min_gap'],
+                                    languages=options['languages'], dry_run=options['dry_run'])
+
+        self.stdout.write(f"{result['cues']} cues in {result['subtitles']} subtitles, {result['overlaps']} overlaps, "
+                          f"{result['gaps'] if result['gaps'] is not None else 'unchecked'} gaps")
+        self.stdout.write(f"{'Would change' if options['dry_run'] else 'Changed'} {result['changed']} subtitles")
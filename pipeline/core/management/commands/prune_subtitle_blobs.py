@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from subtitles.models import SubtitleBlob
+
+
+class Command(BaseCommand):
+    help = 'Deletes subtitle blobs that are not referenced by any subtitle version anymore'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {SubtitleBlob.objects.prune()} unreferenced subtitle blobs")
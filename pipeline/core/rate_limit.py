@@ -0,0 +1,86 @@
+"""
+Rate limiting of outbound provider APIs, per tenant and provider.
+
+A limit is only applied if the tenant configures it, with the secrets `<PROVIDER>_RATE_LIMIT` (requests per second)
+and `<PROVIDER>_RATE_BURST` (requests per window, defaults to the rate). Requests are counted per window of
+burst / rate seconds with the atomic `add` / `incr` of the `RATE_LIMIT_CACHE` cache, so no database row is locked
+and nothing waits while holding a lock. With redis (REDIS_URL) the counts are shared by all web and Celery processes,
+otherwise every process counts on its own.
+"""
+
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.models import Tenant
+
+
+class Provider:
+    XIKOLO = "XIKOLO"
+    DEEPL = "DEEPL"
+    AWS_TRANSLATE = "AWS_TRANSLATE"
+    AWS_MIE = "AWS_MIE"
+    MLLP = "MLLP"
+
+
+def get_rate_limit_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def get_rate_limit(tenant: Tenant, provider):
+    """
+    @return: Tuple of (requests per second, requests per window), a rate of 0 disables the limit
+    """
+    rate = float(tenant.get_secret(f'{provider}_RATE_LIMIT', raise_exception=False, default=0))
+    burst = float(tenant.get_secret(f'{provider}_RATE_BURST', raise_exception=False, default=max(rate, 1.0)))
+
+    return rate, burst
+
+
+def acquire(tenant: Tenant, provider, tokens=1):
+    """
+    Blocks until `tokens` requests of the tenant to the provider fit into the rate limit, and counts them.
+    """
+    if tenant is None:
+        return
+
+    rate, burst = get_rate_limit(tenant, provider)
+    if rate <= 0:
+        return
+
+    while True:
+        wait = _take_tokens(tenant, provider, rate, burst, tokens)
+        if wait <= 0:
+            return
+
+        time.sleep(wait)
+
+
+def _take_tokens(tenant, provider, rate, burst, tokens, now=None):
+    """
+    @return: 0 if the tokens were counted in the current window, otherwise the seconds until the next window
+    """
+    now = time.time() if now is None else now
+    window = max(burst, 1.0) / rate
+    window_index = math.floor(now / window)
+
+    rate_limit_cache = get_rate_limit_cache()
+    key = f"rate-limit:{tenant.pk}:{provider}:{window_index}"
+    timeout = math.ceil(window) + 1
+
+    if rate_limit_cache.add(key, tokens, timeout):
+        taken = tokens
+    else:
+        try:
+            taken = rate_limit_cache.incr(key, tokens)
+        except ValueError:
+            # The window expired in between
+            rate_limit_cache.add(key, tokens, timeout)
+            taken = tokens
+
+    if taken <= burst:
+        return 0.0
+
+    return (window_index + 1) * window - now
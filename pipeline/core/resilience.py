@@ -0,0 +1,170 @@
+"""
+Resilience of outbound provider calls: jittered exponential retries for idempotent calls and a circuit breaker per
+tenant and provider, which fails fast with `CircuitOpen` while a provider is down.
+
+The breaker state lives in the django cache, so all web and Celery processes share it. Every call also takes a token
+from the rate limit of the provider, see `core.rate_limit`.
+"""
+
+import asyncio
+import random
+import time
+from http import HTTPStatus
+
+import requests
+import urllib3
+from django.conf import settings
+from django.core.cache import cache
+
+from core.exceptions import CircuitOpen
+from core.rate_limit import acquire
+
+# (connect, read) timeout in seconds of provider HTTP calls
+DEFAULT_TIMEOUT = getattr(settings, 'PROVIDER_HTTP_TIMEOUT', (5, 60))
+
+RETRY_ATTEMPTS = getattr(settings, 'PROVIDER_RETRY_ATTEMPTS', 3)
+RETRY_BASE_DELAY = getattr(settings, 'PROVIDER_RETRY_BASE_DELAY', 0.5)
+RETRY_MAX_DELAY = getattr(settings, 'PROVIDER_RETRY_MAX_DELAY', 10)
+
+CIRCUIT_FAILURE_THRESHOLD = getattr(settings, 'PROVIDER_CIRCUIT_FAILURE_THRESHOLD', 5)
+CIRCUIT_RESET_TIMEOUT = getattr(settings, 'PROVIDER_CIRCUIT_RESET_TIMEOUT', 60)
+
+TRANSIENT_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    urllib3.exceptions.HTTPError,
+    ConnectionError,
+    TimeoutError,
+)
+
+TRANSIENT_STATUS_CODES = {
+    HTTPStatus.TOO_MANY_REQUESTS,
+    HTTPStatus.INTERNAL_SERVER_ERROR,
+    HTTPStatus.BAD_GATEWAY,
+    HTTPStatus.SERVICE_UNAVAILABLE,
+    HTTPStatus.GATEWAY_TIMEOUT,
+}
+
+
+def backoff_delay(attempt):
+    """
+    Full jitter: a random delay up to the exponential backoff of the attempt.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def get_status_code(response):
+    # requests / httpx responses have status_code, urllib3 responses have status
+    return getattr(response, 'status_code', getattr(response, 'status', None))
+
+
+class CircuitBreaker:
+    """
+    Opens after `CIRCUIT_FAILURE_THRESHOLD` consecutive failures for `CIRCUIT_RESET_TIMEOUT` seconds. After that,
+    calls are let through again, a single failure opens it again and a success closes it.
+    """
+
+    def __init__(self, tenant, provider):
+        self.provider = provider
+        self.cache_key = f"circuit-breaker:{tenant.pk}:{provider}"
+        self.state = None
+
+    def check(self):
+        self.state = cache.get(self.cache_key)
+
+        if self.state and self.state['opened_until'] > time.time():
+            raise CircuitOpen(f"{self.provider} is unavailable, retry after {self.state['opened_until'] - time.time():.0f}s")
+
+    def record_success(self):
+        if self.state:
+            cache.delete(self.cache_key)
+            self.state = None
+
+    def record_failure(self):
+        state = cache.get(self.cache_key) or {'failures': 0, 'opened_until': 0}
+        state['failures'] += 1
+
+        if state['failures'] >= CIRCUIT_FAILURE_THRESHOLD:
+            state['opened_until'] = time.time() + CIRCUIT_RESET_TIMEOUT
+
+        cache.set(self.cache_key, state, CIRCUIT_RESET_TIMEOUT * 10)
+        self.state = state
+
+
+def _is_transient_failure(result):
+    status_code = get_status_code(result)
+    return status_code in TRANSIENT_STATUS_CODES
+
+
+def call_provider(tenant, provider, fn, *args, idempotent=False, transient_exceptions=(), **kwargs):
+    """
+    Calls `fn(*args, **kwargs)` against a provider: rate limited, guarded by the circuit breaker of the tenant and
+    provider, and retried with backoff on transient errors if the call is idempotent.
+
+    Connection errors, timeouts, `transient_exceptions` and 5xx responses count as failures of the provider. After
+    the last attempt the exception is raised, or the response returned.
+    """
+    if tenant is None:
+        return fn(*args, **kwargs)
+
+    breaker = CircuitBreaker(tenant, provider)
+    attempts = RETRY_ATTEMPTS if idempotent else 1
+
+    for attempt in range(attempts):
+        breaker.check()
+        acquire(tenant, provider)
+
+        try:
+            result = fn(*args, **kwargs)
+        except CircuitOpen:
+            raise
+        except TRANSIENT_EXCEPTIONS + tuple(transient_exceptions):
+            breaker.record_failure()
+            if attempt + 1 >= attempts:
+                raise
+        else:
+            if not _is_transient_failure(result):
+                breaker.record_success()
+                return result
+
+            if get_status_code(result) != HTTPStatus.TOO_MANY_REQUESTS:
+                breaker.record_failure()
+            if attempt + 1 >= attempts:
+                return result
+
+        time.sleep(backoff_delay(attempt))
+
+
+async def acall_provider(tenant, provider, fn, *args, idempotent=False, transient_exceptions=(), **kwargs):
+    """
+    `call_provider` for coroutine functions.
+    """
+    if tenant is None:
+        return await fn(*args, **kwargs)
+
+    breaker = CircuitBreaker(tenant, provider)
+    attempts = RETRY_ATTEMPTS if idempotent else 1
+
+    for attempt in range(attempts):
+        await asyncio.to_thread(breaker.check)
+        await asyncio.to_thread(acquire, tenant, provider)
+
+        try:
+            result = await fn(*args, **kwargs)
+        except CircuitOpen:
+            raise
+        except TRANSIENT_EXCEPTIONS + tuple(transient_exceptions):
+            await asyncio.to_thread(breaker.record_failure)
+            if attempt + 1 >= attempts:
+                raise
+        else:
+            if not _is_transient_failure(result):
+                await asyncio.to_thread(breaker.record_success)
+                return result
+
+            if get_status_code(result) != HTTPStatus.TOO_MANY_REQUESTS:
+                await asyncio.to_thread(breaker.record_failure)
+            if attempt + 1 >= attempts:
+                return result
+
+        await asyncio.sleep(backoff_delay(attempt))
@@ -8,8 +8,10 @@ from mooclink.services.aws_translation_service import AwsTranslationService
 from subtitles.api.aws_api import aws_start_transcription, aws_update_video_status, aws_start_transcription_only, \
     aws_update_transcription_only
 from subtitles.api.mllp_api import mllp_start_transcription, update_mllp_video_status
-from subtitles.api.xikolo_api import update_video_detail
-from subtitles.models import Video
+from subtitles.api.xikolo_api import update_video_detail, run_bulk_publish_job, forget_xikolo_response, \
+    refresh_subtitle
+from subtitles.api.xikolo_sync import XikoloCourseSync
+from subtitles.models import Video, Course
 
 logger = logging.getLogger('__name__')
 
@@ -28,6 +30,30 @@ def task_update_video_detail(self, local_video_id, ext_video_id):
     result = update_video_detail(local_video_id, ext_video_id)
 
 
+@shared_task(bind=True)
+def task_refresh_video_detail(self, local_video_id, ext_video_id):
+    # Pushed change, the memoized response of this worker may already be outdated
+    video = Video.objects.select_related('tenant').get(pk=local_video_id)
+    forget_xikolo_response(video.tenant, video.tenant.XIKOLO_API_URL + "videos/" + ext_video_id)
+
+    update_video_detail(local_video_id, ext_video_id)
+
+
+@shared_task(bind=True)
+def task_refresh_subtitle(self, subtitle_id):
+    refresh_subtitle(subtitle_id)
+
+
+@shared_task(bind=True)
+def task_sync_course(self, course_id, changed_video_ext_ids=()):
+    XikoloCourseSync(Course.objects.get(pk=course_id), changed_video_ext_ids=changed_video_ext_ids).run()
+
+
+@shared_task(bind=True)
+def task_bulk_publish(self, job_id):
+    run_bulk_publish_job(job_id)
+
+
 @shared_task(bind=True)
 def task_aws_start_transcription(self, video_id):
     result = aws_start_transcription(video_id=video_id)
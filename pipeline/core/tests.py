@@ -1,3 +1,135 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, TestCase
+
+from subtitles.models import Course, IsoLanguage
+from subtitles.models.course import SyncStatusChoices
+from .exceptions import CircuitOpen
+from .management.commands.fetch_skeletons import Command as FetchSkeletonsCommand
+from .models import Tenant
+from .rate_limit import Provider, _take_tokens, acquire, get_rate_limit, get_rate_limit_cache
+from .resilience import CIRCUIT_FAILURE_THRESHOLD, call_provider
+from .utils import TTLCache
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_expiry_eviction_and_counters(self):
+        now = [0]
+        memo = TTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+
+        memo.set('a', 1)
+        memo.set('b', 2)
+        self.assertEqual(memo.get('a'), 1)
+
+        # 'b' is the least recently used entry
+        memo.set('c', 3)
+        self.assertIsNone(memo.get('b'))
+
+        now[0] = 10
+        self.assertIsNone(memo.get('a'))
+
+        self.assertEqual(memo.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+
+    def test_size_bound(self):
+        memo = TTLCache(maxsize=10, ttl=10, getsizeof=len)
+
+        memo.set('a', "aaaa")
+        memo.set('b', "bbbb")
+        memo.set('c', "cccc")
+        self.assertIsNone(memo.get('a'))
+        self.assertEqual(memo.currsize, 8)
+
+        # Values larger than the whole cache are not stored
+        memo.set('d', "d" * 11)
+        self.assertIsNone(memo.get('d'))
+        self.assertEqual(memo.get('c'), "cccc")
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.addCleanup(get_rate_limit_cache().clear)
+
+    def test_requests_are_counted_per_window(self):
+        tenant = Tenant.objects.create(name="Test", slug="test", secrets={
+            'DEEPL_RATE_LIMIT': 10,
+            'DEEPL_RATE_BURST': 2,
+        })
+        self.assertEqual(get_rate_limit(tenant, Provider.DEEPL), (10.0, 2.0))
+
+        # Windows of 0.2 seconds with 2 requests each
+        self.assertEqual(_take_tokens(tenant, Provider.DEEPL, 10.0, 2.0, 1, now=100.05), 0)
+        self.assertEqual(_take_tokens(tenant, Provider.DEEPL, 10.0, 2.0, 1, now=100.1), 0)
+        self.assertAlmostEqual(_take_tokens(tenant, Provider.DEEPL, 10.0, 2.0, 1, now=100.15), 0.05)
+        self.assertEqual(_take_tokens(tenant, Provider.DEEPL, 10.0, 2.0, 1, now=100.2), 0)
+
+        # Other providers have their own count
+        self.assertEqual(_take_tokens(tenant, Provider.MLLP, 10.0, 2.0, 1, now=100.15), 0)
+
+    @mock.patch('core.rate_limit._take_tokens')
+    def test_providers_without_a_configured_limit_are_not_limited(self, take_tokens):
+        tenant = Tenant.objects.create(name="Test", slug="test")
+
+        self.assertEqual(get_rate_limit(tenant, Provider.XIKOLO), (0.0, 1.0))
+        acquire(tenant, Provider.XIKOLO)
+        take_tokens.assert_not_called()
+
+
+class CallProviderTests(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Test", slug="test", secrets={'DEEPL_RATE_LIMIT': 0})
+
+    @mock.patch('core.resilience.time.sleep')
+    def test_idempotent_calls_are_retried(self, sleep):
+        fn = mock.Mock(side_effect=[requests.ConnectionError(), "ok"])
+
+        self.assertEqual(call_provider(self.tenant, Provider.DEEPL, fn, idempotent=True), "ok")
+        self.assertEqual(fn.call_count, 2)
+
+        fn = mock.Mock(side_effect=requests.ConnectionError())
+        with self.assertRaises(requests.ConnectionError):
+            call_provider(self.tenant, Provider.DEEPL, fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        fn = mock.Mock(side_effect=requests.Timeout())
+
+        for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+            with self.assertRaises(requests.Timeout):
+                call_provider(self.tenant, Provider.DEEPL, fn)
+
+        with self.assertRaises(CircuitOpen):
+            call_provider(self.tenant, Provider.DEEPL, fn)
+        self.assertEqual(fn.call_count, CIRCUIT_FAILURE_THRESHOLD)
+
+        # Other providers are not affected
+        self.assertEqual(call_provider(self.tenant, Provider.MLLP, lambda: "ok"), "ok")
+
+
+def make_course_list_entry(ext_id, title, language="en"):
+    return {"id": ext_id, "title": title, "abstract": "", "start-date": "2024-01-01T00:00:00Z",
+            "end-date": "2024-02-01T00:00:00Z", "status": "active", "language": language}
+
+
+class FetchSkeletonsTests(TestCase):
+    def test_courses_are_upserted_as_skeletons(self):
+        tenant = Tenant.objects.create(name="Test", slug="test")
+        english = IsoLanguage.objects.create(iso_code="en", description="English")
+        german = IsoLanguage.objects.create(iso_code="de", description="German")
+        languages = IsoLanguage.objects.in_bulk()
+        command = FetchSkeletonsCommand()
+
+        self.assertEqual(command.upsert_courses(tenant, [make_course_list_entry("c1", "First"),
+                                                         make_course_list_entry("c2", "Second", "xx")], languages), 2)
+        synced = Course.objects.get(ext_id="c1")
+        Course.objects.filter(pk=synced.pk).update(sync_status=SyncStatusChoices.SUCCESS)
+
+        self.assertEqual(command.upsert_courses(tenant, [make_course_list_entry("c1", "Renamed", "de"),
+                                                         make_course_list_entry("c3", "Third")], languages), 2)
+
+        self.assertEqual(Course.objects.count(), 3)
+        course = Course.objects.get(ext_id="c1")
+        self.assertEqual((course.pk, course.title, course.language, course.sync_status),
+                         (synced.pk, "Renamed", german, SyncStatusChoices.SUCCESS))
+        self.assertEqual(Course.objects.get(ext_id="c2").language, english)
+        self.assertEqual(Course.objects.get(ext_id="c3").sync_status, SyncStatusChoices.SKELETON)
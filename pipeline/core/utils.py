@@ -1,3 +1,11 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+
 def get_initials(user):
     initials = ""
     if user.first_name:
@@ -10,3 +18,94 @@ def get_initials(user):
         initials += user.username[0].upper()
 
     return initials
+
+
+def bounded_thread_map(fn, iterable, max_workers):
+    """
+    Maps fn over iterable in a pool of at most max_workers threads and yields the results in input order.
+
+    Every worker thread gets its own database connection from django, so the connections are closed after
+    each call instead of leaking them with CONN_MAX_AGE=None. With max_workers <= 1 fn is called in the current
+    thread, so callers that already run in a pool do not open a nested one.
+    """
+
+    if max_workers <= 1:
+        yield from map(fn, iterable)
+        return
+
+    def call_and_close_connections(item):
+        try:
+            return fn(item)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(call_and_close_connections, iterable)
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache. Entries expire after `ttl` seconds, beyond `maxsize` entries the least recently
+    used ones are evicted. With `getsizeof`, `maxsize` bounds the summed size of the values instead of their number.
+    Hits and misses are counted.
+    """
+
+    def __init__(self, maxsize, ttl, timer=time.monotonic, getsizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.getsizeof = getsizeof or (lambda value: 1)
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.currsize -= entry[2]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] <= self.timer():
+                self._pop(key)
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        size = self.getsizeof(value)
+
+        with self._lock:
+            self._pop(key)
+
+            # Would evict everything else and still not fit
+            if size > self.maxsize:
+                return
+
+            self._entries[key] = (self.timer() + self.ttl, value, size)
+            self.currsize += size
+
+            while self.currsize > self.maxsize:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.currsize = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
@@ -1,19 +1,24 @@
 import html
 import html
-import io
-import math
 from io import BytesIO
 from pprint import pprint
 from uuid import uuid4
 
 import boto3
-import webvtt
-from django.conf import settings
+from botocore.config import Config
+from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
 from django.db.models import QuerySet
-from django.utils import timezone
 from django_celery_beat.models import PeriodicTask
 
-from subtitles.models import Subtitle, IsoLanguage, SubtitleFile, Video, ServiceProviderUse
+from core.rate_limit import Provider
+from core.resilience import DEFAULT_TIMEOUT, call_provider
+from subtitles.cues import Cue, write_vtt
+from subtitles.models import Subtitle, IsoLanguage, SubtitleFile, Video, ServiceProviderUse, TranslationMemory
+from subtitles.models.translation_memory import normalize_segment
+from subtitles.retranslation import get_previous_translation, is_unchanged, plan_retranslation, splice
+from subtitles.segmentation import MAX_LINE_LENGTH, resegment
+
+AWS_TRANSIENT_EXCEPTIONS = (BotoConnectionError, HTTPClientError)
 
 '''
 VTT -> Webcaptions -> <span> delimited html and vice-versa inspired by 
@@ -53,102 +58,97 @@ class AwsTranslationService:
                                      region_name=self.tenant.get_secret('AWS_REGION'),
                                      aws_access_key_id=self.tenant.get_secret('AWS_TRANSLATE_KEY_ID'),
                                      aws_secret_access_key=self.tenant.get_secret('AWS_TRANSLATE_ACCESS_KEY'),
+                                     config=Config(connect_timeout=DEFAULT_TIMEOUT[0],
+                                                   read_timeout=DEFAULT_TIMEOUT[1]),
                                      )
 
         self.aws_translate = aws_translate
         return aws_translate
 
-    def format_timeVtt_to_seconds(self, timeHMSf):
-        hours, minutes, seconds = (timeHMSf.split(":"))[-3:]
-        hours = int(hours)
-        minutes = int(minutes)
-        seconds = float(seconds)
-        timeSeconds = float(3600 * hours + 60 * minutes + seconds)
-        return str(timeSeconds)
-
-    def format_seconds_to_timeVtt(self, time_seconds):
-        ONE_HOUR = 60 * 60
-        ONE_MINUTE = 60
-        hours = math.floor(time_seconds / ONE_HOUR)
-        remainder = time_seconds - (hours * ONE_HOUR)
-        minutes = math.floor(remainder / 60)
-        remainder = remainder - (minutes * ONE_MINUTE)
-        seconds = math.floor(remainder)
-        remainder = remainder - seconds
-        millis = remainder
-        return str(hours).zfill(2) + ':' + str(minutes).zfill(2) + ':' + str(seconds).zfill(2) + '.' + str(
-            math.floor(millis * 1000)).zfill(3)
-
-    def convert_vtt_to_webcaptions(self, vtt_io):
-        captions = []
-
-        for vttcaption in webvtt.read_buffer(vtt_io):
-            caption = {
-                "start": self.format_timeVtt_to_seconds(vttcaption.start),
-                "end": self.format_timeVtt_to_seconds(vttcaption.end),
-                "caption": vttcaption.text
-            }
-            captions.append(caption)
-
-        return captions
-
-    def convert_webcaptions_to_vtt(self, captions):
-        vtt = 'WEBVTT\n\n'
-
-        for i, caption in enumerate(captions, start=1):
-            vtt += f"{i}\n"
-            vtt += self.format_seconds_to_timeVtt(float(caption["start"])) + ' --> ' + self.format_seconds_to_timeVtt(
-                float(caption["end"])) + '\n'
-            vtt += caption["caption"] + '\n\n'
-
-        return vtt.rstrip()
-
-    def convert_webcaptions_to_html(self, captions):
-        marker = "<span>"
-        inputEntries = map(lambda c: c["caption"], captions)
-        inputDelimited = marker.join(inputEntries)
-
-        return inputDelimited
-
-    def DelimitedToWebCaptions(self, sourceWebCaptions, delimitedCaptions, delimiter, maxCaptionLineLength):
-
-        delimitedCaptions = html.unescape(delimitedCaptions)
-
-        entries = delimitedCaptions.split(delimiter)
+    def split_delimited(self, delimitedCaptions, delimiter):
+        return [html.unescape(entry) for entry in delimitedCaptions.split(delimiter)]
 
+    def TranslationsToWebCaptions(self, sourceWebCaptions, translations, maxCaptionLineLength):
         outputWebCaptions = []
-        for i, c in enumerate(sourceWebCaptions):
-            caption = {}
-            caption["start"] = c["start"]
-            caption["end"] = c["end"]
-            caption["caption"] = entries[i]
-            caption["sourceCaption"] = c["caption"]
-            outputWebCaptions.append(caption)
+        for c, translation in zip(sourceWebCaptions, translations):
+            outputWebCaptions.append(Cue(c.start, c.end, translation))
 
-        return outputWebCaptions
+        # Translations are often longer than the source, so the cues are rewrapped and split or merged
+        return resegment(outputWebCaptions, max_line_length=maxCaptionLineLength)
 
-    def fetch_translated_subtitle(self, source_subtitle_file_id, job_folder, subtitle_filename, language):
+    def fetch_translated_subtitle(self, source_subtitle_file_id, job_folder, subtitle_filename, language,
+                                  sent_cues=None, previous_file_ids=None):
+        """
+        @param sent_cues: Indices of the source cues that were sent, the other captions are taken from the
+            translation memory. `None` for jobs that were started with all captions.
+        @param previous_file_ids: Ids of the source version and of the translation the job builds on, only the
+            changed cues were translated then
+        """
         s3_key = f"{job_folder}{language}.{subtitle_filename}"
         s3_object = self.s3.get_object(Bucket=self.s3_bucket, Key=s3_key)
 
-        source_subtitle_file = SubtitleFile.objects.get(pk=source_subtitle_file_id)
+        source_subtitle_file = SubtitleFile.objects.select_related('subtitle').get(pk=source_subtitle_file_id)
 
         translated_html_content = s3_object['Body'].read().decode('utf-8')
+        entries = self.split_delimited(translated_html_content, "<span>")
+
+        # The source subtitle may have been edited since, so this version may only be stored as a delta
+        webcaptions_source = source_subtitle_file.cues
+
+        if sent_cues is None:
+            return write_vtt(self.TranslationsToWebCaptions(webcaptions_source, entries, MAX_LINE_LENGTH),
+                             renumber=True)
+
+        source_language = source_subtitle_file.subtitle.language_id
+        segments = [normalize_segment(c.text) for c in webcaptions_source]
+        missing = [segments[i] for i in sent_cues]
+        if len(entries) != len(missing):
+            raise ValueError(f"AWS returned {len(entries)} captions for {len(missing)} captions")
+
+        new_translations = dict(zip(missing, entries))
+        TranslationMemory.objects.store(self.tenant, ServiceProviderUse.ServiceProvider.AWS_TRANSLATION,
+                                        source_language, language, new_translations)
+
+        # The same plan as when the job was started, both versions are fixed
+        previous_files = SubtitleFile.objects.in_bulk(previous_file_ids or [])
+        if previous_file_ids and len(previous_files) == 2:
+            previous_source, previous_translation = (previous_files[pk] for pk in previous_file_ids)
+            plan = plan_retranslation(previous_source.cues, webcaptions_source, previous_translation.cues)
+            needed = [segment for segment, send in zip(segments, plan.send.tolist()) if send]
+        else:
+            plan, previous_translation, needed = None, None, segments
+
+        # The hits were counted when the job was started
+        memory = TranslationMemory.objects.lookup(
+            self.tenant, ServiceProviderUse.ServiceProvider.AWS_TRANSLATION, source_language, language,
+            (segment for segment in needed if segment not in new_translations), count_hits=False)
+        memory.update(new_translations)
+
+        webcaptions = self.build_webcaptions(webcaptions_source, [memory.get(segment, "") for segment in needed],
+                                             previous_translation, plan)
+        vtt_content = write_vtt(webcaptions, renumber=True)
 
-        with open(source_subtitle_file.file.path, "r", encoding='utf-8') as f:
-            webcaptions_source = self.convert_vtt_to_webcaptions(f)
+        return vtt_content
 
-        webcaptions = self.DelimitedToWebCaptions(webcaptions_source, translated_html_content, "<span>", 15)
-        vtt_content = self.convert_webcaptions_to_vtt(webcaptions)
+    def build_webcaptions(self, sourceWebCaptions, translations, previous_translation=None, plan=None):
+        """
+        @param translations: Translations of all captions, or only of those in `plan.send` to splice them into
+            `previous_translation`
+        """
+        if plan is None:
+            return self.TranslationsToWebCaptions(sourceWebCaptions, translations, MAX_LINE_LENGTH)
 
-        return vtt_content
+        return splice(sourceWebCaptions, previous_translation.cues, plan, translations, MAX_LINE_LENGTH)
 
     def fetch_translation_jobs(self, video_id):
         video = Video.objects.get(pk=video_id)
 
-        a = self.aws_translate.list_text_translation_jobs(Filter={
-            'JobName': video.workflow_data['u']
-        })
+        a = call_provider(
+            self.tenant, Provider.AWS_TRANSLATE, self.aws_translate.list_text_translation_jobs,
+            idempotent=True,
+            transient_exceptions=AWS_TRANSIENT_EXCEPTIONS,
+            Filter={'JobName': video.workflow_data['u']},
+        )
 
         for completed_job in filter(lambda j: j['JobStatus'] == "COMPLETED", a['TextTranslationJobPropertiesList']):
             pprint(completed_job)
@@ -157,7 +157,10 @@ class AwsTranslationService:
                 source_subtitle_file_id=video.workflow_data['subtitle_file_id'],
                 job_folder=completed_job['OutputDataConfig']['S3Uri'].replace(f"s3://{self.s3_bucket}/", ""),
                 subtitle_filename=video.workflow_data['s3_subtitle_filename'],
-                language=completed_job['TargetLanguageCodes'][0]
+                language=completed_job['TargetLanguageCodes'][0],
+                sent_cues=video.workflow_data.get('sent_cues', {}).get(completed_job['TargetLanguageCodes'][0]),
+                previous_file_ids=video.workflow_data.get('previous_file_ids', {}).get(
+                    completed_job['TargetLanguageCodes'][0]),
             )
 
             language = IsoLanguage.objects.get(iso_code=completed_job['TargetLanguageCodes'][0])
@@ -165,7 +168,8 @@ class AwsTranslationService:
             self.add_subtitle_content_to_video(
                 video=video,
                 language=language,
-                vtt_content=cont
+                vtt_content=cont,
+                source_file_id=video.workflow_data['subtitle_file_id'],
             )
 
             try:
@@ -181,7 +185,7 @@ class AwsTranslationService:
 
         video.save()
 
-    def add_subtitle_content_to_video(self, video, language, vtt_content):
+    def add_subtitle_content_to_video(self, video, language, vtt_content, source_file_id=None):
         new_subtitle = Subtitle.objects.filter(video=video, language=language).order_by('-pk').first()
         if not new_subtitle:
             new_subtitle = Subtitle(
@@ -211,30 +215,17 @@ class AwsTranslationService:
         #     }
         # )
 
-        new_subtitle_file = SubtitleFile(
-            subtitle=new_subtitle, date=timezone.now(), user_id=1, tenant=video.tenant,
-        )
-
-        new_subtitle_file.file.name = (
-                settings.MEDIA_ROOT
-                + "subtitles/"
-                + str(new_subtitle.id)
-                + "_"
-                + str(new_subtitle.language)
-                + "_"
-                + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                + ".vtt"
+        new_subtitle_file = SubtitleFile.objects.create_version(
+            new_subtitle, vtt_content, user_id=1, tenant=video.tenant, source_file_id=source_file_id,
         )
-        # Write content to a file
-        file = io.open(new_subtitle_file.file.path, "w", encoding="utf-8")
-        file.write(vtt_content)
-        file.close()
-
-        new_subtitle_file.save()
 
         return new_subtitle, new_subtitle_file
 
-    def translate(self, source_subtitle: Subtitle, target_languages, initiator=None):
+    def translate(self, source_subtitle: Subtitle, target_languages, initiator=None, incremental=True):
+        """
+        @param incremental: Only translate the cues that changed since the existing translation was made and keep
+            the rest of it
+        """
         assert isinstance(target_languages, (list, QuerySet))
         assert all(isinstance(l, IsoLanguage) for l in target_languages)
 
@@ -243,65 +234,122 @@ class AwsTranslationService:
 
         print("Start translation to", target_languages)
 
-        with open(source_subtitle.latest_subtitle_file, "r", encoding='utf-8') as f:
-            webcaptions = self.convert_vtt_to_webcaptions(f)
-
-        html_delimited = self.convert_webcaptions_to_html(webcaptions)
-        html_delimited_io = BytesIO(html_delimited.encode('utf-8'))
-        count_source_characters = sum(len(w['caption']) for w in webcaptions)
-
-        r = self.s3.upload_fileobj(html_delimited_io, Bucket=self.s3_bucket,
-                                   Key=f"input-{u}/{s3_subtitle_filename}")
+        webcaptions = source_subtitle.latest_file.cues
+        source_language = source_subtitle.language.iso_code
+        segments = [normalize_segment(c.text) for c in webcaptions]
 
         translation_info = {
             's3_subtitle_filename': s3_subtitle_filename,
             'target_languages': [l.iso_code for l in target_languages],
             'u': str(u),
-            'subtitle_file_id': source_subtitle.subtitlefile_set.order_by('-date').first().pk,
+            'subtitle_file_id': source_subtitle.latest_file_id,
             'job_ids': {},
             'waiting_job_ids': [],
             'service_provider_use': {},
+            'sent_cues': {},
+            'previous_file_ids': {},
         }
 
         # We need to loop, since TargetLanguageCodes is a list, but aws supports only a single target language.
         for lang in target_languages:
-            res = self.aws_translate.start_text_translation_job(
+            previous = get_previous_translation(source_subtitle, lang) if incremental else None
+            if previous:
+                previous_source, previous_translation = previous
+                plan = plan_retranslation(previous_source.cues, webcaptions, previous_translation.cues)
+                send = plan.send.tolist()
+            else:
+                plan, previous_translation, send = None, None, [True] * len(segments)
+            needed = [segment for segment, needs_translation in zip(segments, send) if needs_translation]
+
+            translations = TranslationMemory.objects.lookup(
+                self.tenant, ServiceProviderUse.ServiceProvider.AWS_TRANSLATION, source_language, lang.iso_code,
+                needed)
+            # Empty captions are not translated, so they count neither as hits nor as misses
+            translatable = [segment for segment in needed if segment]
+            memory_hits = sum(1 for segment in translatable if segment in translations)
+
+            # Only the captions missing in the translation memory are sent, repeated ones once
+            sent_cues = {}
+            for i, (segment, needs_translation) in enumerate(zip(segments, send)):
+                if needs_translation and segment and segment not in translations:
+                    sent_cues.setdefault(segment, i)
+
+            su = ServiceProviderUse(
+                tenant=source_subtitle.tenant,
+                video=source_subtitle.video,
+                service_provider=ServiceProviderUse.ServiceProvider.AWS_TRANSLATION,
+                initiated_by=initiator,
+            )
+
+            su.data = {
+                'AWS_WORKFLOW': "AWS_STANDALONE_v1",
+                'source_language': source_language,
+                'target_language': lang.iso_code,
+                'characters': sum(len(segment) for segment in sent_cues),
+                'cues': len(segments),
+                'translated_cues': len(needed),
+                'memory_hits': memory_hits,
+                'memory_misses': len(translatable) - memory_hits,
+                'hit_rate': round(memory_hits / len(translatable), 4) if translatable else 0.0,
+            }
+
+            if not sent_cues:
+                # Everything is served from the translation memory, so no job is started
+                su.save()
+                translation_info['service_provider_use'][lang.iso_code] = {
+                    'id': su.pk,
+                }
+
+                webcaptions_translated = self.build_webcaptions(
+                    webcaptions, [translations.get(segment, "") for segment in needed], previous_translation, plan)
+                if previous_translation and is_unchanged(webcaptions_translated, previous_translation.cues):
+                    # The translation may have been reviewed since, it keeps its status
+                    continue
+
+                self.add_subtitle_content_to_video(
+                    video=source_subtitle.video,
+                    language=lang,
+                    vtt_content=write_vtt(webcaptions_translated, renumber=True),
+                    source_file_id=source_subtitle.latest_file_id,
+                )
+                continue
+
+            html_delimited_io = BytesIO("<span>".join(sent_cues).encode('utf-8'))
+            self.s3.upload_fileobj(html_delimited_io, Bucket=self.s3_bucket,
+                                   Key=f"input-{u}-{lang.iso_code}/{s3_subtitle_filename}")
+
+            # The ClientToken makes the call idempotent, so it is safe to retry
+            res = call_provider(
+                self.tenant, Provider.AWS_TRANSLATE, self.aws_translate.start_text_translation_job,
+                idempotent=True,
+                transient_exceptions=AWS_TRANSIENT_EXCEPTIONS,
                 JobName=f"{u}-{lang.iso_code}",
                 ClientToken=f"{u}-{lang.iso_code}",
                 InputDataConfig={
-                    'S3Uri': f's3://{self.s3_bucket}/input-{u}/',
+                    # Each language has its own input, since the translation memory leaves different captions
+                    'S3Uri': f's3://{self.s3_bucket}/input-{u}-{lang.iso_code}/',
                     'ContentType': 'text/html'
                 },
                 OutputDataConfig={
                     'S3Uri': f's3://{self.s3_bucket}/output-{u}/'
                 },
                 DataAccessRoleArn=self.tenant.get_secret('AWS_TRANSLATE_ROLE_ARN'),
-                SourceLanguageCode=source_subtitle.language.iso_code,
+                SourceLanguageCode=source_language,
                 TargetLanguageCodes=[lang.iso_code],
             )
 
             translation_info['job_ids'][res['JobId']] = lang.iso_code
             translation_info['waiting_job_ids'].append(res['JobId'])
+            translation_info['sent_cues'][lang.iso_code] = list(sent_cues.values())
+            if previous:
+                translation_info['previous_file_ids'][lang.iso_code] = [previous_source.pk, previous_translation.pk]
 
-            su = ServiceProviderUse(
-                tenant=source_subtitle.tenant,
-                video=source_subtitle.video,
-                service_provider=ServiceProviderUse.ServiceProvider.AWS_TRANSLATION,
-                initiated_by=initiator,
-            )
-
-            su.data = {
-                'JobId': res['JobId'],
-                'AWS_WORKFLOW': "AWS_STANDALONE_v1",
-                'source_language': source_subtitle.language.iso_code,
-                'target_language': lang.iso_code,
-                'characters': count_source_characters,
-            }
+            su.data['JobId'] = res['JobId']
             su.save()
             translation_info['service_provider_use'][res['JobId']] = {
                 'id': su.pk,
             }
 
         source_subtitle.video.workflow_data = translation_info
-        source_subtitle.video.workflow_status = "AWS_INITIATED"
+        source_subtitle.video.workflow_status = "AWS_INITIATED" if translation_info['waiting_job_ids'] else None
         source_subtitle.video.save()
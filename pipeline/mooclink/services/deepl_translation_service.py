@@ -1,15 +1,15 @@
 import html
-import io
-import math
-from io import BytesIO
 
 import requests
-import webvtt
-from django.conf import settings
 from django.db.models import QuerySet
-from django.utils import timezone
 
-from subtitles.models import Subtitle, IsoLanguage, SubtitleFile, ServiceProviderUse
+from core.rate_limit import Provider
+from core.resilience import DEFAULT_TIMEOUT, call_provider
+from subtitles.cues import Cue, write_vtt
+from subtitles.models import Subtitle, IsoLanguage, SubtitleFile, ServiceProviderUse, TranslationMemory
+from subtitles.models.translation_memory import normalize_segment
+from subtitles.retranslation import get_previous_translation, is_unchanged, plan_retranslation, splice
+from subtitles.segmentation import MAX_LINE_LENGTH, resegment
 
 '''
 VTT -> Webcaptions -> <span> delimited html and vice-versa inspired by 
@@ -31,76 +31,28 @@ class DeeplTranslationService:
     def create_session(self):
         self.session = requests.Session()
 
-    def format_timeVtt_to_seconds(self, timeHMSf):
-        hours, minutes, seconds = (timeHMSf.split(":"))[-3:]
-        hours = int(hours)
-        minutes = int(minutes)
-        seconds = float(seconds)
-        timeSeconds = float(3600 * hours + 60 * minutes + seconds)
-        return str(timeSeconds)
-
-    def format_seconds_to_timeVtt(self, time_seconds):
-        ONE_HOUR = 60 * 60
-        ONE_MINUTE = 60
-        hours = math.floor(time_seconds / ONE_HOUR)
-        remainder = time_seconds - (hours * ONE_HOUR)
-        minutes = math.floor(remainder / 60)
-        remainder = remainder - (minutes * ONE_MINUTE)
-        seconds = math.floor(remainder)
-        remainder = remainder - seconds
-        millis = remainder
-        return str(hours).zfill(2) + ':' + str(minutes).zfill(2) + ':' + str(seconds).zfill(2) + '.' + str(
-            math.floor(millis * 1000)).zfill(3)
-
-    def convert_vtt_to_webcaptions(self, vtt_io):
-        captions = []
-
-        for vttcaption in webvtt.read_buffer(vtt_io):
-            caption = {
-                "start": self.format_timeVtt_to_seconds(vttcaption.start),
-                "end": self.format_timeVtt_to_seconds(vttcaption.end),
-                "caption": vttcaption.text
-            }
-            captions.append(caption)
-
-        return captions
-
-    def convert_webcaptions_to_vtt(self, captions):
-        vtt = 'WEBVTT\n\n'
-
-        for i, caption in enumerate(captions, start=1):
-            vtt += f"{i}\n"
-            vtt += self.format_seconds_to_timeVtt(float(caption["start"])) + ' --> ' + self.format_seconds_to_timeVtt(
-                float(caption["end"])) + '\n'
-            vtt += caption["caption"] + '\n\n'
-
-        return vtt.rstrip()
+    def split_delimited(self, delimitedCaptions, delimiter):
+        return [html.unescape(entry) for entry in delimitedCaptions.split(delimiter)]
 
-    def convert_webcaptions_to_html(self, captions):
-        marker = "<span>"
-        inputEntries = map(lambda c: c["caption"], captions)
-        inputDelimited = marker.join(inputEntries)
-
-        return inputDelimited
-
-    def DelimitedToWebCaptions(self, sourceWebCaptions, delimitedCaptions, delimiter, maxCaptionLineLength):
+    def TranslationsToWebCaptions(self, sourceWebCaptions, translations, maxCaptionLineLength):
+        outputWebCaptions = []
+        for c, translation in zip(sourceWebCaptions, translations):
+            outputWebCaptions.append(Cue(c.start, c.end, translation))
 
-        delimitedCaptions = html.unescape(delimitedCaptions)
+        # Translations are often longer than the source, so the cues are rewrapped and split or merged
+        return resegment(outputWebCaptions, max_line_length=maxCaptionLineLength)
 
-        entries = delimitedCaptions.split(delimiter)
+    def build_webcaptions(self, sourceWebCaptions, translations, previous_translation=None, plan=None):
+        """
+        @param translations: Translations of all captions, or only of those in `plan.send` to splice them into
+            `previous_translation`
+        """
+        if plan is None:
+            return self.TranslationsToWebCaptions(sourceWebCaptions, translations, MAX_LINE_LENGTH)
 
-        outputWebCaptions = []
-        for i, c in enumerate(sourceWebCaptions):
-            caption = {}
-            caption["start"] = c["start"]
-            caption["end"] = c["end"]
-            caption["caption"] = entries[i]
-            caption["sourceCaption"] = c["caption"]
-            outputWebCaptions.append(caption)
+        return splice(sourceWebCaptions, previous_translation.cues, plan, translations, MAX_LINE_LENGTH)
 
-        return outputWebCaptions
-
-    def add_subtitle_content_to_video(self, video, language, vtt_content):
+    def add_subtitle_content_to_video(self, video, language, vtt_content, source_file_id=None):
         new_subtitle = Subtitle.objects.filter(video=video, language=language).order_by('-pk').first()
         if not new_subtitle:
             new_subtitle = Subtitle(
@@ -130,66 +82,81 @@ class DeeplTranslationService:
         #     }
         # )
 
-        new_subtitle_file = SubtitleFile(
-            subtitle=new_subtitle, date=timezone.now(), user_id=1, tenant=video.tenant,
-        )
-
-        new_subtitle_file.file.name = (
-                settings.MEDIA_ROOT
-                + "subtitles/"
-                + str(new_subtitle.id)
-                + "_"
-                + str(new_subtitle.language)
-                + "_"
-                + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                + ".vtt"
+        new_subtitle_file = SubtitleFile.objects.create_version(
+            new_subtitle, vtt_content, user_id=1, tenant=video.tenant, source_file_id=source_file_id,
         )
-        # Write content to a file
-        file = io.open(new_subtitle_file.file.path, "w", encoding="utf-8")
-        file.write(vtt_content)
-        file.close()
-
-        new_subtitle_file.save()
 
         return new_subtitle, new_subtitle_file
 
-    def translate(self, source_subtitle: Subtitle, target_languages, initiator=None):
+    def translate(self, source_subtitle: Subtitle, target_languages, initiator=None, incremental=True):
+        """
+        @param incremental: Only translate the cues that changed since the existing translation was made and keep
+            the rest of it
+        """
         assert isinstance(target_languages, (list, QuerySet))
         assert all(isinstance(l, IsoLanguage) for l in target_languages)
 
         video = source_subtitle.video
 
-        with open(source_subtitle.latest_subtitle_file, "r", encoding='utf-8') as f:
-            webcaptions_source = self.convert_vtt_to_webcaptions(f)
-
-        html_delimited = self.convert_webcaptions_to_html(webcaptions_source)
-        count_source_characters = sum(len(w['caption']) for w in webcaptions_source)
+        webcaptions_source = source_subtitle.latest_file.cues
+        source_language = source_subtitle.language.iso_code
+        segments = [normalize_segment(c.text) for c in webcaptions_source]
 
         translation_info = {
             'target_languages': [l.iso_code for l in target_languages],
-            'subtitle_file_id': source_subtitle.subtitlefile_set.order_by('-date').first().pk,
+            'subtitle_file_id': source_subtitle.latest_file_id,
             'job_ids': {},
             'waiting_job_ids': [],
             'service_provider_use': {},
         }
 
         for lang in target_languages:
-            res = self.session.post(
-                self.base_url,
-                headers={
-                    "Authorization": f"DeepL-Auth-Key {self.auth_key}",
-                },
-                data={
-                    "text": html_delimited,
-                    "source_lang": source_subtitle.language.iso_code,
-                    "target_lang": lang.iso_code,
-                    "tag_handling": "xml",
-                }
-            )
-
-            res.raise_for_status()
-
-            j = res.json()
+            previous = get_previous_translation(source_subtitle, lang) if incremental else None
+            if previous:
+                previous_source, previous_translation = previous
+                plan = plan_retranslation(previous_source.cues, webcaptions_source, previous_translation.cues)
+                needed = [segment for segment, send in zip(segments, plan.send.tolist()) if send]
+            else:
+                plan, previous_translation, needed = None, None, segments
+
+            translations = TranslationMemory.objects.lookup(self.tenant, ServiceProviderUse.ServiceProvider.DEEPL,
+                                                            source_language, lang.iso_code, needed)
+            # Empty captions are not translated, so they count neither as hits nor as misses
+            translatable = [segment for segment in needed if segment]
+            memory_hits = sum(1 for segment in translatable if segment in translations)
+
+            # Only the captions missing in the translation memory are sent, repeated ones once
+            missing = list(dict.fromkeys(segment for segment in needed if segment and segment not in translations))
+
+            if missing:
+                res = call_provider(
+                    self.tenant, Provider.DEEPL, self.session.post,
+                    self.base_url,
+                    headers={
+                        "Authorization": f"DeepL-Auth-Key {self.auth_key}",
+                    },
+                    data={
+                        "text": "<span>".join(missing),
+                        "source_lang": source_language,
+                        "target_lang": lang.iso_code,
+                        "tag_handling": "xml",
+                    },
+                    timeout=DEFAULT_TIMEOUT,
+                )
+
+                res.raise_for_status()
+
+                j = res.json()
+
+                delimited_translated_text = j["translations"][0]["text"].replace("</span>", "")
+                entries = self.split_delimited(delimited_translated_text, "<span>")
+                if len(entries) != len(missing):
+                    raise ValueError(f"DeepL returned {len(entries)} captions for {len(missing)} captions")
+
+                new_translations = dict(zip(missing, entries))
+                TranslationMemory.objects.store(self.tenant, ServiceProviderUse.ServiceProvider.DEEPL,
+                                                source_language, lang.iso_code, new_translations)
+                translations.update(new_translations)
 
             su = ServiceProviderUse(
                 tenant=source_subtitle.tenant,
@@ -200,22 +167,31 @@ class DeeplTranslationService:
 
             su.data = {
                 'DEEPL_WORKFLOW': "DEEPL-STANDALONE_v1",
-                'source_language': source_subtitle.language.iso_code,
+                'source_language': source_language,
                 'target_language': lang.iso_code,
-                'characters': count_source_characters,
+                'characters': sum(len(segment) for segment in missing),
+                'cues': len(segments),
+                'translated_cues': len(needed),
+                'memory_hits': memory_hits,
+                'memory_misses': len(translatable) - memory_hits,
+                'hit_rate': round(memory_hits / len(translatable), 4) if translatable else 0.0,
             }
             su.save()
             translation_info['service_provider_use'][lang.iso_code] = {
                 'id': su.pk,
             }
 
-            delimited_translated_text = j["translations"][0]["text"].replace("</span>", "")
+            webcaptions = self.build_webcaptions(
+                webcaptions_source, [translations.get(segment, "") for segment in needed], previous_translation, plan)
+            if not missing and previous_translation and is_unchanged(webcaptions, previous_translation.cues):
+                # The translation may have been reviewed since, it keeps its status
+                continue
 
-            webcaptions = self.DelimitedToWebCaptions(webcaptions_source, delimited_translated_text, "<span>", 15)
-            vtt_content = self.convert_webcaptions_to_vtt(webcaptions)
+            vtt_content = write_vtt(webcaptions, renumber=True)
 
             self.add_subtitle_content_to_video(
                 video=video,
                 language=lang,
-                vtt_content=vtt_content
+                vtt_content=vtt_content,
+                source_file_id=source_subtitle.latest_file_id,
             )
@@ -1,7 +1,8 @@
 from django.urls import path
 
 from mooclink.views.course import CourseOverView, CourseSettingsView, CourseAddLanguageView, RemoveUserAssignment
-from mooclink.views.couse_video_bulkaction import CourseBulkActionConfirmation, CourseDoBulkAction, CourseSubscribe
+from mooclink.views.couse_video_bulkaction import CourseBulkActionConfirmation, CourseDoBulkAction, CourseSubscribe, \
+    CourseBulkPublishJobView
 from mooclink.views.main import MainView, MainViewCourse, RedirectByItemId, JobAdminView, JobAdminResetView
 from mooclink.views.service_provider_usage import ServiceProviderUsage, TodoView, ServiceProviderUsageCSV, \
     ServiceProviderUsageQuarter
@@ -9,6 +10,7 @@ from mooclink.views.subtitle_action import SubtitleToAction
 from mooclink.views.video import SaveTranscriptVersion, CancelWorkflowView
 from mooclink.views.video import SetWorkflowStatusView
 from mooclink.views.video import VideoDetailView, AddCommentToVideoView, FetchFromXikolo
+from mooclink.views.webhook import XikoloWebhookView
 
 urlpatterns = [
     path('<tenant_slug>/courses/<course_id>/videos/<video_id>/', MainView.as_view(), name='mooclink.main'),
@@ -17,6 +19,7 @@ urlpatterns = [
     path('<tenant_slug>/courses/<course_id>/bulk/confirm/', CourseBulkActionConfirmation.as_view(), name='mooclink.course.bulk.confirmation'),
     path('<tenant_slug>/courses/<course_id>/subscribe/', CourseSubscribe.as_view(), name='mooclink.course.subscribe'),
     path('<tenant_slug>/courses/<course_id>/bulk/do/', CourseDoBulkAction.as_view(), name='mooclink.course.bulk.do'),
+    path('<tenant_slug>/courses/<course_id>/bulk/publish/<int:job_id>/', CourseBulkPublishJobView.as_view(), name='mooclink.course.bulk.publish_job'),
     path('<tenant_slug>/courses/<course_id>/settings/', CourseSettingsView.as_view(), name='mooclink.course.settings'),
     path('<tenant_slug>/courses/<course_id>/add_language/', CourseAddLanguageView.as_view(), name='mooclink.course.add_language'),
     path('<tenant_slug>/courses/<course_id>/user_assignments/remove/', RemoveUserAssignment.as_view(), name='mooclink.course.remove_assignment'),
@@ -29,6 +32,8 @@ urlpatterns = [
     path('<tenant_slug>/courses/<course_id>/videos/<video_id>/do_action/', SubtitleToAction.as_view(), name='mooclink.video.do_action'),
     path('<tenant_slug>/videos/<video_id>/workflow/cancel/', CancelWorkflowView.as_view(), name='mooclink.video.workflow.cancel'),
 
+    path('<tenant_slug>/webhooks/xikolo/', XikoloWebhookView.as_view(), name='mooclink.webhooks.xikolo'),
+
     path('billing/', ServiceProviderUsageQuarter.as_view(), name='mooclink.service_provider_use.index'),
     path('billing/<tenant_slug>/details/', ServiceProviderUsage.as_view(), name='mooclink.service_provider_use.details'),
     path('billing/getcsv/', ServiceProviderUsageCSV.as_view(), name='mooclink.service_provider_use.getcsv'),
@@ -1,18 +1,17 @@
-import io
 import itertools
 import zipfile
 from datetime import datetime, timedelta
 from operator import itemgetter
-from zipfile import ZipFile
 
+import celery
 from django import views
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
@@ -23,8 +22,9 @@ from core.models import Tenant, TranspipeUser
 from mooclink.services.aws_translation_service import AwsTranslationService
 from mooclink.services.deepl_translation_service import DeeplTranslationService
 from mooclink.services.periodic_task_service import PeriodicTaskService
-from subtitles.api.xikolo_api import publish_subtitle_to_xikolo
-from subtitles.models import Course, Video, IsoLanguage, Subtitle, SubtitleAssignment, AssignedLanguage
+from subtitles.converters import SUBTITLE_FORMATS, iter_zip
+from subtitles.models import Course, Video, IsoLanguage, Subtitle, SubtitleAssignment, AssignedLanguage, \
+    BulkPublishJob
 from subtitles.models.translation_service import TranslationService
 
 
@@ -118,13 +118,27 @@ class CourseBulkActionConfirmation(PermissionRequiredMixin, LoginRequiredMixin,
             'course': course,
             'action': action,
             'tenant': tenant,
-            'user_to_assign': user_to_assign
+            'user_to_assign': user_to_assign,
+            'subtitle_formats': SUBTITLE_FORMATS,
         })
 
 
 class CourseDoBulkAction(PermissionRequiredMixin, LoginRequiredMixin, views.View):
     permission_required = ('subtitles.can_do_bulk_operations')
 
+    @staticmethod
+    def iter_subtitle(subtitle, subtitle_format):
+        """
+        Chunks of the latest version of the subtitle in the format, VTT is exported as it is stored.
+        """
+        if not subtitle:
+            return iter(())
+
+        if subtitle_format.extension == 'vtt':
+            return iter((subtitle.latest_content,))
+
+        return subtitle_format.convert(subtitle.iter_latest_cues(), subtitle.language.iso_code)
+
     def post(self, request, course_id, tenant_slug=None):
         tenant = Tenant.objects.get(slug=tenant_slug)
 
@@ -177,30 +191,26 @@ class CourseDoBulkAction(PermissionRequiredMixin, LoginRequiredMixin, views.View
             if not request.user.has_perm('subtitles.bulk_publish'):
                 raise PermissionDenied
 
-            for video in videos_to_transcript:
-                subtitle = video.current_transcript
-                res = None
-                if subtitle:
-                    if not settings.DEBUG or tenant.is_staging:
-                        res = publish_subtitle_to_xikolo(request, subtitle_id=subtitle.id)
-                    else:
-                        messages.info(request, "Bulk publishing to non-staging xikolo is disabled in debug-mode")
-
-                    if res is True:
-                        number_of_affected += 1
+            subtitles_to_publish = [video.current_transcript for video in videos_to_transcript]
+            subtitles_to_publish += [video.subtitle_set.filter(language=language).first()
+                                     for (language, video) in videos_to_translate]
+            subtitle_ids = [subtitle.pk for subtitle in subtitles_to_publish if subtitle]
 
-            for (language, video) in videos_to_translate:
-                subtitle = video.subtitle_set.filter(language=language).first()
-                res = None
+            if settings.DEBUG and not tenant.is_staging:
+                messages.info(request, "Bulk publishing to non-staging xikolo is disabled in debug-mode")
+            elif subtitle_ids:
+                job = BulkPublishJob.objects.create(
+                    tenant=tenant,
+                    course=course,
+                    initiated_by=request.user,
+                    subtitle_ids=subtitle_ids,
+                )
+                celery.current_app.send_task('core.tasks.task_bulk_publish', args=(job.pk,))
 
-                if subtitle:
-                    if not settings.DEBUG or tenant.is_staging:
-                        res = publish_subtitle_to_xikolo(request, subtitle_id=subtitle.id)
-                    else:
-                        messages.info(request, "Bulk publishing to non-staging xikolo is disabled in debug-mode")
+                request.user.assigned_courses.add(course)
+                messages.info(request, f"Publishing of {len(subtitle_ids)} Subtitles queued")
 
-                    if res is True:
-                        number_of_affected += 1
+                return redirect('mooclink.course.bulk.publish_job', tenant_slug, course.ext_id, job.pk)
 
         elif action == 'remove-approval':
             if not request.user.has_perm('subtitles.bulk_disapprove'):
@@ -398,27 +408,26 @@ class CourseDoBulkAction(PermissionRequiredMixin, LoginRequiredMixin, views.View
 
                     number_of_affected += 1
         elif action == "download-vtt-files":
-            buffer = io.BytesIO()
-            zip_file = ZipFile(buffer, mode="w", compression=zipfile.ZIP_LZMA)
+            subtitle_format = SUBTITLE_FORMATS.get(request.POST.get('format'), SUBTITLE_FORMATS['vtt'])
 
-            for video in videos_to_transcript:
-                with zip_file.open(f"{video.index:02d}_{slugify(video.title)}_{video.original_language.iso_code}.vtt", "w") as f:
-                    if video.current_transcript:
-                        f.write(video.current_transcript.latest_content.encode("utf-8"))
-
-            for (language, video) in videos_to_translate:
-                subtitle = video.subtitle_set.filter(language=language).first()
+            def iter_entries():
+                for video in videos_to_transcript:
+                    transcript = video.current_transcript
+                    yield f"{video.index:02d}_{slugify(video.title)}_{video.original_language.iso_code}." \
+                          f"{subtitle_format.extension}", self.iter_subtitle(transcript, subtitle_format)
 
-                if not subtitle:
-                    continue
+                for (language, video) in videos_to_translate:
+                    subtitle = video.subtitle_set.filter(language=language).select_related('latest_file').first()
 
-                with zip_file.open(f"{video.index:02d}_{slugify(video.title)}_{subtitle.language.iso_code}.vtt", "w") as f:
-                    if video.current_transcript:
-                        f.write(subtitle.latest_content.encode("utf-8"))
+                    if not subtitle:
+                        continue
 
-            zip_file.close()
+                    yield f"{video.index:02d}_{slugify(video.title)}_{subtitle.language.iso_code}." \
+                          f"{subtitle_format.extension}", \
+                        self.iter_subtitle(subtitle if video.current_transcript else None, subtitle_format)
 
-            response = HttpResponse(buffer.getvalue())
+            # Written to the response entry by entry, the archive is never held in memory
+            response = StreamingHttpResponse(iter_zip(iter_entries(), compression=zipfile.ZIP_LZMA))
             response['Content-Type'] = 'application/x-zip-compressed'
             response['Content-Disposition'] = f'attachment; filename=subtitles_{slugify(course.title)}.zip'
 
@@ -433,3 +442,27 @@ class CourseDoBulkAction(PermissionRequiredMixin, LoginRequiredMixin, views.View
 
         messages.success(request, f"Changed status of {number_of_affected} Subtitles to {action}d")
         return redirect('mooclink.course.overview', tenant_slug, course.ext_id)
+
+
+class CourseBulkPublishJobView(PermissionRequiredMixin, LoginRequiredMixin, views.View):
+    permission_required = ('subtitles.bulk_publish',)
+
+    def get(self, request, course_id, job_id, tenant_slug=None):
+        tenant = Tenant.objects.get(slug=tenant_slug)
+
+        course = Course.objects.get(tenant=tenant, ext_id=course_id)
+        job = get_object_or_404(BulkPublishJob, tenant=tenant, course=course, pk=job_id)
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse(job.as_dict())
+
+        subtitles = Subtitle.objects.filter(tenant=tenant, pk__in=job.subtitle_ids) \
+            .select_related('video', 'language') \
+            .order_by('video__course_section__index', 'video__index', 'language__iso_code')
+
+        return render(request, "mooclink/course/bulk_publish_job.html", {
+            'tenant': tenant,
+            'course': course,
+            'job': job,
+            'subtitles': subtitles,
+        })
@@ -1,5 +1,7 @@
 import json
 
+import celery
+import requests
 from django import views
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
@@ -10,7 +12,8 @@ from django.shortcuts import render, redirect
 from django_celery_beat.models import PeriodicTask
 
 from core.models import Tenant
-from subtitles.api.xikolo_api import get_xikolo_course_sections_and_videos, update_video_detail, get_xikolo_course
+from subtitles.api.xikolo_api import get_xikolo_course_sections_and_videos, get_xikolo_course
+from subtitles.api.xikolo_sync import XikoloCourseSync
 from subtitles.models import Course, Video
 from subtitles.models.course import SyncStatusChoices
 
@@ -28,6 +31,24 @@ class MainView(PermissionRequiredMixin, LoginRequiredMixin, views.View):
 
         return videos
 
+    @classmethod
+    def fetch_video(cls, request, course, video_id):
+        """
+        Writes only the requested video and its section, its details and the rest of the course are fetched in the
+        background.
+        """
+        try:
+            video = XikoloCourseSync(course).sync_video(video_id)
+        except (requests.RequestException, KeyError) as exception:
+            messages.error(request, f"{exception}: {course.tenant.XIKOLO_API_URL} not available.")
+            return None
+
+        # A running sync writes the rest of the course anyway
+        if Course.objects.filter(pk=course.pk).exclude(sync_status=SyncStatusChoices.IN_PROGRESS).exists():
+            celery.current_app.send_task('core.tasks.task_sync_course', args=(course.pk,))
+
+        return video
+
     def get(self, request, tenant_slug, course_id, video_id):
         tenant = Tenant.objects.get(slug=tenant_slug)
 
@@ -43,16 +64,11 @@ class MainView(PermissionRequiredMixin, LoginRequiredMixin, views.View):
             try:
                 video = Video.objects.get(course_section__course=course, tenant=tenant, ext_id=video_id)
             except Video.DoesNotExist:
-                self.resync_course(request, course)
-
-                video = Video.objects.filter(course_section__course=course, tenant=tenant, ext_id=video_id).first()
-
-                if video:
-                    update_video_detail(video.pk, video_id)
+                video = self.fetch_video(request, course, video_id)
 
             if not video:
                 messages.error(request,
-                               f"Video list for course `{course}` refetched, but video with id={video_id} not found.")
+                               f"Course `{course}` refetched, but video with id={video_id} not found.")
 
         if course and video:
             return redirect('mooclink.video.index', course.tenant.slug, course.ext_id, video.ext_id)
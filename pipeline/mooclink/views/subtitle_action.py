@@ -6,7 +6,7 @@ import celery
 from django import views
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.utils.text import slugify
@@ -21,6 +21,7 @@ from subtitles.api.aws_api import aws_update_video_status, aws_download_subtitle
 from subtitles.api.mllp_api import mllp_download_subtitle_file, mllp_start_translation, update_mllp_video_status, \
     mllp_status, mllp_delete_media
 from subtitles.api.xikolo_api import publish_subtitle_to_xikolo
+from subtitles.converters import SUBTITLE_FORMATS
 from subtitles.models import Course, Video, Subtitle, IsoLanguage, AssignedLanguage
 from subtitles.models.translation_service import TranslationService
 
@@ -144,9 +145,19 @@ class SubtitleToAction(LoginRequiredMixin, PermissionRequiredMixin, views.View):
         elif action == 'publish':
             publish_subtitle_to_xikolo(request, subtitle.id)
         elif action == "download_vtt":
+            subtitle_format = SUBTITLE_FORMATS.get(request.POST.get('format'), SUBTITLE_FORMATS['vtt'])
             safe_title = slugify(video.title)
-            response = HttpResponse(subtitle.latest_content, content_type="text/vtt")
-            response["Content-Disposition"] = f"attachment; filename=subtitle_{subtitle.id}_{safe_title}_{subtitle.language.iso_code}.vtt"
+
+            if subtitle_format.extension == 'vtt':
+                # The stored file as it is
+                response = HttpResponse(subtitle.latest_content, content_type="text/vtt")
+            else:
+                response = StreamingHttpResponse(
+                    subtitle_format.convert(subtitle.iter_latest_cues(), subtitle.language.iso_code),
+                    content_type=f"{subtitle_format.content_type}; charset=utf-8",
+                )
+            response["Content-Disposition"] = f"attachment; filename=subtitle_{subtitle.id}_{safe_title}_" \
+                                              f"{subtitle.language.iso_code}.{subtitle_format.extension}"
 
             return response
         elif action == 'restart_workflow':
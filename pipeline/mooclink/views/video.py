@@ -1,4 +1,3 @@
-import io
 from datetime import datetime, timedelta
 from typing import Set
 
@@ -8,11 +7,11 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin
 from django.core.exceptions import SuspiciousOperation
+from django.db import transaction
 from django.db.models import Q
 from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.http import urlencode
 from django.utils.timezone import make_aware
 from django_celery_beat.models import PeriodicTask
@@ -20,8 +19,10 @@ from django_celery_beat.models import PeriodicTask
 from core.models import Tenant, TranspipeUser
 from mooclink.services import can_user_view_video
 from subtitles.api.xikolo_api import xikolo_download_subtitle_file
+from subtitles.converters import SUBTITLE_FORMATS
 from subtitles.models import Course, Video, Comment, IsoLanguage, Subtitle
 from subtitles.models.subtitle_file import SubtitleFile
+from subtitles.validation import validate_vtt
 
 
 class VideoDetailView(LoginRequiredMixin, PermissionRequiredMixin, views.View):
@@ -36,7 +37,8 @@ class VideoDetailView(LoginRequiredMixin, PermissionRequiredMixin, views.View):
 
         language = request.GET.get('language')
 
-        transcript = Subtitle.objects.filter(video=video).filter(is_transcript=True).order_by('-pk').first()
+        transcript = Subtitle.objects.filter(video=video).filter(is_transcript=True).select_related('latest_file') \
+            .order_by('-pk').first()
 
         if language:
             selected_language = IsoLanguage.objects.get(iso_code=language)
@@ -44,6 +46,7 @@ class VideoDetailView(LoginRequiredMixin, PermissionRequiredMixin, views.View):
                 .filter(video=video) \
                 .filter(is_transcript=False) \
                 .filter(language=language) \
+                .select_related('latest_file') \
                 .order_by('-pk') \
                 .first()
         else:
@@ -90,6 +93,7 @@ class VideoDetailView(LoginRequiredMixin, PermissionRequiredMixin, views.View):
             'workflow_duration_exceeded': workflow_duration_exceeded,
             'workflow_start_date': workflow_start_date,
             'debug_flag': settings.DEBUG and False,
+            'subtitle_formats': SUBTITLE_FORMATS,
         })
 
 
@@ -203,37 +207,32 @@ class SetWorkflowStatusView(LoginRequiredMixin, PermissionRequiredMixin, views.V
         return redirect('mooclink.video.index', tenant_slug, course.ext_id, video.ext_id)
 
 
-def save_subtitle_version(request, tenant, subtitle, text):
+def save_subtitle_version(request, tenant, subtitle, text) -> bool:
+    """
+    Stores the text as new version of the subtitle, which is saved as well. Invalid WebVTT is rejected.
+    @return: Whether the version was saved
+    """
     # for windows systems
     text = text.replace("\r\n", "\n")
 
     if text == "":
         messages.error(request, "No changes were saved.")
-    else:
-        new_subtitle_file = SubtitleFile(
-            subtitle=subtitle, date=timezone.now(), user=request.user, tenant=tenant
-        )
-        new_subtitle_file.file.name = (
-                settings.MEDIA_ROOT
-                + "subtitles/"
-                + str(subtitle.id)
-                + "_"
-                + str(subtitle.language)
-                + "_"
-                + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                + ".vtt"
-        )
+        return False
 
-        try:
-            file = io.open(new_subtitle_file.file.path, "w", encoding="utf-8")
-            file.write(text)
-            file.close()
-            subtitle.status = Subtitle.SubtitleStatus.EDITED
-            subtitle.save()
-            new_subtitle_file.save()
+    validation = validate_vtt(text)
+    if not validation.is_valid:
+        messages.error(request, f"No changes were saved, the subtitle is not valid WebVTT: {validation.summary()}")
+        return False
 
-        except Exception:
-            raise
+    for warning in validation.warnings[:3]:
+        messages.warning(request, warning)
+
+    with transaction.atomic():
+        subtitle.status = Subtitle.SubtitleStatus.EDITED
+        subtitle.save()
+        SubtitleFile.objects.create_version(subtitle, text, user=request.user, tenant=tenant)
+
+    return True
 
 
 class SaveTranscriptVersion(LoginRequiredMixin, PermissionRequiredMixin, views.View):
@@ -274,14 +273,14 @@ class SaveTranscriptVersion(LoginRequiredMixin, PermissionRequiredMixin, views.V
                 tenant=tenant,
                 is_automatic=is_automatic
             )
-            subtitle.save()
 
-        save_subtitle_version(request, tenant, subtitle, request.POST['transcription-content'])
-        subtitle.status = subtitle.SubtitleStatus.EDITED
-        subtitle.is_automatic = is_automatic
-        subtitle.save()
+        # A new subtitle is only saved together with its first version
+        if save_subtitle_version(request, tenant, subtitle, request.POST['transcription-content']):
+            subtitle.status = subtitle.SubtitleStatus.EDITED
+            subtitle.is_automatic = is_automatic
+            subtitle.save()
 
-        messages.success(request, f"Changes were saved.")
+            messages.success(request, f"Changes were saved.")
 
         redirect_url = reverse(
             'mooclink.video.index',
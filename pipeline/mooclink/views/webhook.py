@@ -0,0 +1,43 @@
+import json
+
+from django import views
+from django.http import HttpRequest, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+
+from core.models import Tenant
+from subtitles.api.xikolo_webhook import XIKOLO_SIGNATURE_HEADER, XIKOLO_TIMESTAMP_HEADER, queue_xikolo_refreshes, \
+    verify_xikolo_signature
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class XikoloWebhookView(views.View):
+    """
+    Receives change events from Xikolo, either a single event or a list of events:
+    `{"event": "video.updated", "course_id": "...", "video_id": "..."}`, subtitle events also have a `language`.
+
+    The request is authenticated by the HMAC signature of its timestamp and body, see `verify_xikolo_signature`.
+    """
+
+    def post(self, request: HttpRequest, tenant_slug):
+        tenant = get_object_or_404(Tenant, slug=tenant_slug)
+
+        if not verify_xikolo_signature(tenant, request.body, request.META.get(XIKOLO_SIGNATURE_HEADER, ""),
+                                       request.META.get(XIKOLO_TIMESTAMP_HEADER)):
+            return HttpResponseForbidden("Invalid signature")
+
+        try:
+            events = json.loads(request.body)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid JSON")
+
+        if isinstance(events, dict):
+            events = [events]
+
+        if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+            return HttpResponseBadRequest("Expected an event or a list of events")
+
+        queued = queue_xikolo_refreshes(tenant, events)
+
+        return JsonResponse({'events': len(events), 'queued': queued}, status=202)
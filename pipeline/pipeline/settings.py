@@ -188,9 +188,20 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'tbl_cache',
-    }
+    },
+    # Request counts of the provider rate limits (core.rate_limit). They need an atomic incr that does not take part
+    # in the transaction of the caller, which the database cache does not have.
+    'rate-limit': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ["REDIS_URL"],
+    } if os.environ.get("REDIS_URL") else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rate-limit',
+    },
 }
 
+RATE_LIMIT_CACHE = 'rate-limit'
+
 CELERY_TIMEZONE = "Europe/Berlin"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
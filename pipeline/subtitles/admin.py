@@ -12,7 +12,9 @@ from .models import (
     Video,
     Subtitle,
     IsoLanguage,
-    SubtitleAssignment, ServiceProviderUse,
+    SubtitleAssignment, ServiceProviderUse, BulkPublishJob, SubtitleBlob,
+    TranslationMemory,
+    XikoloResponseValidator,
 )
 from .models.awsupload import AWSupload
 from .models.subtitle_file import SubtitleFile
@@ -92,8 +94,12 @@ admin.site.register(Subtitle, SubtitleAdmin)
 admin.site.register(IsoLanguage)
 admin.site.register(CourseSection)
 admin.site.register(SubtitleFile)
+admin.site.register(SubtitleBlob)
 admin.site.register(AWSupload)
 admin.site.register(SubtitleAssignment)
 admin.site.register(ServiceProviderUse, ServiceProviderUseAdmin)
+admin.site.register(BulkPublishJob)
+admin.site.register(TranslationMemory)
+admin.site.register(XikoloResponseValidator)
 
 # TypeError: 'MediaDefiningClass' object is not iterable
@@ -19,12 +19,16 @@ from django.utils.timezone import make_aware
 from django_celery_beat.models import PeriodicTask
 
 from core.models import Tenant, TranspipeUser
+from core.rate_limit import Provider
+from core.resilience import DEFAULT_TIMEOUT, call_provider
 from mooclink.services import MAPPING_SLIM_TO_FULL, subtitle_status_change_service
 from . import get_runtime
 from ..models import Subtitle, Video, IsoLanguage, ServiceProviderUse
 from ..models.subtitle_file import SubtitleFile
 from ..models.awsupload import AWSupload
 
+MIE_TIMEOUT = urllib3.Timeout(connect=DEFAULT_TIMEOUT[0], read=DEFAULT_TIMEOUT[1])
+
 # Requirements
 # deploy mie app
 # create mie user in aws
@@ -43,7 +47,8 @@ def connect_mie_app(tenant: Tenant):
     returns a token to send in http api requests
     """
     client = boto3.client("cognito-idp", tenant.get_secret('AWS_REGION'))
-    response = client.initiate_auth(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, client.initiate_auth,
         AuthFlow="USER_PASSWORD_AUTH",
         AuthParameters={"USERNAME": tenant.get_secret('COGNITO_USER'),
                         "PASSWORD": tenant.get_secret('COGNITO_PASS'), },
@@ -115,8 +120,10 @@ def aws_start_transcription_only(video_id, initiator_id=None):
 
     mie_token = connect_mie_app(tenant=tenant)
 
-    asset_response = requests.post(
+    asset_response = call_provider(
+        tenant, Provider.AWS_MIE, requests.post,
         url=tenant.get_secret('DATAPLANE_API_ENDPOINT') + "create",
+        timeout=DEFAULT_TIMEOUT,
         headers={
             "Content-Type": "application/json",
             "Authorization": mie_token
@@ -149,8 +156,10 @@ def aws_start_transcription_only(video_id, initiator_id=None):
     workflow_config["Configuration"]["TranslateStage2"]["TranslateWebCaptions"]["SourceLanguageCode"] = video.original_language.iso_code
     workflow_config["Configuration"]["defaultAudioStage2"]["Transcribe"]["TranscribeLanguage"] = transcribe_language
 
-    mie_response = requests.post(
+    mie_response = call_provider(
+        tenant, Provider.AWS_MIE, requests.post,
         url=tenant.get_secret('WORKFLOW_API_ENDPOINT') + "workflow/execution",
+        timeout=DEFAULT_TIMEOUT,
         headers={
             "Content-Type": "application/json",
             "Authorization": mie_token
@@ -242,9 +251,10 @@ def aws_start_transcription(video_id):
         + '"}}'
     )
     mie_token = connect_mie_app(tenant=tenant)
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
-    response = http.request(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, http.request,
         "POST",
         tenant.get_secret('DATAPLANE_API_ENDPOINT') + "create",
         body=data.encode("utf-8"),
@@ -273,9 +283,10 @@ def aws_start_transcription(video_id):
     upload_object.save()
 
     # Execute a workflow with workflow config
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
-    response = http.request(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, http.request,
         "POST",
         tenant.get_secret('WORKFLOW_API_ENDPOINT') + "workflow/execution",
         body=json.dumps(workflow_config),
@@ -332,8 +343,11 @@ def aws_update_transcription_only(video):
     asset_id = video.workflow_data['asset_id']
     source_lang = video.original_language.iso_code
 
-    resp = requests.get(
+    resp = call_provider(
+        tenant, Provider.AWS_MIE, requests.get,
         url = tenant.get_secret('WORKFLOW_API_ENDPOINT') + "/workflow/execution/asset/" + asset_id,
+        timeout=DEFAULT_TIMEOUT,
+        idempotent=True,
         headers={
             "Content-Type": "application/json",
             "Authorization": mie_token
@@ -381,20 +395,11 @@ def aws_update_transcription_only(video):
             transcription_subtitle.status = Subtitle.SubtitleStatus.AUTO_GENERATED
             transcription_subtitle.save()
 
-            subtitle_file = SubtitleFile(
-                subtitle=transcription_subtitle,
-                date=timezone.now(),
-                user_id=1,
-                tenant=tenant,
-            )
+            transcript_f = io.BytesIO()
+            s3.download_fileobj(tenant.DATAPLANE_BUCKET, s3captions, transcript_f)
 
-            dt_str = subtitle_file.date.strftime("%d%m%y-%H%M%S")
-            subtitle_file.file.name = os.path.join(settings.MEDIA_ROOT, 'subtitles',
-                                f"{transcription_subtitle.id}_{transcription_subtitle.language}_{dt_str}-MS.vtt")
-            subtitle_file.save()
-
-            with open(subtitle_file.file.name, "wb") as transcript_f:
-                s3.download_fileobj(tenant.DATAPLANE_BUCKET, s3captions, transcript_f)
+            SubtitleFile.objects.create_version(transcription_subtitle, transcript_f.getvalue(), user_id=1,
+                                                tenant=tenant)
 
             video.workflow_status = None
             video.workflow_data['finished'] = str(timezone.now())
@@ -422,13 +427,15 @@ def aws_restart_workflow(video):
         video=video).order_by("-upload_date")[0]
     asset_id = upload_object.asset_id
     # Get stageId of currently executed stage
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
-    response = http.request(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, http.request,
         "GET",
         tenant.get_secret('WORKFLOW_API_ENDPOINT') +
         "/workflow/execution/asset/" + asset_id,
         headers=headers,
+        idempotent=True,
     )
     stage = json.loads(response.data.decode("utf-8"))
     print(stage)
@@ -437,9 +444,10 @@ def aws_restart_workflow(video):
     # GET /workflow/execution/{Id}
     # resume at waiting stage
     body = '{"WaitingStageName":"CaptionEditingWaitStage"}'
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
-    response = http.request(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, http.request,
         "PUT",
         tenant.get_secret('WORKFLOW_API_ENDPOINT') +
         "workflow/execution/" + stage_id,
@@ -489,13 +497,15 @@ def aws_update_video_status(video, video_id=None):
     )[0]
     aws_upload = AWSupload.objects.filter(video=video)[0]
     mie_token = connect_mie_app(tenant=tenant)
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
-    response = http.request(
+    response = call_provider(
+        tenant, Provider.AWS_MIE, http.request,
         "GET",
         tenant.get_secret('WORKFLOW_API_ENDPOINT') +
         "/workflow/execution/asset/" + aws_upload.asset_id,
         headers=headers,
+        idempotent=True,
     )
     stage = json.loads(response.data.decode("utf-8"))
     print("--->", stage)
@@ -515,31 +525,20 @@ def aws_update_video_status(video, video_id=None):
         aws_transcript = Subtitle.objects.filter(
             origin=Subtitle.Origin.AWS, video=video, is_transcript=True,
         )[0]
-        new_subtitle_file = SubtitleFile(
-            subtitle=aws_transcript,
-            date=timezone.now(),
+        transscript = io.BytesIO()
+        s3.download_fileobj(
+            tenant.DATAPLANE_BUCKET, s3_captions_path, transscript)
+
+        new_subtitle_file = SubtitleFile.objects.create_version(
+            aws_transcript,
+            transscript.getvalue(),
             user_id=1,  # TODO: create auto-download-user or something comparable
             tenant=tenant,
         )
-        new_subtitle_file.file.name = (
-            settings.MEDIA_ROOT
-            + "subtitles/"
-            + str(aws_transcript.id)
-            + "_"
-            + str(aws_transcript.language)
-            + "_"
-            + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-            + ".vtt"
-        )
-        new_subtitle_file.save()
         aws_transcript.status = Subtitle.SubtitleStatus.AUTO_GENERATED
         aws_transcript.last_update = new_subtitle_file.date
         aws_transcript.save()
 
-        with open(new_subtitle_file.file.name, "wb") as transscript:
-            s3.download_fileobj(
-                tenant.DATAPLANE_BUCKET, s3_captions_path, transscript)
-
         # clear block
         with transaction.atomic():
             video.workflow_status = None
@@ -618,12 +617,13 @@ def aws_restart_workflow(request, video):
         video=video).order_by("-upload_date")[0]
     mie_token = connect_mie_app(tenant=tenant)
     body = '{"WaitingStageName":"CaptionEditingWaitStage"}'
-    http = urllib3.PoolManager(ca_certs=certifi.where())
+    http = urllib3.PoolManager(ca_certs=certifi.where(), timeout=MIE_TIMEOUT)
     headers = {"Content-Type": "application/json", "Authorization": mie_token}
     print(tenant.get_secret('WORKFLOW_API_ENDPOINT') +
           'workflow/execution/'+upload_object.stage_id)
-    response = http.request('PUT', tenant.get_secret('WORKFLOW_API_ENDPOINT')+'workflow/execution/' +
-                            upload_object.stage_id, body=body, headers=headers)
+    response = call_provider(tenant, Provider.AWS_MIE, http.request,
+                             'PUT', tenant.get_secret('WORKFLOW_API_ENDPOINT')+'workflow/execution/' +
+                             upload_object.stage_id, body=body, headers=headers)
     print(response.status)
     # json.loads(response.data.decode('utf-8'))
 
@@ -682,29 +682,19 @@ def aws_download_subtitle_file(subtitle):
             subtitle.status = Subtitle.SubtitleStatus.AUTO_GENERATED
             subtitle.save()
 
-            new_subtitle_file = SubtitleFile(
-                subtitle=subtitle,
-                date=timezone.now(),
+            s3 = connect_to_s3(tenant=tenant)
+            fi = io.BytesIO()
+            try:
+                s3.download_fileobj(tenant.DATAPLANE_BUCKET, s3captions, fi)
+            except ClientError as e:
+                fi.write(f"Error while downloading vtt captions from s3\nError: {e}".encode('utf-8'))
+
+            SubtitleFile.objects.create_version(
+                subtitle,
+                fi.getvalue(),
                 user=subtitle.user,  # TODO: create auto-download-user or something comparable
                 tenant=tenant,
             )
-            new_subtitle_file.file.name = (
-                settings.MEDIA_ROOT
-                + "subtitles/"
-                + str(subtitle.id)
-                + "_"
-                + str(lang)
-                + "_"
-                + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                + ".vtt"
-            )
-            new_subtitle_file.save()
-            s3 = connect_to_s3(tenant=tenant)
-            with open(new_subtitle_file.file.name, "wb") as fi:
-                try:
-                    s3.download_fileobj(tenant.DATAPLANE_BUCKET, s3captions, fi)
-                except ClientError as e:
-                    fi.write(f"Error while downloading vtt captions from s3\nError: {e}".encode('utf-8'))
 
     except TypeError as e:
         print("type", e)
@@ -11,11 +11,13 @@ from django.utils import timezone
 from django_celery_beat.models import PeriodicTask
 
 from core.models import Tenant, TranspipeUser
+from core.rate_limit import Provider
+from core.resilience import call_provider
 from mooclink.services import get_supported_languages
 from . import get_runtime
 from ..models import Subtitle, Video, IsoLanguage, ServiceProviderUse
 from ..models.subtitle_file import SubtitleFile
-from .libtlp import TLPSpeechClient
+from .libtlp import TLPSpeechClient, APIInternalServerError
 from ..models.translation_service import TranslationService
 
 
@@ -63,7 +65,8 @@ def update_mllp_video_status(request, video, tenant_id=None, user_id=None, video
 def mllp_delete_media(video, ext_id=None):
     tlp = get_speech_client(tenant=video.tenant)
 
-    tlp.api_ingest_delete(ext_id or video.ext_id)
+    call_provider(video.tenant, Provider.MLLP, tlp.api_ingest_delete, ext_id or video.ext_id,
+                  transient_exceptions=(APIInternalServerError,))
 
     return tlp.ret_data
 
@@ -119,7 +122,7 @@ def mllp_start_transcription(request, video, tenant=None, user=None):
     else:
         print("The file does not exist")
 
-    tlp.api_ingest_new()
+    call_provider(tenant, Provider.MLLP, tlp.api_ingest_new, transient_exceptions=(APIInternalServerError,))
 
     print("-->", tlp.get_printable_response_data())
 
@@ -169,7 +172,8 @@ def mllp_status(video):
 
     tlp = get_speech_client(tenant=tenant)
 
-    tlp.api_status('up-99162cae-cc66-4964-acbe-a26fe398a52a')
+    call_provider(tenant, Provider.MLLP, tlp.api_status, 'up-99162cae-cc66-4964-acbe-a26fe398a52a',
+                  idempotent=True, transient_exceptions=(APIInternalServerError,))
 
     return tlp.ret_data
 
@@ -193,7 +197,8 @@ def mllp_download_subtitle_file(request, subtitle, tenant=None, user=None):
         video = subtitle.video
         # check if subtitle file is available
         tlp = get_speech_client(tenant=tenant)
-        tlp.api_langs(video.ext_id)
+        call_provider(tenant, Provider.MLLP, tlp.api_langs, video.ext_id,
+                      idempotent=True, transient_exceptions=(APIInternalServerError,))
         print("->", tlp.get_printable_response_data())
         langs = json.loads(tlp.get_printable_response_data())
 
@@ -211,26 +216,17 @@ def mllp_download_subtitle_file(request, subtitle, tenant=None, user=None):
         if not subtitle_available:
             return False
 
-        new_subtitle_file = SubtitleFile(
-            subtitle=subtitle,
-            date=timezone.now(),
-            user=user,  # TODO: create auto-download-user or something comparable
-            tenant=tenant
-        )
+        call_provider(tenant, Provider.MLLP, tlp.api_get, video.ext_id, subtitle.language.iso_code, form="vtt",
+                      idempotent=True, transient_exceptions=(APIInternalServerError,))
 
-        new_subtitle_file.file.name = (
-            settings.MEDIA_ROOT
-            + "subtitles/"
-            + str(subtitle.id)
-            + "_"
-            + str(subtitle.language)
-            + "_"
-            + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-            + ".vtt"
+        # Write response data to the new version
+        new_subtitle_file = SubtitleFile.objects.create_version(
+            subtitle,
+            tlp.get_printable_response_data(),
+            user=user,  # TODO: create auto-download-user or something comparable
+            tenant=tenant,
         )
 
-        new_subtitle_file.save()
-
         subtitle.status = Subtitle.SubtitleStatus.AUTO_GENERATED
         # Update timestamp:
         subtitle.last_update = new_subtitle_file.date
@@ -240,10 +236,6 @@ def mllp_download_subtitle_file(request, subtitle, tenant=None, user=None):
         # clear block
         video.workflow_status = None
 
-        # Write response data to file
-        tlp.api_get(video.ext_id, subtitle.language.iso_code, form="vtt")
-        tlp.save_response_data(new_subtitle_file.file.name)
-
         with transaction.atomic():
             if periodic_task_id := video.workflow_data.get('periodic_task_id'):
                 PeriodicTask.objects.filter(pk=periodic_task_id).delete()
@@ -271,7 +263,7 @@ def mllp_start_translation(user: TranspipeUser, video, selected_language):
     tlp.manifest_set_options(
         generate=True, regenerate="tl", force=False, test_mode=False
     )
-    tlp.api_ingest_update()
+    call_provider(tenant, Provider.MLLP, tlp.api_ingest_update, transient_exceptions=(APIInternalServerError,))
 
     print(tlp.get_printable_response_data())
 
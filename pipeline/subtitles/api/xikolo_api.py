@@ -1,11 +1,10 @@
 """Xikolo transpipe API calls"""
 
-import io
-import os
+import hashlib
+import logging
 from http import HTTPStatus
-from typing import List
+from typing import List, Tuple
 
-import celery
 import requests
 from django.conf import settings
 from django.contrib import messages
@@ -15,8 +14,107 @@ from django.utils import timezone
 from sentry_sdk import capture_message
 
 from core.models import Tenant, TranspipeUser
-from ..models import Subtitle, SubtitleFile, IsoLanguage, Course, CourseSection, Video
+from core.utils import TTLCache, bounded_thread_map
+from .xikolo_client import XikoloClient, get_xikolo_max_parallel_workers
+from ..models import BulkPublishJob, Subtitle, SubtitleFile, IsoLanguage, Course, CourseSection, Video, \
+    XikoloResponseValidator
 from ..models.course import SyncStatusChoices
+from ..validation import validate_vtt
+
+logger = logging.getLogger(__name__)
+
+# Short-lived memo of video details, so the lookups of one sync or request share a single HTTP call
+xikolo_response_memo = TTLCache(maxsize=getattr(settings, 'XIKOLO_RESPONSE_MEMO_SIZE', 1024),
+                                ttl=getattr(settings, 'XIKOLO_RESPONSE_MEMO_TTL', 60))
+
+
+def _get_xikolo_validator_key(url, scope):
+    return hashlib.sha256(f"{scope}|{url}".encode("utf-8")).hexdigest()
+
+
+def xikolo_get(tenant: Tenant, url, scope=None, conditional=True, memoize=False) -> requests.Response:
+    """
+    GET on the Xikolo API.
+
+    With a `scope`, the request is conditional on the validators (ETag / Last-Modified) that
+    `remember_xikolo_response` stored for the tenant, URL and scope. Callers remember the response once their DB
+    writes succeeded, otherwise a failed write would be skipped on the next 304. On a 304 `response.not_modified`
+    is True and the response has no body, callers that need the body anyway pass conditional=False. Without a
+    scope nothing is stored.
+
+    With memoize=True a 200 response is kept in `xikolo_response_memo` for a short time and reused for the same
+    tenant and URL, regardless of the scope. `not_modified` is then derived from the validators of the scope.
+    """
+    validator_key = _get_xikolo_validator_key(url, scope) if scope else None
+    validators = None
+    if validator_key and conditional:
+        validators = XikoloResponseValidator.objects.filter(tenant=tenant, key=validator_key) \
+            .values('etag', 'last_modified').first()
+
+    memo_key = (tenant.pk, url)
+    memoized = xikolo_response_memo.get(memo_key) if memoize else None
+
+    if memoized:
+        response = _build_xikolo_response(url, memoized)
+        response.not_modified = bool(validators) and (validators['etag'], validators['last_modified']) == (
+            memoized['etag'], memoized['last_modified'])
+    else:
+        headers = {}
+        if validators:
+            if validators['etag']:
+                headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        response = XikoloClient.for_tenant(tenant).get(url, headers=headers)
+        response.not_modified = bool(validators) and response.status_code == HTTPStatus.NOT_MODIFIED
+
+        if memoize and response.status_code == HTTPStatus.OK:
+            xikolo_response_memo.set(memo_key, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'body': response.content,
+                'encoding': response.encoding,
+                'headers': dict(response.headers),
+            })
+
+    response.xikolo_tenant = tenant
+    response.xikolo_validator_key = validator_key
+
+    return response
+
+
+def _build_xikolo_response(url, entry) -> requests.Response:
+    response = requests.Response()
+    response.url = url
+    response.status_code = HTTPStatus.OK
+    response._content = entry['body']
+    response.encoding = entry['encoding']
+    response.headers.update(entry['headers'])
+    return response
+
+
+def forget_xikolo_response(tenant: Tenant, url):
+    """
+    Drops the memoized response of the URL, e.g. after changing the resource.
+    """
+    xikolo_response_memo.delete((tenant.pk, url))
+
+
+def remember_xikolo_response(response: requests.Response):
+    """
+    Stores the validators of a response of a scoped `xikolo_get`, so the next request of the scope is conditional.
+    """
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+
+    if response.not_modified or not response.xikolo_validator_key or not (etag or last_modified):
+        return
+
+    XikoloResponseValidator.objects.update_or_create(
+        tenant=response.xikolo_tenant, key=response.xikolo_validator_key,
+        defaults={'etag': etag, 'last_modified': last_modified},
+    )
 
 
 def xikolo_download_subtitle_file(request, subtitle):
@@ -27,21 +125,13 @@ def xikolo_download_subtitle_file(request, subtitle):
         # Does the video still exist on the MOOC platform?
         video = get_object_or_404(Video, subtitle=subtitle)
 
-        response_video = requests.get(
-            tenant.XIKOLO_API_URL + "videos/" + video.ext_id,
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
+        response_video = xikolo_get(tenant, tenant.XIKOLO_API_URL + "videos/" + video.ext_id, memoize=True)
         if response_video.status_code != 200:
             return False
 
         # Does the course_section still exist on the MOOC platform?
         course_section = get_object_or_404(CourseSection, video=video)
-        response_course = requests.get(
-            tenant.XIKOLO_API_URL + "courses/" + course_section.course.ext_id,
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
+        response_course = xikolo_get(tenant, tenant.XIKOLO_API_URL + "courses/" + course_section.course.ext_id)
 
         # if response_course.status_code == 200:
         #     any(course_section.ext_id == section["id"] for section in response_course.json()["sections"])
@@ -58,43 +148,16 @@ def xikolo_download_subtitle_file(request, subtitle):
 
         # Note: Cannot be reached
         # GET /videos/{id}/subtitles/{lang}
-        response = requests.get(
+        response = xikolo_get(
+            tenant,
             tenant.XIKOLO_API_URL
             + "videos/"
             + subtitle.video.ext_id
             + "/subtitles/"
             + subtitle.language.iso_code,
-            headers={"Authorization": f"Bearer {tenant.XIKOLO_API_TOKEN}"},
-            data={"key": "value"},
         )
         content = response.text
         if response.status_code == 200 and content != "":
-            # Create new subtitle file
-            new_subtitle_file = SubtitleFile(
-                subtitle=subtitle,
-                date=timezone.now(),
-                user=request.user,
-                tenant=tenant
-            )
-
-            # create directory for subtitles if not existing
-            os.makedirs(os.path.join(settings.MEDIA_ROOT, "subtitles"), exist_ok=True)
-
-            # Save the name of the new file
-            new_subtitle_file.file.name = (
-                    settings.MEDIA_ROOT
-                    + "subtitles/"
-                    + str(subtitle.id)
-                    + "_"
-                    + str(subtitle.language)
-                    + "_"
-                    + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                    + ".vtt"
-            )
-            # Write content to a file
-            file = io.open(new_subtitle_file.file.path, "w", encoding="utf-8")
-            file.write(content)
-            file.close()
             # Save the new subtitle file and the subtitle after status change
             subtitle.status = Subtitle.SubtitleStatus.PUBLISHED
 
@@ -113,7 +176,7 @@ def xikolo_download_subtitle_file(request, subtitle):
             subtitle.is_automatic = is_automatic
             with transaction.atomic():
                 subtitle.save()
-                new_subtitle_file.save()
+                SubtitleFile.objects.create_version(subtitle, content, user=request.user, tenant=tenant)
 
             return True
         else:
@@ -129,54 +192,27 @@ def get_subtitle_from_xikolo_for_video(video, language):
 
 
     # GET /videos/{id}/subtitles/{lang}
-    response = requests.get(
+    response = xikolo_get(
+        tenant,
         tenant.XIKOLO_API_URL
         + "videos/"
         + subtitle.video.ext_id
         + "/subtitles/"
         + subtitle.language.iso_code,
-        headers={"Authorization": f"Bearer {tenant.XIKOLO_API_TOKEN}"},
-        data={"key": "value"},
     )
     content = response.text
     if response.status_code == 200 and content != "":
-        # Create new subtitle file
-        new_subtitle_file = SubtitleFile(
-            subtitle=subtitle,
-            date=timezone.now(),
-            user=request.user,
-            tenant=tenant
-        )
-        # Save the name of the new file
-        new_subtitle_file.file.name = (
-                settings.MEDIA_ROOT
-                + "subtitles/"
-                + str(subtitle.id)
-                + "_"
-                + str(subtitle.language)
-                + "_"
-                + str(new_subtitle_file.date.strftime("%d%m%y-%H%M%S"))
-                + ".vtt"
-        )
-        # Write content to a file
-        file = io.open(new_subtitle_file.file.path, "w", encoding="utf-8")
-        file.write(content)
-        file.close()
         # Save the new subtitle file and the subtitle after status change
         subtitle.status = Subtitle.SubtitleStatus.PUBLISHED
         with transaction.atomic():
             subtitle.save()
-            new_subtitle_file.save()
+            SubtitleFile.objects.create_version(subtitle, content, user=request.user, tenant=tenant)
 
 def get_video_detail(video_id, request):
     video = Video.objects.get(pk=video_id)
     tenant: Tenant = video.tenant
     try:
-        response = requests.get(
-            tenant.XIKOLO_API_URL + "videos/" + video.ext_id,
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
+        response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "videos/" + video.ext_id, memoize=True)
         if response.status_code == 200:
             return response.json()
         else:
@@ -188,38 +224,30 @@ def get_video_detail(video_id, request):
         )
 
 
-def get_course_list(tenant):
+def iter_course_list_pages(tenant):
+    """
+    Yields the course list of Xikolo page by page, following the `next` links.
+    @param tenant: Tenant
+    @return: Generator of lists of course entries
+    """
 
-    try:
-        # GET /courses/
-        response = requests.get(
-            tenant.XIKOLO_API_URL + "courses",
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
-        next_link = response.links["next"]["url"]
-        course_list = []
-        if response.status_code == 200:
-            course_list = response.json()
-            while next_link:
-                response = requests.get(
-                    next_link,
-                    headers={"Authorization": "Bearer " +
-                                              tenant.XIKOLO_API_TOKEN},
-                    data={"key": "value"},
-                )
-                if response.status_code == 200:
-                    course_list.extend(response.json())
-                else:
-                    return []
-                # Wenn kein next link dann break
-                if "next" not in response.links:
-                    break
-                next_link = response.links["next"]["url"]
-        return course_list
+    # GET /courses/
+    next_link = tenant.XIKOLO_API_URL + "courses"
+
+    while next_link:
+        response = xikolo_get(tenant, next_link)
+        response.raise_for_status()
+
+        yield response.json()
+
+        next_link = response.links.get("next", {}).get("url")
 
-    except (requests.ConnectionError, KeyError) as exception:
-        raise
+
+def get_course_list(tenant):
+    try:
+        return [course_entry for page in iter_course_list_pages(tenant) for course_entry in page]
+    except requests.HTTPError:
+        return []
 
 
 def get_xikolo_video_link(video_detail):
@@ -258,15 +286,25 @@ def get_xikolo_course(request, course_id, tenant):
 
     try:
         # GET /courses/id
-        response = requests.get(
-            tenant.XIKOLO_API_URL + "courses/" + course_id,
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
+        response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "courses/" + course_id, scope="course")
 
         print("---->", response.text)
 
+        if response.not_modified:
+            # Unchanged since the last fetch, the local course is still up to date
+            existing_course = Course.objects.filter(tenant=tenant, ext_id=course_id) \
+                .exclude(sync_status=SyncStatusChoices.SKELETON) \
+                .first()
+
+            if existing_course:
+                return existing_course
+
+            # A 304 has no body
+            response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "courses/" + course_id, scope="course",
+                                  conditional=False)
+
         if response.status_code == 200:
+            http_response = response
             response = response.json()
 
             try:
@@ -293,6 +331,8 @@ def get_xikolo_course(request, course_id, tenant):
                 fetched_course.language = language
                 fetched_course.save()
 
+            remember_xikolo_response(http_response)
+
             return fetched_course
 
     except (requests.ConnectionError, KeyError) as exception:
@@ -304,78 +344,14 @@ def get_xikolo_course(request, course_id, tenant):
     return None
 
 
-def get_xikolo_course_sections_and_videos(course: Course, request, disable_deep_fetch=False): #ToDo make async when productive
+def get_xikolo_course_sections_and_videos(course: Course, request, disable_deep_fetch=False):
+    from .xikolo_sync import XikoloCourseSync
+
     tenant: Tenant = course.tenant
     assert tenant
 
-    course.sync_status = SyncStatusChoices.IN_PROGRESS
-    course.save()
-
-    list_of_videos = []
     try:
-        # GET /courses/{id}
-        response = requests.get(
-            tenant.XIKOLO_API_URL + "courses/" + course.ext_id,
-            headers={"Authorization": "Bearer " +
-                                      tenant.get_secret('XIKOLO_API_TOKEN')},
-            data={"key": "value"},
-        )
-
-        if response.status_code == 200:
-            j = response.json()
-
-            # Save teacher in course, prefer alternative_teacher_text, but fall back to normal teacher list.
-            course.teacher = j["alternative_teacher_text"] or ', '.join(t['name'] for t in j['teachers'])
-            course.save()
-
-            fetched_languages = False
-
-            for section_idx, course_section_entry in enumerate(response.json()["sections"]):
-
-                course_section, _ = CourseSection.objects.update_or_create(
-                    tenant=tenant,
-                    ext_id=course_section_entry["id"],
-                    defaults={
-                        'ext_id': course_section_entry["id"],
-                        'title': course_section_entry["title"],
-                        'course': course,
-                        'tenant': tenant,
-                        'index': section_idx,
-                    },
-                )
-
-                # Videos in course sections:
-                for video_idx, video_entry in enumerate(course_section_entry["videos"]):
-                    video_detail = None
-
-                    created_video = create_or_update_video_helper(video_entry, tenant, course.language, course_section, video_detail, video_idx)
-                    list_of_videos.append(created_video)
-
-                    if not fetched_languages:
-                        languages_of_video = get_video_languages(tenant, video_entry["id"])
-
-                        course.add_languages(l['language'] for l in languages_of_video)
-                        fetched_languages = True
-
-                    if created_video and not disable_deep_fetch:
-                        if getattr(settings, 'XIKOLO_ASYNC_VIDEO_DETAIL_FETCH', True):
-                            celery.current_app.send_task('core.tasks.task_update_video_detail',
-                                                         args=(created_video.id, video_entry["id"]))
-                        else:
-                            update_video_detail(created_video.id, video_entry['id'])
-
-            all_local_videos = Video.objects.filter(course_section__course=course, deprecated=False).order_by('course_section___index', 'index')
-
-            for local_video in all_local_videos:
-                if local_video not in list_of_videos:
-                    print(f"Need to deprecate video {local_video}")
-                    local_video.deprecated = True
-                    local_video.save()
-
-            course.sync_status = SyncStatusChoices.SUCCESS
-            course.save()
-
-        return list_of_videos
+        return XikoloCourseSync(course, disable_deep_fetch=disable_deep_fetch).run()
 
     except (requests.ConnectionError, KeyError) as exception:
         messages.error(
@@ -418,11 +394,7 @@ def get_video_languages(tenant: Tenant, ext_video_id) -> List[str]:
     @return: List of language codes
     """
 
-    response = requests.get(
-        tenant.XIKOLO_API_URL + "videos/" + ext_video_id,
-        headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-        data={},
-    )
+    response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "videos/" + ext_video_id, memoize=True)
 
     response.raise_for_status()
 
@@ -433,8 +405,12 @@ def get_video_languages(tenant: Tenant, ext_video_id) -> List[str]:
     return subtitle_language_list
 
 
-def update_video_detail(local_video_id, ext_video_id):
-    print(f"update_video_detail {local_video_id=} {ext_video_id=}")
+def update_video_detail(local_video_id, ext_video_id, max_workers=None):
+    """
+    Fetches the details of a video and downloads its new subtitles, at most `max_workers` at a time (default:
+    XIKOLO_MAX_PARALLEL_WORKERS of the tenant). Callers that already run in a pool pass max_workers=1.
+    """
+    logger.debug("update_video_detail local_video_id=%s ext_video_id=%s", local_video_id, ext_video_id)
     video = Video.objects.get(pk=local_video_id)
 
     assert video.ext_id == ext_video_id
@@ -443,14 +419,15 @@ def update_video_detail(local_video_id, ext_video_id):
     # todo add service-user
     dummy_user = tenant.transpipeuser_set.first() or TranspipeUser.objects.get(username='robert')
 
-    response = requests.get(
-        tenant.XIKOLO_API_URL + "videos/" + ext_video_id,
-        headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-        data={"key": "value"},
-    )
+    response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "videos/" + ext_video_id, scope="video-detail",
+                          memoize=True)
 
     response.raise_for_status()
 
+    if response.not_modified:
+        # Nothing changed since the last successful update of this video
+        return
+
     j = response.json()
 
     video.summary = j['summary']
@@ -460,85 +437,123 @@ def update_video_detail(local_video_id, ext_video_id):
 
     subtitle_language_list = j["subtitles"]
 
+    languages = IsoLanguage.objects.in_bulk([subtitle_dict['language'] for subtitle_dict in subtitle_language_list])
+    existing_subtitles = set(Subtitle.objects.filter(video=video).values_list('language_id', 'is_transcript'))
+
+    new_subtitles = []
     for subtitle_dict in subtitle_language_list:
-        # get iso language object:
-        subtitle_lang = IsoLanguage.objects.get(iso_code=subtitle_dict['language'])
-        is_automatic = subtitle_dict.get('automatic', True)
+        subtitle_lang = languages.get(subtitle_dict['language'])
+        if subtitle_lang is None:
+            logger.warning("Video %s: Unknown subtitle language %s", video.ext_id, subtitle_dict['language'])
+            continue
 
         # Check if subtitle is transcript or translation:
-        if video.original_language == subtitle_lang:
-            is_transcript = True
-        else:
-            is_transcript = False
-            # TODO: Language may be new for course, and needs to be added to set of AssignedLanguages of course.
+        # TODO: Language may be new for course, and needs to be added to set of AssignedLanguages of course.
+        is_transcript = video.original_language == subtitle_lang
+
+        # Case 2: subtitle already exists: do nothing
+        if (subtitle_lang.pk, is_transcript) in existing_subtitles:
+            continue
 
         # Case 1: new subtitle
-        if not Subtitle.objects.filter(
-                video=video, language=subtitle_lang, is_transcript=is_transcript
-        ):
-            # create new subtitle
-            subtitle = Subtitle(
-                language=subtitle_lang,
-                video=video,
-                is_transcript=is_transcript,
-                status=Subtitle.SubtitleStatus.PUBLISHED,
-                last_update=timezone.now(),
-                origin=Subtitle.Origin.MOOC,
-                user=dummy_user,
-                tenant=tenant,
-                is_automatic=is_automatic,
-            )
-            subtitle.save()
+        new_subtitles.append(Subtitle(
+            language=subtitle_lang,
+            video=video,
+            is_transcript=is_transcript,
+            status=Subtitle.SubtitleStatus.PUBLISHED,
+            last_update=timezone.now(),
+            origin=Subtitle.Origin.MOOC,
+            user=dummy_user,
+            tenant=tenant,
+            is_automatic=subtitle_dict.get('automatic', True),
+        ))
+
+    # Download the webvtt content of all new subtitles concurrently
+    file_contents = list(bounded_thread_map(
+        lambda subtitle: get_subtitle_webvtt_content(str(video.ext_id), str(subtitle.language.iso_code),
+                                                     request=None, tenant=tenant),
+        new_subtitles,
+        max_workers or get_xikolo_max_parallel_workers(tenant),
+    ))
+
+    downloaded_subtitles = [(subtitle, file_content) for subtitle, file_content in zip(new_subtitles, file_contents)
+                            if file_content is not None]
+    failed_languages = [subtitle.language.iso_code for subtitle, file_content in zip(new_subtitles, file_contents)
+                        if file_content is None]
+    if failed_languages:
+        logger.warning("Video %s: Could not download the subtitles %s", video.ext_id, ", ".join(failed_languages))
+
+    for subtitle, file_content in downloaded_subtitles:
+        # The content is what is published on the platform right now
+        subtitle.published_hash = get_published_hash(file_content.encode("utf-8"), subtitle.is_automatic)
+
+    with transaction.atomic():
+        Subtitle.objects.bulk_create([subtitle for subtitle, _ in downloaded_subtitles])
+
+        subtitle_files = []
+        for subtitle, file_content in downloaded_subtitles:
             # save webvtt content in subtitle file
-            subtitle_file = SubtitleFile(
-                subtitle=subtitle, date=timezone.now(), user=dummy_user, tenant=tenant
-            )
+            subtitle_files.append(SubtitleFile.objects.create_version(
+                subtitle, file_content, commit=False, user=dummy_user, tenant=tenant
+            ))
+            logger.debug("Video %s: Saved new subtitle %s", video.ext_id, subtitle.language_id)
 
-            # create directory for subtitles if not existing
-            os.makedirs(os.path.join(settings.MEDIA_ROOT, "subtitles"), exist_ok=True)
-
-            subtitle_file.file.name = os.path.join(
-                settings.MEDIA_ROOT,
-                "subtitles",
-                str(subtitle.id)
-                + "_"
-                + str(subtitle.language)
-                + "_"
-                + str(subtitle.last_update.strftime("%d%m%y-%H%M%S"))
-                + ".vtt",
-            )
-            file_content = get_subtitle_webvtt_content(
-                str(video.ext_id), str(
-                    subtitle.language.iso_code), request=None, tenant=tenant
-            )
+        SubtitleFile.objects.bulk_create(subtitle_files)
 
-            new_file = io.open(
-                subtitle_file.file.name, "w", encoding="utf-8")
-            new_file.write(file_content)
-            new_file.close()
-            subtitle_file.save()
-            print(
-                "Video "
-                + str(video)
-                + ": Video: "
-                + video.ext_id
-                + ": Saved new subtitle"
-            )
-        # Case 2: subtitle already exists: do nothing
+        for subtitle_file in subtitle_files:
+            subtitle_file.subtitle.latest_file = subtitle_file
+        Subtitle.objects.bulk_update([subtitle for subtitle, _ in downloaded_subtitles], ['latest_file'])
 
     video.save()
 
+    # Otherwise the next update would get a 304 and never retry the failed languages
+    if not failed_languages:
+        remember_xikolo_response(response)
+
+
+def refresh_subtitle(subtitle_id):
+    """
+    Downloads a subtitle from Xikolo again and stores a new version if its content changed there.
+
+    The remembered validators of the video details do not cover the content of the subtitles, so a pushed change of
+    a subtitle is downloaded unconditionally.
+    @return: The new SubtitleFile, or None if the content did not change or could not be downloaded
+    """
+    subtitle = Subtitle.objects.select_related('video', 'tenant', 'latest_file').get(pk=subtitle_id)
+    tenant = subtitle.tenant
+
+    file_content = get_subtitle_webvtt_content(str(subtitle.video.ext_id), subtitle.language_id, tenant=tenant)
+    if file_content is None:
+        logger.warning("Video %s: Could not download the subtitle %s", subtitle.video.ext_id, subtitle.language_id)
+        return None
+
+    if subtitle.latest_file and subtitle.latest_content == file_content:
+        return None
+
+    # todo add service-user
+    dummy_user = tenant.transpipeuser_set.first() or TranspipeUser.objects.get(username='robert')
+
+    with transaction.atomic():
+        subtitle_file = SubtitleFile.objects.create_version(subtitle, file_content, user=dummy_user, tenant=tenant)
+
+        # The content is what is published on the platform right now
+        subtitle.status = Subtitle.SubtitleStatus.PUBLISHED
+        subtitle.published_hash = get_published_hash(file_content.encode("utf-8"), subtitle.is_automatic)
+        subtitle.save(update_fields=['status', 'published_hash', 'last_update'])
+
+    logger.debug("Video %s: Saved changed subtitle %s", subtitle.video.ext_id, subtitle.language_id)
+
+    return subtitle_file
+
 
 def get_subtitle_webvtt_content(ext_video_id, language, request=None, tenant=None):
     assert tenant
 
     try:
         # GET /videos/{id}/subtitles/{lang}
-        response = requests.get(
-            tenant.get_secret('XIKOLO_API_URL') + "videos/" +
-            ext_video_id + "/subtitles/" + language,
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
+        response = xikolo_get(
+            tenant,
+            tenant.get_secret('XIKOLO_API_URL') + "videos/" + ext_video_id + "/subtitles/" + language,
         )
         if response.status_code == 200:
             return response.text
@@ -555,23 +570,14 @@ def get_xikolo_course_list(request):
     course_list = []
     try:
         # GET /courses/
-        response = requests.get(
-            tenant.XIKOLO_API_URL + "courses",
-            headers={"Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN},
-            data={"key": "value"},
-        )
+        response = xikolo_get(tenant, tenant.XIKOLO_API_URL + "courses")
         next_link = response.links["next"]["url"]
         course_list_raw = []
         print("next_link")
         if response.status_code == 200:
             course_list_raw = response.json()
             while next_link:
-                response = requests.get(
-                    next_link,
-                    headers={"Authorization": "Bearer " +
-                                              tenant.XIKOLO_API_TOKEN},
-                    data={"key": "value"},
-                )
+                response = xikolo_get(tenant, next_link)
                 if response.status_code == 200:
                     course_list_raw.extend(response.json())
                 # Wenn kein next link dann break
@@ -675,33 +681,12 @@ def process_course_from_xikolo(course, request):
                     )
                     subtitle.save()
                     # save webvtt content in subtitle file
-                    subtitle_file = SubtitleFile(
-                        subtitle=subtitle, date=timezone.now(), user=request.user, tenant=tenant
-                    )
-
-                    # create directory for subtitles if not existing
-                    os.makedirs(os.path.join(settings.MEDIA_ROOT, "subtitles"), exist_ok=True)
-
-                    subtitle_file.file.name = os.path.join(
-                        settings.MEDIA_ROOT,
-                        "subtitles",
-                        str(subtitle.id)
-                        + "_"
-                        + str(subtitle.language)
-                        + "_"
-                        + str(subtitle.last_update.strftime("%d%m%y-%H%M%S"))
-                        + ".vtt",
-                    )
                     file_content = get_subtitle_webvtt_content(
                         str(video.ext_id), str(
                             subtitle.language.iso_code), request
                     )
 
-                    new_file = io.open(
-                        subtitle_file.file.name, "w", encoding="utf-8")
-                    new_file.write(file_content)
-                    new_file.close()
-                    subtitle_file.save()
+                    SubtitleFile.objects.create_version(subtitle, file_content, user=request.user, tenant=tenant)
                     print(
                         "Course "
                         + course.ext_id
@@ -712,8 +697,45 @@ def process_course_from_xikolo(course, request):
                 # Case 2: subtitle already exists: do nothing
 
 
-def publish_subtitle_to_xikolo(request, subtitle_id):
-    subtitle = get_object_or_404(Subtitle, pk=subtitle_id)
+def get_published_hash(encoded_data: bytes, is_automatic: bool) -> str:
+    """
+    Hash of everything that is sent when publishing a subtitle, see `Subtitle.published_hash`
+    """
+    automatic = 'true' if is_automatic else 'false'
+    return hashlib.sha256(f"automatic={automatic}\n".encode("utf-8") + encoded_data).hexdigest()
+
+
+def validate_subtitle_for_publishing(subtitle: Subtitle) -> Tuple[bool, str]:
+    """
+    Checks the latest version of the subtitle locally, so invalid files are not sent to Xikolo.
+    @return: Whether the subtitle can be published, and a human-readable message if not
+    """
+    if not subtitle.latest_file:
+        return False, f"Subtitle has no version to publish (subtitle-id: {subtitle.pk})"
+
+    try:
+        validation = validate_vtt(subtitle.latest_content)
+    except FileNotFoundError as exception:
+        return False, f"FileNotFoundError: {exception} (subtitle-id: {subtitle.pk})"
+
+    if not validation.is_valid:
+        return False, f"The subtitle is not valid WebVTT: {validation.summary()} (subtitle-id: {subtitle.pk})"
+
+    return True, ""
+
+
+def publish_subtitle(subtitle: Subtitle, validate=True) -> Tuple[bool, str]:
+    """
+    PATCHes the latest version of the subtitle to Xikolo and marks the subtitle as published.
+    If exactly this version was published before, nothing is sent.
+    @param validate: Check the subtitle with `validate_subtitle_for_publishing` first, unless that was done already
+    @return: Whether the subtitle was published, and a human-readable message
+    """
+    if validate:
+        valid, message = validate_subtitle_for_publishing(subtitle)
+        if not valid:
+            return False, message
+
     tenant = subtitle.tenant
 
     automatic = 'true' if subtitle.is_automatic else 'false'
@@ -728,40 +750,103 @@ def publish_subtitle_to_xikolo(request, subtitle_id):
     try:
         # Send subtitle file to API
         # PATCH /videos/{id}/subtitles/{lang}
-        latest_version = (
-            SubtitleFile.objects.filter(
-                subtitle=subtitle).order_by("-date").first()
-        )
-        with io.open(latest_version.file.path, "r", encoding="utf-8") as file:
-            text = file.read()
+        if not subtitle.latest_file:
+            return False, f"Subtitle has no version to publish (subtitle-id: {subtitle.pk})"
+
+        text = subtitle.latest_content
         encoded_data = text.encode(encoding="UTF-8", errors="strict")
-        response = requests.patch(
+
+        published_hash = get_published_hash(encoded_data, subtitle.is_automatic)
+        if subtitle.published_hash == published_hash:
+            if subtitle.status != Subtitle.SubtitleStatus.PUBLISHED:
+                subtitle.status = Subtitle.SubtitleStatus.PUBLISHED
+                subtitle.save()
+
+            return True, "Latest subtitle version is already published."
+
+        response = XikoloClient.for_tenant(tenant).patch(
             url,
             encoded_data,
-            headers={
-                "Authorization": "Bearer " + tenant.XIKOLO_API_TOKEN,
-                "Content-Type": "text/vtt; charset=utf-8",
-            },
+            headers={"Content-Type": "text/vtt; charset=utf-8"},
         )
         # Change status to Published
         if response.status_code == 200:
+            # The subtitle list of the video changed
+            forget_xikolo_response(tenant, tenant.XIKOLO_API_URL + "videos/" + subtitle.video.ext_id)
+
             subtitle.status = Subtitle.SubtitleStatus.PUBLISHED
+            subtitle.published_hash = published_hash
             subtitle.save()
-            messages.success(request, "Latest subtitle version was published.")
 
-            return True
+            return True, "Latest subtitle version was published."
         else:
             human_error_message = ""
             if response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY:
                 human_error_message = "Please check the validity of the vtt file. "
 
-            messages.error(
-                request, f"An error occurred while publishing to {tenant.name}. "
-                         f"{human_error_message}"
-                         f"(Status code: {response.status_code}, subtitle-id: {subtitle.pk})"
-            )
+            return False, (f"An error occurred while publishing to {tenant.name}. "
+                           f"{human_error_message}"
+                           f"(Status code: {response.status_code}, subtitle-id: {subtitle.pk})")
 
     except FileNotFoundError as exception:
-        messages.error(request, f"FileNotFoundError: {exception} (subtitle-id: {subtitle.pk})")
+        return False, f"FileNotFoundError: {exception} (subtitle-id: {subtitle.pk})"
     except requests.ConnectionError as exception:
-        messages.error(request, f"ConnectionError: {exception} (subtitle-id: {subtitle.pk})")
+        return False, f"ConnectionError: {exception} (subtitle-id: {subtitle.pk})"
+
+
+def publish_subtitle_to_xikolo(request, subtitle_id):
+    subtitle = get_object_or_404(Subtitle.objects.select_related('latest_file'), pk=subtitle_id)
+
+    published, message = publish_subtitle(subtitle)
+
+    if published:
+        messages.success(request, message)
+        return True
+
+    messages.error(request, message)
+
+
+def run_bulk_publish_job(job_id):
+    """
+    Publishes the subtitles of a `BulkPublishJob` concurrently, at most `Tenant.XIKOLO_MAX_PARALLEL_WORKERS` at a
+    time, and records the result of every subtitle on the job as soon as it is known.
+    """
+    job = BulkPublishJob.objects.get(pk=job_id)
+    tenant = job.tenant
+
+    job.status = BulkPublishJob.Status.IN_PROGRESS
+    job.save(update_fields=['status'])
+
+    subtitles = Subtitle.objects.filter(tenant=tenant, pk__in=job.subtitle_ids) \
+        .select_related('video', 'language', 'latest_file')
+
+    def publish(subtitle):
+        try:
+            return subtitle, publish_subtitle(subtitle, validate=False)
+        except Exception as exception:
+            capture_message(f"Bulk publish of subtitle {subtitle.pk} failed: {exception}")
+            return subtitle, (False, f"{type(exception).__name__}: {exception} (subtitle-id: {subtitle.pk})")
+
+    try:
+        # Invalid files fail right away, before any of the subtitles is sent
+        valid_subtitles = []
+        for subtitle in subtitles:
+            valid, message = validate_subtitle_for_publishing(subtitle)
+            if valid:
+                valid_subtitles.append(subtitle)
+            else:
+                job.results[str(subtitle.pk)] = {'published': False, 'message': message}
+        BulkPublishJob.objects.filter(pk=job.pk).update(results=job.results)
+
+        for subtitle, (published, message) in bounded_thread_map(publish, valid_subtitles,
+                                                                 get_xikolo_max_parallel_workers(tenant)):
+            job.results[str(subtitle.pk)] = {'published': published, 'message': message}
+            BulkPublishJob.objects.filter(pk=job.pk).update(results=job.results)
+    except Exception:
+        job.status = BulkPublishJob.Status.ERROR
+        raise
+    else:
+        job.status = BulkPublishJob.Status.FINISHED
+    finally:
+        job.finished = timezone.now()
+        job.save(update_fields=['status', 'finished', 'results'])
@@ -0,0 +1,163 @@
+"""Pooled HTTP client for the Xikolo API of a tenant, with a sync (requests) and an asyncio (httpx) interface"""
+
+import asyncio
+import importlib.util
+import threading
+import weakref
+from typing import Iterable, List
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from core.exceptions import SecretNotFound
+from core.models import Tenant
+from core.rate_limit import Provider
+from core.resilience import DEFAULT_TIMEOUT, acall_provider, call_provider
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_XIKOLO_MAX_PARALLEL_WORKERS = 4
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def get_xikolo_max_parallel_workers(tenant: Tenant) -> int:
+    try:
+        return max(1, int(tenant.XIKOLO_MAX_PARALLEL_WORKERS))
+    except (SecretNotFound, TypeError, ValueError):
+        return DEFAULT_XIKOLO_MAX_PARALLEL_WORKERS
+
+
+class XikoloClient:
+    """
+    Client for the Xikolo API of one tenant, shared by all threads of the process (see `for_tenant`).
+
+    The sync methods use a keep-alive `requests.Session` whose pool is sized to `Tenant.XIKOLO_MAX_PARALLEL_WORKERS`.
+    The async methods use one `httpx.AsyncClient` per event loop, with HTTP/2 if `h2` is installed and
+    `settings.XIKOLO_HTTP2` is not disabled. Without httpx the sync methods are run in a thread instead.
+
+    Paths are resolved against `Tenant.XIKOLO_API_URL`, absolute URLs (e.g. `next` links) are used as they are.
+    If the client belongs to a tenant, every request is rate limited and guarded by the circuit breaker of the
+    tenant, and idempotent requests are retried on transient errors (see `core.resilience`).
+    """
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, base_url, token, max_workers=DEFAULT_XIKOLO_MAX_PARALLEL_WORKERS, tenant: Tenant = None):
+        self.tenant = tenant
+        self.base_url = base_url
+        self.token = token
+        self.max_workers = max_workers
+        self.headers = {"Authorization": "Bearer " + token}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(self.headers)
+
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def for_tenant(cls, tenant: Tenant) -> 'XikoloClient':
+        """
+        Returns the client of the tenant, the client is rebuilt if the API url or token changes.
+        """
+        base_url = tenant.XIKOLO_API_URL
+        token = tenant.XIKOLO_API_TOKEN
+
+        with cls._clients_lock:
+            client = cls._clients.get(tenant.pk)
+
+            if client is None or client.base_url != base_url or client.token != token:
+                client = cls(base_url, token, get_xikolo_max_parallel_workers(tenant), tenant=tenant)
+                cls._clients[tenant.pk] = client
+
+        return client
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path
+
+    # Sync API
+
+    def request(self, method, path, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+
+        return call_provider(self.tenant, Provider.XIKOLO, self.session.request, method, self.url(path),
+                             idempotent=method in IDEMPOTENT_METHODS, **kwargs)
+
+    def get(self, path, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def patch(self, path, data=None, **kwargs) -> requests.Response:
+        return self.request("PATCH", path, data=data, **kwargs)
+
+    # Async API
+
+    @property
+    def http2(self):
+        return getattr(settings, 'XIKOLO_HTTP2', True) and importlib.util.find_spec('h2') is not None
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.headers,
+                http2=self.http2,
+                limits=httpx.Limits(max_connections=self.max_workers, max_keepalive_connections=self.max_workers),
+            )
+            self._async_clients[loop] = client
+
+        return client
+
+    async def arequest(self, method, path, **kwargs):
+        """
+        Returns a `httpx.Response`, or a `requests.Response` if httpx is not installed.
+        Both offer `status_code`, `headers`, `content`, `text`, `json()` and `raise_for_status()`.
+        """
+        if httpx is None:
+            return await asyncio.to_thread(self.request, method, path, **kwargs)
+
+        if 'data' in kwargs and isinstance(kwargs['data'], (bytes, str)):
+            kwargs['content'] = kwargs.pop('data')
+
+        kwargs.setdefault('timeout', httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0]))
+
+        return await acall_provider(self.tenant, Provider.XIKOLO, self._get_async_client().request, method,
+                                    self.url(path), idempotent=method in IDEMPOTENT_METHODS,
+                                    transient_exceptions=(httpx.TransportError,), **kwargs)
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest("GET", path, **kwargs)
+
+    async def apatch(self, path, data=None, **kwargs):
+        return await self.arequest("PATCH", path, data=data, **kwargs)
+
+    async def aget_many(self, paths: Iterable[str], **kwargs) -> List:
+        """
+        GETs all paths concurrently, with at most `max_workers` requests in flight, in input order.
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def bounded_get(path):
+            async with semaphore:
+                return await self.aget(path, **kwargs)
+
+        return await asyncio.gather(*(bounded_get(path) for path in paths))
+
+    async def aclose(self):
+        """
+        Closes the async client of the running event loop, call it before the loop is closed.
+        """
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
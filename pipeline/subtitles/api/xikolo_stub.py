@@ -0,0 +1,109 @@
+"""Local stub of the Xikolo API, used to test `XikoloClient` and to measure its throughput"""
+
+import hashlib
+import json
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_SUBTITLE_LANGUAGES = ['en', 'de']
+
+STUB_WEBVTT = "WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.500\nHello from {video_id}\n"
+
+
+class XikoloStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.count_request(self)
+        parts = self.path.split("?")[0].strip("/").split("/")
+
+        if len(parts) == 2 and parts[0] == "courses" and parts[1] in self.server.courses:
+            return self.send_body(json.dumps(self.server.courses[parts[1]]), "application/json")
+
+        if len(parts) == 2 and parts[0] == "videos":
+            body = json.dumps({
+                "id": parts[1],
+                "summary": "",
+                "urls": {"hd": f"http://stub/{parts[1]}.mp4", "sd": None, "hls": None},
+                "subtitles": [{"language": language, "automatic": False} for language in STUB_SUBTITLE_LANGUAGES],
+            })
+            return self.send_body(body, "application/json")
+
+        if len(parts) == 4 and parts[0] == "videos" and parts[2] == "subtitles":
+            body = self.server.subtitles.get((parts[1], parts[3]), STUB_WEBVTT.format(video_id=parts[1]))
+            return self.send_body(body, "text/vtt; charset=utf-8")
+
+        self.send_body("", "text/plain", HTTPStatus.NOT_FOUND)
+
+    def do_PATCH(self):
+        self.server.count_request(self)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        with self.server.lock:
+            self.server.patches.append((self.path, body))
+
+        self.send_body("", "text/plain")
+
+    def send_body(self, body, content_type, status=HTTPStatus.OK):
+        data = body.encode("utf-8")
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.command == "GET" and status == HTTPStatus.OK and self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class XikoloStubServer(ThreadingHTTPServer):
+    """
+    Serves `courses/{id}` of the entries in `courses`, `videos/{id}`, `videos/{id}/subtitles/{lang}` (GET and
+    PATCH, the content is taken from `subtitles` by (id, lang) if it is there) on localhost.
+    Every response is delayed by `latency` seconds to simulate the network.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(("127.0.0.1", port), XikoloStubHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = set()
+        self.patches = []
+        self.courses = {}
+        self.subtitles = {}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def count_request(self, handler):
+        with self.lock:
+            self.requests += 1
+            self.connections.add(handler.client_address)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,261 @@
+"""Concurrent synchronization of a course structure (sections and videos) from Xikolo"""
+
+import logging
+from typing import List, Optional
+
+import celery
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Tenant
+from core.utils import bounded_thread_map
+from .xikolo_api import get_video_languages, update_video_detail, xikolo_get, remember_xikolo_response, \
+    forget_xikolo_response
+from .xikolo_client import get_xikolo_max_parallel_workers
+from ..models import Course, CourseSection, Video
+from ..models.course import SyncStatusChoices
+
+logger = logging.getLogger(__name__)
+
+
+class XikoloCourseSync:
+    """
+    Synchronizes the sections and videos of a course with Xikolo.
+
+    Sections and videos are written with one bulk upsert each, the synchronous deep fetch of video details is
+    processed by a pool of at most `Tenant.XIKOLO_MAX_PARALLEL_WORKERS` threads, all HTTP calls go through the
+    pooled `XikoloClient` of the tenant.
+    The progress is reported through `Course.sync_status` and `Course.sync_data`.
+
+    If Xikolo answers the course request with a 304 and the last sync succeeded, the course structure is
+    taken from the DB instead of being written again.
+
+    Videos in `changed_video_ext_ids` are known to have changed, e.g. by a pushed event, so their memoized
+    details are not reused.
+    """
+
+    def __init__(self, course: Course, disable_deep_fetch=False, changed_video_ext_ids=()):
+        self.course = course
+        self.tenant: Tenant = course.tenant
+        self.disable_deep_fetch = disable_deep_fetch
+        self.changed_video_ext_ids = set(changed_video_ext_ids)
+        self.previous_sync_status = course.sync_status
+
+        self.max_workers = get_xikolo_max_parallel_workers(self.tenant)
+
+    def run(self) -> List[Video]:
+        assert self.tenant
+
+        self.set_status(SyncStatusChoices.IN_PROGRESS, started=str(timezone.now()), finished=None,
+                        sections_total=0, sections_done=0, videos_total=0, videos_done=0, videos_deprecated=0,
+                        videos_undeprecated=0)
+
+        try:
+            videos = self.sync()
+        except Exception:
+            self.set_status(SyncStatusChoices.ERROR, finished=str(timezone.now()))
+            raise
+
+        if videos is None:
+            self.set_status(SyncStatusChoices.ERROR, finished=str(timezone.now()))
+            return []
+
+        self.set_status(SyncStatusChoices.SUCCESS, finished=str(timezone.now()))
+
+        return videos
+
+    def sync(self) -> Optional[List[Video]]:
+        course = self.course
+
+        for video_ext_id in self.changed_video_ext_ids:
+            forget_xikolo_response(self.tenant, self.tenant.get_secret('XIKOLO_API_URL') + "videos/" + video_ext_id)
+
+        # GET /courses/{id}
+        # The structure can only be taken from the DB if the last sync wrote it completely
+        response = xikolo_get(self.tenant, self.tenant.get_secret('XIKOLO_API_URL') + "courses/" + course.ext_id,
+                              scope="course-sync", conditional=self.previous_sync_status == SyncStatusChoices.SUCCESS)
+
+        if response.not_modified:
+            video_entries = self.get_local_video_entries()
+            self.update_progress(structure_not_modified=True, sections_total=0, sections_done=0,
+                                 videos_total=len(video_entries))
+        elif response.status_code != 200:
+            self.update_progress(http_status=response.status_code)
+            return None
+        else:
+            video_entries = self.sync_structure(response.json())
+            self.update_progress(structure_not_modified=False)
+
+        if video_entries:
+            languages_of_video = get_video_languages(self.tenant, video_entries[0][1]["id"])
+            course.add_languages(l['language'] for l in languages_of_video)
+
+        if not self.disable_deep_fetch:
+            self.deep_fetch(video_entries)
+
+        remember_xikolo_response(response)
+
+        return [video for video, _ in video_entries]
+
+    def sync_video(self, video_ext_id) -> Optional[Video]:
+        """
+        Writes a single video and its section, e.g. for a deep link to a video that is not known yet.
+        The details of the video are fetched by a task, the rest of the course is left to `run`. The sync status of
+        the course is not changed.
+        @return: The video, or None if it is not part of the course
+        """
+        # GET /courses/{id}
+        response = xikolo_get(self.tenant, self.tenant.get_secret('XIKOLO_API_URL') + "courses/" + self.course.ext_id,
+                              memoize=True)
+        response.raise_for_status()
+
+        for section_idx, course_section_entry in enumerate(response.json()["sections"]):
+            if any(video_entry["id"] == video_ext_id for video_entry in course_section_entry["videos"]):
+                break
+        else:
+            return None
+
+        [(video, _)] = self.upsert_sections_and_videos([(section_idx, course_section_entry)],
+                                                       video_ext_ids={video_ext_id})
+        celery.current_app.send_task('core.tasks.task_update_video_detail', args=(video.id, video_ext_id))
+
+        return video
+
+    def sync_structure(self, j):
+        course = self.course
+
+        # Save teacher in course, prefer alternative_teacher_text, but fall back to normal teacher list.
+        course.teacher = j["alternative_teacher_text"] or ', '.join(t['name'] for t in j['teachers'])
+        course.save(update_fields=['teacher'])
+
+        section_entries = list(enumerate(j["sections"]))
+        self.update_progress(sections_total=len(section_entries),
+                             videos_total=sum(len(s["videos"]) for _, s in section_entries))
+
+        seen_ext_ids = {video_entry["id"] for _, s in section_entries for video_entry in s["videos"]}
+        videos_undeprecated = Video.objects.filter(tenant=self.tenant, ext_id__in=seen_ext_ids, deprecated=True) \
+            .count()
+
+        video_entries = self.upsert_sections_and_videos(section_entries)
+
+        self.update_progress(sections_done=len(section_entries))
+
+        videos_deprecated = self.deprecate_removed_videos(seen_ext_ids)
+        self.update_progress(videos_deprecated=videos_deprecated, videos_undeprecated=videos_undeprecated)
+
+        return video_entries
+
+    def get_local_video_entries(self):
+        videos = Video.objects.filter(course_section__course=self.course, deprecated=False) \
+            .order_by('course_section__index', 'index')
+
+        return [(video, {'id': video.ext_id}) for video in videos]
+
+    @transaction.atomic
+    def upsert_sections_and_videos(self, section_entries, video_ext_ids=None):
+        """
+        Writes all sections and videos of the course with one `INSERT ... ON CONFLICT DO UPDATE` each.
+        Video details (urls, summary) are not part of the course response and are left untouched for
+        existing videos, the deep fetch fills them in. With `video_ext_ids` only these videos are written.
+        @return: List of (video, video_entry) in course order
+        """
+        tenant = self.tenant
+
+        sections = [
+            CourseSection(
+                ext_id=course_section_entry["id"],
+                title=course_section_entry["title"],
+                course=self.course,
+                tenant=tenant,
+                index=section_idx,
+            )
+            for section_idx, course_section_entry in section_entries
+        ]
+
+        CourseSection.objects.bulk_create(sections, update_conflicts=True, unique_fields=['tenant', 'ext_id'],
+                                          update_fields=['title', 'course', 'index'])
+
+        # bulk_create does not return the primary keys of updated rows, so fetch them again
+        sections_by_ext_id = {
+            section.ext_id: section
+            for section in CourseSection.objects.filter(tenant=tenant, ext_id__in=[s.ext_id for s in sections])
+        }
+
+        video_entries = [
+            (sections_by_ext_id[course_section_entry["id"]], video_idx, video_entry)
+            for _, course_section_entry in section_entries
+            for video_idx, video_entry in enumerate(course_section_entry["videos"])
+            if video_ext_ids is None or video_entry["id"] in video_ext_ids
+        ]
+
+        videos = [
+            Video(
+                ext_id=video_entry["id"],
+                title=video_entry["title"],
+                original_language=self.course.language,
+                pub_date=video_entry["start-date"],
+                course_section=course_section,
+                index=video_idx,
+                item_id=video_entry['item-id'],
+                deprecated=False,
+                tenant=tenant,
+            )
+            for course_section, video_idx, video_entry in video_entries
+        ]
+
+        Video.objects.bulk_create(videos, update_conflicts=True, unique_fields=['tenant', 'ext_id'],
+                                  update_fields=['title', 'original_language', 'pub_date', 'course_section', 'index',
+                                                 'item_id', 'deprecated'])
+
+        videos_by_ext_id = {
+            video.ext_id: video
+            for video in Video.objects.filter(tenant=tenant, ext_id__in=[v.ext_id for v in videos])
+        }
+
+        return [(videos_by_ext_id[video_entry["id"]], video_entry) for _, _, video_entry in video_entries]
+
+    def deep_fetch(self, video_entries):
+        if getattr(settings, 'XIKOLO_ASYNC_VIDEO_DETAIL_FETCH', True):
+            for video, video_entry in video_entries:
+                # Another worker may still have memoized the details of a changed video
+                if video_entry["id"] in self.changed_video_ext_ids:
+                    task_name = 'core.tasks.task_refresh_video_detail'
+                else:
+                    task_name = 'core.tasks.task_update_video_detail'
+
+                celery.current_app.send_task(task_name, args=(video.id, video_entry["id"]))
+
+            self.update_progress(videos_done=len(video_entries))
+            return
+
+        def fetch_detail(video_and_entry):
+            video, video_entry = video_and_entry
+            # Already one of max_workers threads, so the subtitles of the video are downloaded one after another
+            update_video_detail(video.id, video_entry['id'], max_workers=1)
+
+        for videos_done, _ in enumerate(bounded_thread_map(fetch_detail, video_entries, self.max_workers), start=1):
+            self.update_progress(videos_done=videos_done)
+
+    def deprecate_removed_videos(self, seen_ext_ids):
+        """
+        Marks all videos of the course as deprecated that were not part of the course response.
+        @return: Number of deprecated videos
+        """
+        videos_deprecated = Video.objects.filter(course_section__course=self.course, deprecated=False) \
+            .exclude(ext_id__in=seen_ext_ids) \
+            .update(deprecated=True)
+
+        if videos_deprecated:
+            logger.info("Deprecated %d videos of course %s", videos_deprecated, self.course)
+
+        return videos_deprecated
+
+    def update_progress(self, **progress):
+        self.course.sync_data.update(progress)
+        Course.objects.filter(pk=self.course.pk).update(sync_data=self.course.sync_data)
+
+    def set_status(self, sync_status, **progress):
+        self.course.sync_status = sync_status
+        self.course.sync_data.update(progress)
+        Course.objects.filter(pk=self.course.pk).update(sync_status=sync_status, sync_data=self.course.sync_data)
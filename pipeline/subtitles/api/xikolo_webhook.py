@@ -0,0 +1,149 @@
+"""Ingestion of change events pushed by Xikolo, which queue targeted refreshes instead of full course syncs"""
+
+import hashlib
+import hmac
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+import celery
+from django.conf import settings
+from django.core.cache import cache
+
+from core.exceptions import SecretNotFound
+from core.models import Tenant
+from ..models import Course, Subtitle, Video
+from ..models.course import SyncStatusChoices
+
+XIKOLO_SIGNATURE_HEADER = "HTTP_X_XIKOLO_SIGNATURE"
+XIKOLO_TIMESTAMP_HEADER = "HTTP_X_XIKOLO_TIMESTAMP"
+
+# Seconds a signed request is accepted after (or before) its timestamp
+XIKOLO_WEBHOOK_TOLERANCE = getattr(settings, 'XIKOLO_WEBHOOK_TOLERANCE', 300)
+
+# Events that change the structure of a course (sections, videos), and therefore need a sync of the course
+COURSE_EVENTS = {"course.created", "course.updated", "course.changed", "section.created", "section.updated",
+                 "section.deleted", "video.created", "video.deleted"}
+
+# Events that only change the details (urls, summary, subtitle list) of a single video
+VIDEO_EVENTS = {"video.updated", "video.changed", "subtitle.created", "subtitle.updated", "subtitle.deleted"}
+
+# Events that change the content of a single subtitle, given by `video_id` and `language`
+SUBTITLE_EVENTS = {"subtitle.updated"}
+
+
+def verify_xikolo_signature(tenant: Tenant, body: bytes, signature: str, timestamp: str, now=None) -> bool:
+    """
+    Checks the `X-Xikolo-Signature` header, the hex HMAC-SHA256 of `{timestamp}.{body}` with the
+    `XIKOLO_WEBHOOK_SECRET` of the tenant, optionally prefixed with `sha256=`. `timestamp` is the
+    `X-Xikolo-Timestamp` header in seconds since the epoch.
+
+    Requests are only accepted within `XIKOLO_WEBHOOK_TOLERANCE` seconds of their timestamp, and only once.
+    """
+    try:
+        secret = tenant.get_secret('XIKOLO_WEBHOOK_SECRET')
+    except SecretNotFound:
+        return False
+
+    if not secret or not signature:
+        return False
+
+    try:
+        signed_at = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+
+    now = time.time() if now is None else now
+    if abs(now - signed_at) > XIKOLO_WEBHOOK_TOLERANCE:
+        return False
+
+    signature = signature.removeprefix("sha256=")
+    expected = hmac.new(secret.encode("utf-8"), f"{signed_at}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        return False
+
+    # A replayed request has a signature that was already seen within the tolerance
+    return cache.add(f"xikolo-webhook:{tenant.pk}:{signature}", True, 2 * XIKOLO_WEBHOOK_TOLERANCE)
+
+
+def plan_xikolo_refreshes(tenant: Tenant, events: Iterable[dict]) \
+        -> Tuple[Dict[int, Set[str]], Set[Tuple[int, str]], Set[int]]:
+    """
+    Maps change events to the courses, videos and subtitles that have to be refreshed.
+    Every object is refreshed once, even if several events of a batch affect it.
+
+    Events of courses that are not part of transpipe (or only skeletons) are ignored. A video event of a video
+    that is not known yet refreshes its course, which creates the video. A changed subtitle is downloaded again,
+    the details of its video only create subtitles that are not known yet.
+
+    A video of a course that is synced anyway is updated by the sync, which must not reuse its memoized details.
+
+    @return: (ext_ids of the changed videos by id of the courses to sync, (id, ext_id) of videos to update,
+              ids of subtitles to download again)
+    """
+    course_ids = {}
+    video_ids = set()
+    subtitle_ids = set()
+
+    for event in events:
+        event_type = event.get("event", "")
+        course_ext_id = event.get("course_id")
+        video_ext_id = event.get("video_id")
+
+        if event_type in SUBTITLE_EVENTS and video_ext_id and event.get("language"):
+            pks = Subtitle.objects.filter(tenant=tenant, video__ext_id=video_ext_id,
+                                          language_id=event["language"]).values_list('pk', flat=True)
+            if pks:
+                subtitle_ids.update(pks)
+                continue
+
+        if event_type in VIDEO_EVENTS and video_ext_id:
+            video = Video.objects.filter(tenant=tenant, ext_id=video_ext_id).first()
+
+            if video:
+                video_ids.add((video.pk, video.ext_id))
+                continue
+
+            if not course_ext_id:
+                continue
+
+        elif event_type not in COURSE_EVENTS or not course_ext_id:
+            continue
+
+        course = Course.objects.filter(tenant=tenant, ext_id=course_ext_id) \
+            .exclude(sync_status=SyncStatusChoices.SKELETON).first()
+
+        if course:
+            course_ids.setdefault(course.pk, set())
+
+    # A sync of the course updates its videos anyway
+    if course_ids and video_ids:
+        covered = dict(Video.objects.filter(pk__in=[pk for pk, _ in video_ids],
+                                            course_section__course_id__in=course_ids)
+                       .values_list('pk', 'course_section__course_id'))
+
+        for pk, ext_id in video_ids:
+            if pk in covered:
+                course_ids[covered[pk]].add(ext_id)
+
+        video_ids = {(pk, ext_id) for pk, ext_id in video_ids if pk not in covered}
+
+    return course_ids, video_ids, subtitle_ids
+
+
+def queue_xikolo_refreshes(tenant: Tenant, events: List[dict]) -> int:
+    """
+    Queues a refresh task for every course, video and subtitle affected by the events.
+    @return: Number of queued tasks
+    """
+    course_ids, video_ids, subtitle_ids = plan_xikolo_refreshes(tenant, events)
+
+    for course_id, changed_video_ext_ids in course_ids.items():
+        celery.current_app.send_task('core.tasks.task_sync_course', args=(course_id, sorted(changed_video_ext_ids)))
+
+    for video_id, ext_video_id in video_ids:
+        celery.current_app.send_task('core.tasks.task_refresh_video_detail', args=(video_id, ext_video_id))
+
+    for subtitle_id in sorted(subtitle_ids):
+        celery.current_app.send_task('core.tasks.task_refresh_subtitle', args=(subtitle_id,))
+
+    return len(course_ids) + len(video_ids) + len(subtitle_ids)
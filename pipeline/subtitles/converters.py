@@ -0,0 +1,113 @@
+"""Conversion of cue streams into other subtitle formats, chunk by chunk so no whole document is built in memory"""
+
+import io
+import json
+import re
+import zipfile
+from typing import Callable, Iterable, Iterator, NamedTuple, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from .cues import Cue, format_timestamp, iter_vtt
+
+# Cue text tags like <i>, <v Speaker> or <00:00:01.000>, which only WebVTT and partly SRT understand
+CUE_TAG_PATTERN = re.compile(r'</?[^>]*>')
+
+
+def iter_srt(cues: Iterable[Cue], language=None) -> Iterator[str]:
+    for number, cue in enumerate(cues, start=1):
+        yield f"{number}\n{format_timestamp(cue.start).replace('.', ',')} --> " \
+              f"{format_timestamp(cue.end).replace('.', ',')}\n{cue.text}\n\n"
+
+
+def iter_ttml(cues: Iterable[Cue], language=None) -> Iterator[str]:
+    """
+    Timed Text Markup Language, the W3C successor of DFXP that is read by DFXP players as well.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n' \
+          f'<tt xmlns="http://www.w3.org/ns/ttml" xml:lang={quoteattr(language or "")}>\n<body>\n<div>\n'
+
+    for cue in cues:
+        lines = (escape(line) for line in CUE_TAG_PATTERN.sub("", cue.text).split("\n"))
+        yield f'<p begin="{format_timestamp(cue.start)}" end="{format_timestamp(cue.end)}">{"<br/>".join(lines)}</p>\n'
+
+    yield '</div>\n</body>\n</tt>\n'
+
+
+def iter_text(cues: Iterable[Cue], language=None) -> Iterator[str]:
+    """
+    Plain transcript, one cue per line without timings.
+    """
+    for cue in cues:
+        yield " ".join(CUE_TAG_PATTERN.sub("", cue.text).split()) + "\n"
+
+
+def iter_json(cues: Iterable[Cue], language=None) -> Iterator[str]:
+    """
+    `[{"start": 1000, "end": 2500, "text": "..."}, ...]` with the timings in milliseconds.
+    """
+    separator = "[\n"
+    for cue in cues:
+        yield separator + json.dumps({'start': cue.start, 'end': cue.end, 'text': cue.text}, ensure_ascii=False)
+        separator = ",\n"
+
+    yield "\n]\n" if separator != "[\n" else "[]\n"
+
+
+class SubtitleFormat(NamedTuple):
+    extension: str
+    content_type: str
+    convert: Callable[..., Iterator[str]]
+
+
+SUBTITLE_FORMATS = {
+    'vtt': SubtitleFormat('vtt', "text/vtt", lambda cues, language=None: iter_vtt(cues)),
+    'srt': SubtitleFormat('srt', "application/x-subrip", iter_srt),
+    'ttml': SubtitleFormat('ttml', "application/ttml+xml", iter_ttml),
+    'dfxp': SubtitleFormat('dfxp', "application/ttaf+xml", iter_ttml),
+    'txt': SubtitleFormat('txt', "text/plain", iter_text),
+    'json': SubtitleFormat('json', "application/json", iter_json),
+}
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Write-only stream that hands out what was written since the last `pop`. It is not seekable, so `ZipFile`
+    writes the entries with data descriptors instead of seeking back.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[Tuple[str, Iterable[str]]], compression=zipfile.ZIP_DEFLATED) -> Iterator[bytes]:
+    """
+    Streams a ZIP archive of the given (file name, text chunks) entries, the text is encoded as UTF-8.
+    """
+    buffer = _ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as zip_file:
+        for name, chunks in entries:
+            with zip_file.open(name, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk.encode("utf-8"))
+                    # The compressor holds data back, so most chunks are empty
+                    if data := buffer.pop():
+                        yield data
+
+            if data := buffer.pop():
+                yield data
+
+    yield buffer.pop()
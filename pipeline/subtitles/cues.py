@@ -0,0 +1,190 @@
+"""Compact representation of WebVTT cues with a streaming parser and serializer, shared by all subtitle processing"""
+
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .timings import format_timestamps, parse_timestamps
+
+TIMINGS_PATTERN = re.compile(r'\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{3})')
+
+
+class Cue:
+    """
+    A single cue. `start` and `end` are integer milliseconds, which keeps the cues small and the timings exact.
+
+    Parsed cues keep everything that is written back around their timings, so a file survives parsing and writing:
+    the cue `settings` after the timings, the non-cue `blocks` before the cue (header with metadata, NOTE, STYLE and
+    REGION blocks) and, on the last cue, the `trailing_blocks` after it.
+    """
+
+    __slots__ = ('start', 'end', 'text', 'identifier', 'settings', 'blocks', 'trailing_blocks')
+
+    def __init__(self, start: int, end: int, text: str, identifier: Optional[str] = None,
+                 settings: Optional[str] = None, blocks: Tuple[str, ...] = (), trailing_blocks: Tuple[str, ...] = ()):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.identifier = identifier
+        self.settings = settings
+        self.blocks = blocks
+        self.trailing_blocks = trailing_blocks
+
+    def with_timing(self, start: int, end: int) -> 'Cue':
+        return Cue(start, end, self.text, self.identifier, self.settings, self.blocks, self.trailing_blocks)
+
+    def __eq__(self, other):
+        if not isinstance(other, Cue):
+            return NotImplemented
+        return (self.start, self.end, self.text, self.identifier, self.settings, self.blocks,
+                self.trailing_blocks) == (other.start, other.end, other.text, other.identifier, other.settings,
+                                          other.blocks, other.trailing_blocks)
+
+    def __repr__(self):
+        return f"<Cue {format_timestamp(self.start)} --> {format_timestamp(self.end)} {self.text!r}>"
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """
+    Parses `HH:MM:SS.mmm` or `MM:SS.mmm` into milliseconds.
+    """
+    parts = timestamp.strip().replace(",", ".").split(":")
+    seconds, millis = parts[-1].split(".")
+    minutes = int(parts[-2])
+    hours = int(parts[-3]) if len(parts) > 2 else 0
+    return ((hours * 60 + minutes) * 60 + int(seconds)) * 1000 + int(millis)
+
+
+def format_timestamp(millis: int) -> str:
+    seconds, millis = divmod(int(millis), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}.{millis:03}"
+
+
+def _parse_block(lines: List[str]) -> Optional[tuple]:
+    # The timings are on the first line, or on the second one after an identifier
+    for index, line in enumerate(lines[:2]):
+        match = TIMINGS_PATTERN.match(line)
+        if match:
+            settings = line[match.end():].strip() or None
+            return match.group(1), match.group(2), "\n".join(lines[index + 1:]), lines[0] if index else None, settings
+
+    # Header, NOTE, STYLE and REGION blocks
+    return None
+
+
+def _iter_blocks(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    Yields the fields of every cue as soon as the next one starts, the last cue with the blocks that follow it.
+    """
+    blocks = []
+    pending = None
+
+    def end_block(block):
+        nonlocal blocks, pending
+
+        cue = _parse_block(block)
+        if cue is None:
+            # The plain header is written anyway
+            if block != ["WEBVTT"] or pending is not None or blocks:
+                blocks.append("\n".join(block))
+            return None
+
+        finished, pending = pending, cue + (tuple(blocks),)
+        blocks = []
+        return finished
+
+    block = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if line.strip():
+            block.append(line)
+        elif block:
+            finished = end_block(block)
+            if finished is not None:
+                yield finished + ((),)
+            block = []
+
+    if block:
+        finished = end_block(block)
+        if finished is not None:
+            yield finished + ((),)
+
+    if pending is not None:
+        yield pending + (tuple(blocks),)
+
+
+def iter_cues(lines: Iterable[str]) -> Iterator[Cue]:
+    """
+    Parses WebVTT line by line, e.g. from an open file, and yields the cues as soon as they are complete.
+    """
+    for start, end, *fields in _iter_blocks(lines):
+        yield Cue(parse_timestamp(start), parse_timestamp(end), *fields)
+
+
+def parse_vtt(content: str) -> List[Cue]:
+    """
+    Parses complete WebVTT content, the timestamps of all cues are converted at once.
+    """
+    blocks = list(_iter_blocks(content.splitlines()))
+    timings = parse_timestamps([timestamp for block in blocks for timestamp in block[:2]]).tolist()
+
+    return [Cue(start, end, *block[2:]) for block, start, end in zip(blocks, timings[::2], timings[1::2])]
+
+
+def with_timings(cues: Sequence[Cue], starts: np.ndarray, ends: np.ndarray) -> List[Cue]:
+    """
+    @return: Copies of the cues with the given start and end times
+    """
+    return [cue.with_timing(start, end) for cue, start, end in zip(cues, starts.tolist(), ends.tolist())]
+
+
+def _format_cue(number: int, cue: Cue, start: str, end: str, renumber: bool) -> str:
+    timings = f"{start} --> {end} {cue.settings}" if cue.settings else f"{start} --> {end}"
+    header = "WEBVTT" if number == 1 else ""
+
+    if renumber:
+        return f"{header}\n\n{number}\n{timings}\n{cue.text}"
+
+    blocks = cue.blocks
+    # The header of the file is kept with the first cue
+    if blocks and blocks[0].startswith("WEBVTT"):
+        header, blocks = (blocks[0] if number == 1 else ""), blocks[1:]
+
+    return "".join([header] + [f"\n\n{block}" for block in blocks] + [
+        "\n\n" if cue.identifier is None else f"\n\n{cue.identifier}\n", timings, "\n", cue.text,
+    ] + [f"\n\n{block}" for block in cue.trailing_blocks])
+
+
+def iter_vtt(cues: Iterable[Cue], renumber=False) -> Iterator[str]:
+    """
+    Serializes the cues as WebVTT in chunks of one cue each. Parsed cues are written as they were read. With
+    renumber=True the cues are numbered from 1 and only their settings are kept, e.g. when they were assembled from
+    several files.
+    """
+    empty = True
+    for number, cue in enumerate(cues, start=1):
+        empty = False
+        yield _format_cue(number, cue, format_timestamp(cue.start), format_timestamp(cue.end), renumber)
+
+    if empty:
+        yield "WEBVTT"
+
+
+def write_vtt(cues: Sequence[Cue], renumber=False) -> str:
+    """
+    Serializes the cues like `iter_vtt`, the timestamps of all cues are formatted at once.
+    """
+    if not cues:
+        return "WEBVTT"
+
+    timestamps = format_timestamps(np.fromiter((time for cue in cues for time in (cue.start, cue.end)),
+                                               dtype=np.int64, count=2 * len(cues)))
+
+    return "".join(
+        _format_cue(number, cue, start, end, renumber)
+        for number, (cue, start, end) in enumerate(zip(cues, timestamps[::2], timestamps[1::2]), start=1)
+    )
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0041_auto_20231222_1235'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='sync_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
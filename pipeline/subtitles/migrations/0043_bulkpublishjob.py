@@ -0,0 +1,31 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tenant_audescribe_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('subtitles', '0042_course_sync_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkPublishJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('initiated', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('IN_PROGRESS', 'In Progress'), ('FINISHED', 'Finished'), ('ERROR', 'Error')], default='PENDING', max_length=32)),
+                ('subtitle_ids', models.JSONField(blank=True, default=list)),
+                ('results', models.JSONField(blank=True, default=dict)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='subtitles.course')),
+                ('initiated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tenant')),
+            ],
+        ),
+    ]
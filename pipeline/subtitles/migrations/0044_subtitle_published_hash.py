@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0043_bulkpublishjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtitle',
+            name='published_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
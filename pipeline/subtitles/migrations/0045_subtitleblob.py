@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0044_subtitle_published_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubtitleBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(max_length=500, upload_to='subtitles/blobs/')),
+                ('size', models.PositiveIntegerField()),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subtitlefile',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='subtitles.subtitleblob'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+
+def move_subtitle_files_to_blobs(apps, schema_editor):
+    """
+    Stores the content of every existing subtitle file in the blob store. Identical versions share one blob.
+
+    The content is read and hashed as text, like `SubtitleBlob.objects.store` does with the content the runtime
+    reads, so legacy files that only differ in their line endings share a blob with the versions written later.
+    The versions keep pointing to their original files, which are left in place for the reverse migration.
+    """
+    SubtitleFile = apps.get_model('subtitles', 'SubtitleFile')
+    SubtitleBlob = apps.get_model('subtitles', 'SubtitleBlob')
+
+    blobs_by_hash = {}
+    batch = []
+
+    def get_path(name):
+        return name if os.path.isabs(name) else os.path.join(settings.MEDIA_ROOT, name)
+
+    for subtitle_file in SubtitleFile.objects.filter(blob__isnull=True).exclude(file="").exclude(file__isnull=True) \
+            .only('pk', 'file').iterator(chunk_size=1000):
+        path = get_path(subtitle_file.file.name)
+
+        try:
+            # Universal newlines, as the versions are read at runtime
+            with io.open(path, "r", encoding="utf-8") as file:
+                data = file.read().encode("utf-8")
+        except (FileNotFoundError, UnicodeDecodeError) as exception:
+            logger.warning("SubtitleFile %s: %s not moved to the blob store: %s", subtitle_file.pk, path, exception)
+            continue
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob = blobs_by_hash.get(content_hash)
+
+        if blob is None:
+            name = os.path.join("subtitles", "blobs", content_hash[:2], content_hash + ".vtt")
+            blob_path = get_path(name)
+
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                with io.open(blob_path, "wb") as file:
+                    file.write(data)
+
+            blob, _ = SubtitleBlob.objects.get_or_create(hash=content_hash, defaults={'file': name, 'size': len(data)})
+            blobs_by_hash[content_hash] = blob
+
+        subtitle_file.blob = blob
+        batch.append(subtitle_file)
+
+        if len(batch) >= 1000:
+            SubtitleFile.objects.bulk_update(batch, ['blob'])
+            batch = []
+
+    SubtitleFile.objects.bulk_update(batch, ['blob'])
+
+    for blob in blobs_by_hash.values():
+        SubtitleBlob.objects.filter(pk=blob.pk).update(refcount=SubtitleFile.objects.filter(blob=blob).count())
+
+
+def restore_subtitle_files(apps, schema_editor):
+    """
+    Detaches the versions that still point to their original files from the blob store, and removes the blobs
+    that are not referenced anymore.
+    """
+    SubtitleFile = apps.get_model('subtitles', 'SubtitleFile')
+    SubtitleBlob = apps.get_model('subtitles', 'SubtitleBlob')
+
+    SubtitleFile.objects.exclude(blob__isnull=True).exclude(file=F('blob__file')).update(blob=None)
+
+    SubtitleBlob.objects.update(refcount=Coalesce(Subquery(
+        SubtitleFile.objects.filter(blob=OuterRef('pk')).values('blob').annotate(count=Count('pk')).values('count')
+    ), 0))
+
+    for blob in SubtitleBlob.objects.filter(refcount=0):
+        path = os.path.join(settings.MEDIA_ROOT, blob.file.name)
+        if os.path.exists(path):
+            os.remove(path)
+        blob.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0045_subtitleblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_subtitle_files_to_blobs, restore_subtitle_files),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:18
+
+from django.db import migrations, models
+import subtitles.models.subtitle_file
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0046_subtitlefile_blob_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtitlefile',
+            name='delta',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subtitlefile',
+            name='delta_base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=subtitles.models.subtitle_file.KEEP_DELTA_VERSIONS, related_name='+', to='subtitles.subtitlefile'),
+        ),
+        migrations.AddField(
+            model_name='subtitlefile',
+            name='position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE subtitles_subtitlefile
+            SET position = numbered.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY subtitle_id ORDER BY id) - 1 AS position
+                FROM subtitles_subtitlefile
+            ) AS numbered
+            WHERE subtitles_subtitlefile.id = numbered.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def set_latest_file(apps, schema_editor):
+    Subtitle = apps.get_model('subtitles', 'Subtitle')
+    SubtitleFile = apps.get_model('subtitles', 'SubtitleFile')
+
+    Subtitle.objects.update(latest_file=Subquery(
+        SubtitleFile.objects.filter(subtitle=OuterRef('pk')).order_by('-date', '-pk').values('pk')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0047_subtitlefile_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtitle',
+            name='latest_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='subtitles.subtitlefile'),
+        ),
+        migrations.RunPython(set_latest_file, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tenant_audescribe_active'),
+        ('subtitles', '0048_subtitle_latest_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranslationMemory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('MLLP', 'MLLP'), ('AWS_TRANSCRIPTION', 'AWS Transcription'), ('AWS_TRANSLATION', 'AWS Translation'), ('DEEPL', 'DEEPL'), ('AUDESCRIBE_TRANSCRIPTION', 'Audescribe Transcription'), ('OTHER', 'Other')], max_length=128)),
+                ('source_language', models.CharField(max_length=16)),
+                ('target_language', models.CharField(max_length=16)),
+                ('source_hash', models.CharField(max_length=64)),
+                ('source_text', models.TextField()),
+                ('translation', models.TextField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tenant')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='translationmemory',
+            constraint=models.UniqueConstraint(fields=('tenant', 'provider', 'source_language', 'target_language', 'source_hash'), name='unique_translation_memory_segment'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subtitles', '0049_translationmemory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtitlefile',
+            name='source_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='subtitles.subtitlefile'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.10 on 2026-10-18 07:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_tenant_audescribe_active'),
+        ('subtitles', '0050_subtitlefile_source_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XikoloResponseValidator',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_modified', models.CharField(blank=True, max_length=64, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.tenant')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='xikoloresponsevalidator',
+            constraint=models.UniqueConstraint(fields=('tenant', 'key'), name='unique_xikolo_response_validator'),
+        ),
+    ]
@@ -15,6 +15,10 @@ from .subtitle import Subtitle
 from .video import Video
 from .subtitle import Subtitle
 from .subtitle_file import SubtitleFile
+from .subtitle_blob import SubtitleBlob
 from .iso_language import IsoLanguage
 from .subtitle_assignment import SubtitleAssignment
 from .service_provider_use import ServiceProviderUse
+from .bulk_publish_job import BulkPublishJob
+from .translation_memory import TranslationMemory
+from .xikolo_response_validator import XikoloResponseValidator
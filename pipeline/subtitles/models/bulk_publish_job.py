@@ -0,0 +1,52 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class BulkPublishJob(models.Model):
+    """
+    Publishing of several subtitles of a course to the MOOC platform, processed in the background by
+    `core.tasks.task_bulk_publish`. The result of every subtitle is stored in `results` by its id.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        IN_PROGRESS = "IN_PROGRESS", _("In Progress")
+        FINISHED = "FINISHED", _("Finished")
+        ERROR = "ERROR", _("Error")
+
+    tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
+    course = models.ForeignKey("subtitles.Course", on_delete=models.CASCADE)
+    initiated_by = models.ForeignKey("core.TranspipeUser", null=True, blank=True, on_delete=models.SET_NULL)
+    initiated = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    status = models.CharField(max_length=32, choices=Status.choices, default=Status.PENDING)
+    subtitle_ids = models.JSONField(default=list, blank=True)
+    results = models.JSONField(default=dict, blank=True)
+
+    @property
+    def number_of_subtitles(self):
+        return len(self.subtitle_ids)
+
+    @property
+    def number_of_published(self):
+        return sum(1 for result in self.results.values() if result['published'])
+
+    @property
+    def number_of_failed(self):
+        return sum(1 for result in self.results.values() if not result['published'])
+
+    @property
+    def is_done(self):
+        return self.status in {self.Status.FINISHED, self.Status.ERROR}
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'done': self.is_done,
+            'total': self.number_of_subtitles,
+            'published': self.number_of_published,
+            'failed': self.number_of_failed,
+            'results': self.results,
+        }
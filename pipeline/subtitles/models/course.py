@@ -39,6 +39,7 @@ class Course(models.Model):
     tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
 
     sync_status = models.CharField(max_length=200, choices=SyncStatusChoices.choices, default=SyncStatusChoices.INITIAL)
+    sync_data = models.JSONField(default=dict, blank=True)
 
     class Meta:
         permissions = (
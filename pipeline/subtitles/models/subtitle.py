@@ -1,5 +1,3 @@
-import io
-
 from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -48,6 +46,13 @@ class Subtitle(models.Model):
 
     is_automatic = models.BooleanField(default=True)
 
+    # Hash of the content (and automatic flag) that was last published to the MOOC platform
+    published_hash = models.CharField(max_length=64, null=True, blank=True)
+
+    # Newest SubtitleFile, maintained by `SubtitleFile.objects.create_version`
+    latest_file = models.ForeignKey("SubtitleFile", null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name="+")
+
     tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
 
     class Meta:
@@ -60,6 +65,14 @@ class Subtitle(models.Model):
             ('start_workflow_subtitle', "Start workflow"),
         )
 
+    def save(self, *args, **kwargs):
+        # A stale instance must not reset `latest_file` to an older version, so it is only written if asked for
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'latest_file']
+
+        super().save(*args, **kwargs)
+
     @property
     def type(self):
         if self.is_transcript is True:
@@ -69,24 +82,27 @@ class Subtitle(models.Model):
 
     @property
     def latest_content(self):
-        subtitle_file = self.subtitlefile_set.order_by('-date').first()
-
-        if not subtitle_file:
+        if not self.latest_file:
             return ''
 
-        with io.open(subtitle_file.file.path, "r", encoding="utf-8") as file:
-            subtitle_text = file.read()
+        return self.latest_file.content
+
+    def iter_latest_cues(self):
+        if not self.latest_file:
+            return iter(())
 
-        return subtitle_text
+        return self.latest_file.iter_cues()
 
     @property
     def latest_subtitle_file(self):
-        subtitle_file = self.subtitlefile_set.order_by('-date').first()
-
-        if not subtitle_file:
+        if not self.latest_file:
             return None
 
-        return subtitle_file.file.path
+        # Writers keep the latest version in full, a path can only point to a full version anyway
+        if not self.latest_file.blob_id:
+            type(self.latest_file).objects.store_in_full(self.latest_file)
+
+        return self.latest_file.blob.file.path
 
     @property
     def active_subtitle_assignments(self):
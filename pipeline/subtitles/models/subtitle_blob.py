@@ -0,0 +1,82 @@
+import hashlib
+import io
+import os
+
+from django.db import models, transaction
+from django.db.models import F
+from django_cleanup import cleanup
+
+
+def get_subtitle_blob_name(content_hash):
+    return os.path.join("subtitles", "blobs", content_hash[:2], content_hash + ".vtt")
+
+
+class SubtitleBlobManager(models.Manager):
+    def store(self, content: str) -> 'SubtitleBlob':
+        """
+        Returns the blob of the content and counts one more reference to it. The file is only written if the
+        content is not stored yet. Call it in the transaction that saves the reference.
+        """
+        data = content.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        with transaction.atomic():
+            blob, _ = self.select_for_update().get_or_create(hash=content_hash, defaults={
+                'file': get_subtitle_blob_name(content_hash),
+                'size': len(data),
+            })
+
+            # Written while the row is locked, so `prune` cannot delete the file in between
+            if not os.path.exists(blob.file.path):
+                os.makedirs(os.path.dirname(blob.file.path), exist_ok=True)
+                with io.open(blob.file.path, "wb") as file:
+                    file.write(data)
+
+            self.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+            blob.refcount += 1
+
+        return blob
+
+    def release(self, blob_id):
+        self.filter(pk=blob_id, refcount__gt=0).update(refcount=F('refcount') - 1)
+
+    def prune(self) -> int:
+        """
+        Deletes the blobs that are not referenced anymore, together with their files.
+        @return: Number of deleted blobs
+        """
+        deleted = 0
+
+        for blob_id in self.filter(refcount=0).values_list('pk', flat=True):
+            with transaction.atomic():
+                blob = self.select_for_update(skip_locked=True).filter(pk=blob_id, refcount=0).first()
+
+                if blob is None:
+                    continue
+
+                if os.path.exists(blob.file.path):
+                    os.remove(blob.file.path)
+                blob.delete()
+                deleted += 1
+
+        return deleted
+
+
+@cleanup.ignore
+class SubtitleBlob(models.Model):
+    """
+    Content of subtitle versions, stored once per content under its SHA-256 hash and shared by all `SubtitleFile`s
+    with that content. `refcount` is the number of referencing `SubtitleFile`s, unreferenced blobs are removed
+    by `SubtitleBlob.objects.prune()`.
+    """
+
+    hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="subtitles/blobs/", max_length=500)
+    size = models.PositiveIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = SubtitleBlobManager()
+
+    def __str__(self):
+        return f"{self.hash} ({self.refcount} references)"
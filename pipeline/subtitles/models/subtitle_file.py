@@ -1,17 +1,279 @@
+import io
+from typing import Iterator, Tuple
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Subquery
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django_cleanup import cleanup
+
+from core.utils import TTLCache
+
+from .subtitle import Subtitle
+from .subtitle_blob import SubtitleBlob
+from ..cues import Cue, iter_cues, parse_vtt
+from ..versions import apply_delta, make_delta
+
+# Every n-th version of a subtitle is kept as a full snapshot, which bounds the length of the delta chains
+SUBTITLE_SNAPSHOT_INTERVAL = getattr(settings, 'SUBTITLE_SNAPSHOT_INTERVAL', 20)
+
+
+def _get_cached_size(value):
+    # Roughly the characters held, parsed cues add their slots to the text
+    if isinstance(value, str):
+        return len(value)
+    return sum(len(cue.text) + 32 for cue in value)
+
+
+# Content and parsed cues of recently used versions, keyed by ('content' | 'cues', SubtitleFile pk). A version never
+# changes its content, so an entry only has to go when the version is deleted.
+subtitle_content_cache = TTLCache(maxsize=getattr(settings, 'SUBTITLE_CONTENT_CACHE_SIZE', 64 * 1024 * 1024),
+                                  ttl=getattr(settings, 'SUBTITLE_CONTENT_CACHE_TTL', 60 * 60),
+                                  getsizeof=_get_cached_size)
+
+
+def KEEP_DELTA_VERSIONS(collector, field, sub_objs, using):
+    """
+    `on_delete` of `SubtitleFile.delta_base`: Versions stored as a delta against a deleted version are stored in full
+    right before the deletion (see `store_delta_versions_in_full`), unless they are deleted as well.
+    """
+    deleted = collector.data[field.model]
+    bases = {version.pk: version for version in deleted}
+
+    for subtitle_file in sub_objs:
+        if subtitle_file not in deleted:
+            bases[subtitle_file.delta_base_id].__dict__.setdefault('_delta_versions', []).append(subtitle_file)
+
+
+class SubtitleFileManager(models.Manager):
+    def create_version(self, subtitle, content, date=None, commit=True, **fields) -> 'SubtitleFile':
+        """
+        Creates a new version of the subtitle with the given content. The content is stored in the deduplicated
+        blob store, `file` points to the file of the blob. The previous version is replaced by a delta against
+        the new one, unless it is a snapshot.
+
+        With commit=False the version is returned unsaved, e.g. for `bulk_create`. The reference is counted
+        anyway, so save it in the same transaction. Only use it for the first version of a subtitle, and set
+        `Subtitle.latest_file` once it is saved.
+
+        Content downloaded from a provider may be passed as UTF-8 encoded bytes.
+        """
+        # Stored, hashed and cached as text, so the same text is the same blob whoever writes it
+        if isinstance(content, bytes):
+            content = content.decode("utf-8")
+
+        if 'tenant' not in fields:
+            fields.setdefault('tenant_id', subtitle.tenant_id)
+
+        with transaction.atomic():
+            blob = SubtitleBlob.objects.store(content)
+            subtitle_file = self.model(subtitle=subtitle, date=date or timezone.now(), blob=blob, file=blob.file.name,
+                                       **fields)
+
+            if commit:
+                # Versions of a subtitle are created one after another
+                previous = Subtitle.objects.select_for_update(of=('self',)).select_related('latest_file') \
+                    .get(pk=subtitle.pk).latest_file
+                if previous:
+                    subtitle_file.position = previous.position + 1
+                subtitle_file.save()
+
+                Subtitle.objects.filter(pk=subtitle.pk).update(latest_file=subtitle_file)
+                subtitle.latest_file = subtitle_file
+
+                # The new version is about to be read by the editor, translations and publishing
+                transaction.on_commit(lambda: subtitle_content_cache.set(('content', subtitle_file.pk), content))
+
+                if previous and previous.blob_id and previous.position % SUBTITLE_SNAPSHOT_INTERVAL:
+                    self.store_as_delta(previous, subtitle_file)
+
+        return subtitle_file
+
+    def store_as_delta(self, subtitle_file: 'SubtitleFile', base: 'SubtitleFile'):
+        """
+        Replaces the full content of a version by a delta against `base`, the next newer version.
+        """
+        blob_id = subtitle_file.blob_id
+
+        # Both are read the same way as `content` reconstructs them
+        subtitle_file.delta = make_delta(base.content, subtitle_file.content)
+        subtitle_file.delta_base = base
+        subtitle_file.blob = None
+        subtitle_file.file = None
+        subtitle_file.save(update_fields=['delta', 'delta_base', 'blob', 'file'])
+
+        SubtitleBlob.objects.release(blob_id)
+
+    def store_in_full(self, subtitle_file: 'SubtitleFile'):
+        """
+        Replaces the delta of a version by its full content, e.g. before its base is deleted.
+        """
+        blob = SubtitleBlob.objects.store(subtitle_file.content)
+
+        subtitle_file.blob = blob
+        subtitle_file.file = blob.file.name
+        subtitle_file.delta = None
+        subtitle_file.delta_base = None
+        subtitle_file.save(update_fields=['blob', 'file', 'delta', 'delta_base'])
+
+    def compact_history(self, subtitle) -> int:
+        """
+        Stores all versions of the subtitle as deltas, except for the snapshots and the latest version.
+        @return: Number of versions that were replaced by a delta
+        """
+        compacted = 0
+
+        with transaction.atomic():
+            versions = list(self.filter(subtitle=subtitle).order_by('pk').defer('delta'))
 
+            for version, newer_version in zip(versions, versions[1:]):
+                if version.blob_id is None or newer_version.blob_id is None:
+                    continue
+                if version.position % SUBTITLE_SNAPSHOT_INTERVAL == 0:
+                    continue
 
+                self.store_as_delta(version, newer_version)
+                compacted += 1
+
+        return compacted
+
+
+# The file belongs to the blob, which is shared with other versions
+@cleanup.ignore
 class SubtitleFile(models.Model):
-    """ Model for versioning of subtitles files"""
+    """
+    Model for versioning of subtitles files
+
+    The latest version and every `SUBTITLE_SNAPSHOT_INTERVAL`-th version are stored in full (`blob`), the other
+    versions as a cue-level delta against the next newer version (`delta`, `delta_base`). `position` counts the
+    versions of the subtitle that were created before.
+    """
 
     subtitle = models.ForeignKey("Subtitle", on_delete=models.CASCADE)
     date = models.DateTimeField()
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
     file = models.FileField(upload_to="subtitles/", null=True, max_length=500)
+    blob = models.ForeignKey(SubtitleBlob, null=True, blank=True, on_delete=models.PROTECT)
+    delta = models.BinaryField(null=True, blank=True, editable=False)
+    delta_base = models.ForeignKey("self", null=True, blank=True, on_delete=KEEP_DELTA_VERSIONS, related_name="+")
+    position = models.PositiveIntegerField(default=0, editable=False)
+    # Version of the transcript a machine translation was made from
+    source_file = models.ForeignKey("self", null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
 
     tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
 
+    objects = SubtitleFileManager()
+
     def __str__(self):
-        return str(self.subtitle.language) + " Version from " + str(self.date)
\ No newline at end of file
+        return str(self.subtitle.language) + " Version from " + str(self.date)
+
+    @property
+    def content(self) -> str:
+        """
+        Text of this version, reconstructed from the deltas up to the next full version if necessary. Served from
+        `subtitle_content_cache` when the version was read recently.
+        """
+        if self.pk is None:
+            return self._read_content()
+
+        content = subtitle_content_cache.get(('content', self.pk))
+        if content is None:
+            content = self._read_content()
+            subtitle_content_cache.set(('content', self.pk), content)
+
+        return content
+
+    @property
+    def cues(self) -> Tuple[Cue, ...]:
+        """
+        Parsed cues of this version, shared with other readers through `subtitle_content_cache`. Do not modify them.
+        """
+        if self.pk is None:
+            return tuple(parse_vtt(self.content))
+
+        cues = subtitle_content_cache.get(('cues', self.pk))
+        if cues is None:
+            cues = tuple(parse_vtt(self.content))
+            subtitle_content_cache.set(('cues', self.pk), cues)
+
+        return cues
+
+    def iter_cues(self) -> Iterator[Cue]:
+        """
+        Streams the cues of this version. A full version that is not cached is read line by line from its file.
+        """
+        cues = subtitle_content_cache.get(('cues', self.pk)) if self.pk is not None else None
+        if cues is not None:
+            return iter(cues)
+
+        # Deltas are applied to the whole content anyway
+        if self.blob_id is None:
+            return iter(self.cues)
+
+        return self._iter_file_cues()
+
+    def _iter_file_cues(self) -> Iterator[Cue]:
+        with io.open(self.blob.file.path, "r", encoding="utf-8") as file:
+            yield from iter_cues(file)
+
+    def _get_delta_chain(self):
+        """
+        Fetches the versions a delta of this version can be based on with one query: deltas are based on the next
+        newer version, and at the latest every `SUBTITLE_SNAPSHOT_INTERVAL`-th version is stored in full.
+        @return: The newer versions by pk
+        """
+        newer_versions = type(self).objects.filter(subtitle_id=self.subtitle_id, pk__gt=self.pk) \
+            .select_related('blob').order_by('pk')[:SUBTITLE_SNAPSHOT_INTERVAL]
+
+        return {version.pk: version for version in newer_versions}
+
+    def _read_content(self) -> str:
+        deltas = []
+        version = self
+        content = None
+        chain = None
+        while version.blob_id is None and version.delta_base_id is not None:
+            deltas.append(version.delta)
+
+            # A newer version that was read recently saves walking the rest of the chain
+            content = subtitle_content_cache.get(('content', version.delta_base_id))
+            if content is not None:
+                break
+
+            if chain is None:
+                chain = self._get_delta_chain()
+            version = chain.get(version.delta_base_id) or version.delta_base
+
+        if content is None:
+            with io.open(version.blob.file.path, "r", encoding="utf-8") as file:
+                content = file.read()
+
+        for delta in reversed(deltas):
+            content = apply_delta(content, delta)
+
+        return content
+
+
+@receiver(pre_delete, sender=SubtitleFile)
+def store_delta_versions_in_full(sender, instance: SubtitleFile, **kwargs):
+    # Collected by `KEEP_DELTA_VERSIONS`, and only while the deletion actually runs
+    for subtitle_file in instance.__dict__.pop('_delta_versions', ()):
+        SubtitleFile.objects.store_in_full(subtitle_file)
+
+
+@receiver(post_delete, sender=SubtitleFile)
+def release_subtitle_blob(sender, instance: SubtitleFile, **kwargs):
+    subtitle_content_cache.delete(('content', instance.pk))
+    subtitle_content_cache.delete(('cues', instance.pk))
+
+    if instance.blob_id:
+        SubtitleBlob.objects.release(instance.blob_id)
+
+    # The deleted version was the latest one, so the pointer was set to NULL
+    Subtitle.objects.filter(pk=instance.subtitle_id, latest_file__isnull=True).update(
+        latest_file=Subquery(SubtitleFile.objects.filter(subtitle_id=instance.subtitle_id).order_by('-date', '-pk')
+                             .values('pk')[:1])
+    )
@@ -0,0 +1,85 @@
+import hashlib
+from typing import Dict, Iterable
+
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from .service_provider_use import ServiceProviderUse
+
+
+def normalize_segment(text: str) -> str:
+    """
+    Collapses line breaks and runs of whitespace, so the same caption wrapped differently is the same segment.
+    """
+    return " ".join(text.split())
+
+
+def get_segment_hash(segment: str) -> str:
+    return hashlib.sha256(segment.encode("utf-8")).hexdigest()
+
+
+class TranslationMemoryManager(models.Manager):
+    def lookup(self, tenant, provider, source_language, target_language,
+               segments: Iterable[str], count_hits=True) -> Dict[str, str]:
+        """
+        Looks up the translations of normalized segments and, with `count_hits`, counts a hit for each one that is
+        found.
+        @return: Translations by segment, segments without a translation are missing
+        """
+        hashes = {get_segment_hash(segment): segment for segment in set(segments) if segment}
+        if not hashes:
+            return {}
+
+        entries = list(self.filter(tenant=tenant, provider=provider, source_language=source_language,
+                                   target_language=target_language, source_hash__in=hashes)
+                       .values_list('pk', 'source_hash', 'translation'))
+
+        if count_hits:
+            self.filter(pk__in=[pk for pk, _, _ in entries]).update(hits=F('hits') + 1,
+                                                                   last_used=timezone.now())
+
+        return {hashes[source_hash]: translation for _, source_hash, translation in entries}
+
+    def store(self, tenant, provider, source_language, target_language, translations: Dict[str, str]):
+        """
+        Stores the translations of normalized segments, segments that are already stored keep their translation.
+        """
+        self.bulk_create([
+            self.model(tenant=tenant, provider=provider, source_language=source_language,
+                       target_language=target_language, source_hash=get_segment_hash(segment), source_text=segment,
+                       translation=translation)
+            for segment, translation in translations.items() if segment
+        ], ignore_conflicts=True)
+
+
+class TranslationMemory(models.Model):
+    """
+    Machine translations of single captions, so captions that were translated before, e.g. after small fixes of
+    a transcript or in intros repeated across a course, are not sent to the provider again.
+    """
+
+    tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
+    provider = models.CharField(max_length=128, choices=ServiceProviderUse.ServiceProvider.choices)
+    source_language = models.CharField(max_length=16)
+    target_language = models.CharField(max_length=16)
+
+    # SHA-256 of `source_text`, which is normalized by `normalize_segment`
+    source_hash = models.CharField(max_length=64)
+    source_text = models.TextField()
+    translation = models.TextField()
+
+    hits = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now)
+
+    objects = TranslationMemoryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'provider', 'source_language', 'target_language', 'source_hash'],
+                                    name='unique_translation_memory_segment'),
+        ]
+
+    def __str__(self):
+        return f"{self.source_language}->{self.target_language} ({self.provider}): {self.source_text[:50]}"
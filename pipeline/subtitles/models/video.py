@@ -95,7 +95,7 @@ class Video(models.Model):
 
     @cached_property
     def current_transcript(self):
-        return self.subtitle_set.filter(is_transcript=True).order_by('-pk').first()
+        return self.subtitle_set.filter(is_transcript=True).select_related('latest_file').order_by('-pk').first()
 
     @property
     def platform_link(self):
@@ -0,0 +1,23 @@
+from django.db import models
+
+
+class XikoloResponseValidator(models.Model):
+    """
+    ETag and Last-Modified of the last processed response of a Xikolo resource, per tenant, URL and scope (see
+    `xikolo_get`). One row per resource and scope, the response bodies are not stored.
+    """
+
+    tenant = models.ForeignKey("core.Tenant", on_delete=models.CASCADE, db_index=True)
+    # SHA-256 of the scope and the URL
+    key = models.CharField(max_length=64)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'key'], name='unique_xikolo_response_validator'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.etag or self.last_modified})"
@@ -0,0 +1,138 @@
+"""Incremental re-translation, which only translates the cues of a transcript that changed since its last translation"""
+
+from difflib import SequenceMatcher
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cues import Cue, with_timings
+from .models import Subtitle, SubtitleFile
+from .models.translation_memory import normalize_segment
+from .segmentation import MAX_LINE_LENGTH, resegment
+from .timings import clip_overlaps, get_timings
+
+
+class RetranslationPlan(NamedTuple):
+    # Mask of the cues of the transcript that have to be translated
+    send: np.ndarray
+    # Mask of the cues of the previous translation that are kept
+    keep: np.ndarray
+
+
+def _merge_intervals(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    @return: Start and end times of the union of the intervals, sorted and disjoint
+    """
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+
+    # An interval begins a new one if it starts after all previous ones ended
+    begins = np.flatnonzero(np.concatenate(([True], starts[1:] > ends[:-1])))
+    return starts[begins], ends[np.append(begins[1:] - 1, len(starts) - 1)]
+
+
+def _find_overlapping(starts: np.ndarray, ends: np.ndarray, interval_starts: np.ndarray,
+                      interval_ends: np.ndarray) -> np.ndarray:
+    """
+    @return: Mask of the cues that overlap at least one of the intervals
+    """
+    if not len(interval_starts):
+        return np.zeros(len(starts), dtype=bool)
+
+    merged_starts, merged_ends = _merge_intervals(interval_starts, interval_ends)
+
+    # Of the disjoint intervals, only the last one that starts before the cue ends can reach back into the cue
+    candidates = np.searchsorted(merged_starts, ends, side='left') - 1
+    return (candidates >= 0) & (merged_ends[np.maximum(candidates, 0)] > starts)
+
+
+def plan_retranslation(previous_source: Sequence[Cue], source: Sequence[Cue],
+                       translation: Sequence[Cue]) -> RetranslationPlan:
+    """
+    Diffs the transcript against the version `translation` was made from. Translated cues that overlap a changed,
+    added or removed cue are dropped, and the cues of the transcript they covered are translated again, until no
+    kept translated cue overlaps a cue that is translated again.
+    """
+    matcher = SequenceMatcher(None, [(c.start, c.end, normalize_segment(c.text)) for c in previous_source],
+                              [(c.start, c.end, normalize_segment(c.text)) for c in source], autojunk=False)
+
+    removed = np.ones(len(previous_source), dtype=bool)
+    send = np.ones(len(source), dtype=bool)
+    for previous_index, index, size in matcher.get_matching_blocks():
+        removed[previous_index:previous_index + size] = False
+        send[index:index + size] = False
+
+    previous_starts, previous_ends = get_timings(previous_source)
+    starts, ends = get_timings(source)
+    translation_starts, translation_ends = get_timings(translation)
+
+    while True:
+        keep = ~_find_overlapping(translation_starts, translation_ends,
+                                  np.concatenate((previous_starts[removed], starts[send])),
+                                  np.concatenate((previous_ends[removed], ends[send])))
+
+        # The dropped translated cues may also cover unchanged cues, which lose their translation then
+        resend = send | _find_overlapping(starts, ends, translation_starts[~keep], translation_ends[~keep])
+        if np.array_equal(resend, send):
+            return RetranslationPlan(send, keep)
+        send = resend
+
+
+def splice(source: Sequence[Cue], translation: Sequence[Cue], plan: RetranslationPlan, translations: Sequence[str],
+           max_line_length: int = MAX_LINE_LENGTH) -> List[Cue]:
+    """
+    Combines the kept cues of the previous translation with the new translations.
+
+    @param translations: Translations of the cues in `plan.send`, in order
+    """
+    sent = np.flatnonzero(plan.send)
+    translated = [Cue(source[index].start, source[index].end, text) for index, text in zip(sent.tolist(), translations)]
+
+    cues = [cue for cue, keep in zip(translation, plan.keep.tolist()) if keep]
+
+    # Consecutive cues are resegmented on their own, so no cue is merged across a kept cue
+    for run in np.split(np.arange(len(sent)), np.flatnonzero(np.diff(sent) != 1) + 1):
+        cues += resegment([translated[position] for position in run.tolist()], max_line_length=max_line_length)
+
+    cues.sort(key=lambda cue: cue.start)
+    starts, ends = get_timings(cues)
+
+    # Resegmented cues may be extended into a kept cue
+    return with_timings(cues, starts, clip_overlaps(starts, ends))
+
+
+def is_unchanged(translation: Sequence[Cue], previous_translation: Sequence[Cue]) -> bool:
+    """
+    @return: Whether a spliced translation has the cues of the previous translation, which are only numbered
+        differently
+    """
+    return [(cue.start, cue.end, cue.text) for cue in translation] == \
+        [(cue.start, cue.end, cue.text) for cue in previous_translation]
+
+
+def get_previous_translation(source_subtitle, language) -> Optional[Tuple[SubtitleFile, SubtitleFile]]:
+    """
+    @return: The version of the transcript the translation into `language` was last made from and the latest
+        version of that translation, or None if there is no translation to build on
+    """
+    translation = Subtitle.objects.filter(video=source_subtitle.video, language=language, latest_file__isnull=False) \
+        .exclude(pk=source_subtitle.pk).select_related('latest_file').order_by('-pk').first()
+    if translation is None:
+        return None
+
+    machine_translation = SubtitleFile.objects.filter(subtitle=translation, source_file__subtitle=source_subtitle) \
+        .select_related('source_file').order_by('-pk').first()
+    if machine_translation is not None:
+        return machine_translation.source_file, translation.latest_file
+
+    # Translations made before the source version was recorded with them
+    workflow_data = source_subtitle.video.workflow_data or {}
+    if language.iso_code not in workflow_data.get('target_languages', []):
+        return None
+
+    previous_source = SubtitleFile.objects.filter(pk=workflow_data.get('subtitle_file_id'),
+                                                  subtitle=source_subtitle).first()
+    if previous_source is None:
+        return None
+
+    return previous_source, translation.latest_file
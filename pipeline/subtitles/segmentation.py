@@ -0,0 +1,138 @@
+"""Re-segmentation of machine translated cues to line length and reading speed limits"""
+
+import math
+import re
+from typing import Iterable, Iterator, List
+
+from django.conf import settings
+
+from .cues import Cue
+
+MAX_LINE_LENGTH = getattr(settings, 'SUBTITLE_MAX_LINE_LENGTH', 42)
+MAX_LINES = getattr(settings, 'SUBTITLE_MAX_LINES', 2)
+MAX_CHARS_PER_SECOND = getattr(settings, 'SUBTITLE_MAX_CHARS_PER_SECOND', 20)
+
+# Words after which a cue is preferably split
+CLAUSE_END_PATTERN = re.compile(r'[.!?;:,]["\')]?$')
+
+
+def _wrap_greedy(words: List[str], max_line_length: int) -> List[str]:
+    lines = []
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > max_line_length:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+
+    return lines
+
+
+def wrap_lines(words: List[str], max_line_length: int) -> List[str]:
+    """
+    Wraps the words into lines of at most `max_line_length` characters, longer words get a line of their own.
+    Two lines are balanced, so the first one does not take all the text.
+    """
+    lines = _wrap_greedy(words, max_line_length)
+    if len(lines) != 2:
+        return lines
+
+    total = len(lines[0]) + 1 + len(lines[1])
+    best_split, best_longest, first_length = None, None, -1
+    for split, word in enumerate(words[:-1], start=1):
+        first_length += 1 + len(word)
+        longest = max(first_length, total - first_length - 1)
+        if longest <= max_line_length and (best_longest is None or longest < best_longest):
+            best_split, best_longest = split, longest
+
+    if best_split is None:
+        return lines
+    return [" ".join(words[:best_split]), " ".join(words[best_split:])]
+
+
+def _split_words(words: List[str], max_line_length: int, max_lines: int) -> Iterator[List[str]]:
+    """
+    Splits the words of a cue into chunks that fit into `max_lines` lines, preferably at the end of a clause.
+    """
+    def fits(chunk):
+        return len(_wrap_greedy(chunk, max_line_length)) <= max_lines
+
+    chunk = []
+    clause_end = 0
+    for word in words:
+        if chunk and not fits(chunk + [word]):
+            # Move the words after the last clause end to the next chunk, unless that leaves too little behind
+            if 2 * clause_end >= len(chunk) and fits(chunk[clause_end:] + [word]):
+                yield chunk[:clause_end]
+                chunk = chunk[clause_end:]
+            else:
+                yield chunk
+                chunk = []
+            clause_end = 0
+
+        chunk.append(word)
+        if CLAUSE_END_PATTERN.search(word):
+            clause_end = len(chunk)
+
+    if chunk:
+        yield chunk
+
+
+def _split_cues(cues: Iterable[Cue], max_line_length: int, max_lines: int) -> Iterator[Cue]:
+    for cue in cues:
+        chunks = list(_split_words(cue.text.split(), max_line_length, max_lines)) or [[]]
+
+        # The duration is divided in proportion to the characters of the chunks
+        total = sum(len(" ".join(chunk)) for chunk in chunks) or 1
+        start, characters = cue.start, 0
+        for chunk in chunks:
+            characters += len(" ".join(chunk))
+            end = cue.start + (cue.end - cue.start) * characters // total
+            yield Cue(start, end, "\n".join(wrap_lines(chunk, max_line_length)))
+            start = end
+
+
+def _get_reading_duration(cue: Cue, max_chars_per_second) -> int:
+    """
+    @return: Milliseconds it takes to read the cue at `max_chars_per_second`
+    """
+    return math.ceil((len(cue.text) - cue.text.count("\n")) * 1000 / max_chars_per_second)
+
+
+def resegment(cues: Iterable[Cue], max_line_length: int = MAX_LINE_LENGTH, max_lines: int = MAX_LINES,
+              max_chars_per_second: float = MAX_CHARS_PER_SECOND) -> List[Cue]:
+    """
+    Re-wraps the text of the cues into lines of at most `max_line_length` characters and splits cues that need more
+    than `max_lines` lines. Cues that are too fast to read are extended into the gap to the next cue, or merged with
+    it if the text of both still fits. Runs in one pass over the cues, which are not modified.
+    """
+    resegmented = []
+    pending = None
+
+    for cue in _split_cues(cues, max_line_length, max_lines):
+        if pending is None:
+            pending = cue
+            continue
+
+        needed = _get_reading_duration(pending, max_chars_per_second)
+        if pending.end - pending.start < needed:
+            pending.end = max(pending.end, min(pending.start + needed, cue.start))
+
+        if pending.end - pending.start < needed:
+            lines = wrap_lines(pending.text.split() + cue.text.split(), max_line_length)
+            if len(lines) <= max_lines:
+                pending = Cue(pending.start, cue.end, "\n".join(lines))
+                continue
+
+        resegmented.append(pending)
+        pending = cue
+
+    if pending is not None:
+        # Nothing follows that could be overlapped
+        pending.end = max(pending.end, pending.start + _get_reading_duration(pending, max_chars_per_second))
+        resegmented.append(pending)
+
+    return resegmented
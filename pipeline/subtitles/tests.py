@@ -1,9 +1,44 @@
+import asyncio
 import datetime
+import hashlib
+import hmac
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 
-from .models import Course
+from core.models import Tenant, TranspipeUser
+from mooclink.services.deepl_translation_service import DeeplTranslationService
+from mooclink.views.main import MainView
+from .api.xikolo_api import (get_published_hash, get_subtitle_webvtt_content, publish_subtitle, refresh_subtitle,
+                             remember_xikolo_response, run_bulk_publish_job, update_video_detail, xikolo_get)
+from .api.xikolo_client import XikoloClient
+from .api.xikolo_stub import XikoloStubServer
+from .api.xikolo_sync import XikoloCourseSync
+from .converters import SUBTITLE_FORMATS, iter_srt, iter_zip
+from .cues import Cue, iter_cues, iter_vtt, parse_vtt, write_vtt
+from .models import (BulkPublishJob, Course, CourseSection, IsoLanguage, ServiceProviderUse, Subtitle, SubtitleBlob,
+                     SubtitleFile, TranslationMemory, Video, XikoloResponseValidator)
+from .models.course import SyncStatusChoices
+from .models.subtitle_file import subtitle_content_cache
+from .retranslation import plan_retranslation, splice
+from .segmentation import resegment
+from .timings import clip_overlaps, find_gaps, find_overlaps, fix_course_timings, parse_timestamps, scale, shift
+from .validation import validate_vtt
+
+
+def call_fake_deepl(tenant, provider, post, url, data, **kwargs):
+    response = mock.Mock()
+    translated = "<span>".join(caption.upper() for caption in data['text'].split("<span>"))
+    response.json.return_value = {'translations': [{'text': translated}]}
+    return response
 
 
 class CourseModelTests(TestCase):
@@ -22,3 +57,828 @@ class CourseModelTests(TestCase):
         )
         video_count = course1.number_of_videos
         self.assertIs(video_count == 0, True)
+
+
+class CueTests(SimpleTestCase):
+    def test_parse_and_write(self):
+        content = "WEBVTT - Lecture\nKind: captions\n\nSTYLE\n::cue { color: yellow }\n\nNOTE generated\n\n" \
+                  "intro\n00:00:01.500 --> 00:00:03.000 align:start line:0\nHello\nworld\n\n" \
+                  "01:00:00.000 --> 01:00:01.001\nBye\n\nNOTE the end"
+
+        cues = parse_vtt(content)
+
+        self.assertEqual(cues, [
+            Cue(1500, 3000, "Hello\nworld", "intro", "align:start line:0",
+                ("WEBVTT - Lecture\nKind: captions", "STYLE\n::cue { color: yellow }", "NOTE generated")),
+            Cue(3600000, 3601001, "Bye", trailing_blocks=("NOTE the end",)),
+        ])
+        self.assertEqual(list(iter_cues(io.StringIO(content))), cues)
+        self.assertEqual(write_vtt(cues), content)
+        self.assertEqual("".join(iter_vtt(cues)), content)
+
+        cues = parse_vtt("WEBVTT\n\n00:01.500 --> 00:00:03.000\nHello\n\nlast\n01:00:00.000 --> 01:00:01.001\nBye\n")
+        self.assertEqual(cues, [Cue(1500, 3000, "Hello"), Cue(3600000, 3601001, "Bye", "last")])
+        self.assertEqual(write_vtt(cues, renumber=True), "WEBVTT\n\n1\n00:00:01.500 --> 00:00:03.000\nHello\n\n"
+                                                         "2\n01:00:00.000 --> 01:00:01.001\nBye")
+        self.assertEqual(write_vtt([]), "WEBVTT")
+
+    def test_timing_operations(self):
+        starts = parse_timestamps(["00:00:01.000", "00:02.000", "00:00:05.000"])
+        ends = parse_timestamps(["00:00:02.500", "00:00:03.000", "00:00:06.000"])
+
+        self.assertEqual(shift(starts, -1500).tolist(), [0, 500, 3500])
+        self.assertEqual(scale(starts, 1.5).tolist(), [1500, 3000, 7500])
+        self.assertEqual(find_overlaps(starts, ends).tolist(), [0])
+        self.assertEqual(find_gaps(starts, ends, 2000).tolist(), [1])
+        self.assertEqual(clip_overlaps(starts, ends).tolist(), [2000, 3000, 6000])
+
+    def test_resegment(self):
+        cues = [
+            Cue(0, 6000, "This translation is much longer than its source, so it does not fit into two lines."),
+            Cue(6000, 6200, "Yes, yes,"),
+            Cue(6200, 7000, "exactly."),
+            Cue(9000, 9100, "Gap"),
+        ]
+
+        self.assertEqual(resegment(cues, max_line_length=30, max_lines=2, max_chars_per_second=20), [
+            Cue(0, 3512, "This translation is much\nlonger than its source,"),
+            Cue(3512, 6000, "so it does not fit\ninto two lines."),
+            Cue(6000, 7000, "Yes, yes, exactly."),
+            Cue(9000, 9150, "Gap"),
+        ])
+        # The input is left as it was
+        self.assertEqual(cues[1], Cue(6000, 6200, "Yes, yes,"))
+
+    def test_converters(self):
+        cues = [Cue(1000, 2500, "<v Anna>Hello &\nworld"), Cue(3600000, 3601000, "Bye")]
+
+        def convert(subtitle_format):
+            return "".join(SUBTITLE_FORMATS[subtitle_format].convert(iter(cues), "en"))
+
+        self.assertEqual(convert('srt'), "1\n00:00:01,000 --> 00:00:02,500\n<v Anna>Hello &\nworld\n\n"
+                                         "2\n01:00:00,000 --> 01:00:01,000\nBye\n\n")
+        self.assertIn('<p begin="00:00:01.000" end="00:00:02.500">Hello &amp;<br/>world</p>', convert('ttml'))
+        self.assertEqual(convert('txt'), "Hello & world\nBye\n")
+        self.assertEqual(json.loads(convert('json'))[1], {'start': 3600000, 'end': 3601000, 'text': "Bye"})
+        self.assertEqual(convert('vtt'), write_vtt(cues))
+
+        archive = b"".join(iter_zip([("a.srt", iter_srt(cues)), ("empty.txt", iter(()))]))
+        with zipfile.ZipFile(io.BytesIO(archive)) as zip_file:
+            self.assertEqual(zip_file.read("a.srt").decode("utf-8"), convert('srt'))
+            self.assertEqual(zip_file.read("empty.txt"), b"")
+
+    def test_validate_vtt(self):
+        self.assertEqual(validate_vtt(write_vtt([Cue(0, 1000, "a"), Cue(500, 2000, "b")])),
+                         ([], ["Line 6: The cue overlaps the previous one"]))
+        self.assertEqual(validate_vtt("WEBVTT\n\n00:02.000 --> 00:01.000\na\n\n00:00.000 --> 0:00:01.000\nb -->"), ([
+            "Line 6: Malformed cue timings, expected 'HH:MM:SS.mmm --> HH:MM:SS.mmm'",
+            "Line 7: '-->' is only allowed in cue timings, after a blank line or a cue identifier",
+            "Line 3: The cue has to end after it starts",
+        ], []))
+        self.assertEqual(validate_vtt(b"\xffWEBVTT").errors, ["The file is not UTF-8 encoded (byte 0)"])
+        self.assertEqual(validate_vtt("WEBVTTX\n\n00:00.000 --> 00:01.000\na").errors,
+                         ["Line 1: The file has to start with 'WEBVTT'"])
+
+    def test_retranslation_plan(self):
+        previous_source = [Cue(0, 2000, "One"), Cue(2000, 4000, "Two"), Cue(4000, 6000, "Three"),
+                           Cue(6000, 8000, "Four")]
+        source = [Cue(0, 2000, "One"), Cue(2000, 4000, "Two!"), Cue(4000, 6000, "Three"), Cue(6000, 8000, "Four"),
+                  Cue(8000, 9000, "Five")]
+        # The second cue of the translation covers a changed and an unchanged cue
+        translation = [Cue(0, 2000, "EINS"), Cue(2000, 6000, "ZWEI DREI"), Cue(6000, 8000, "VIER")]
+
+        plan = plan_retranslation(previous_source, source, translation)
+
+        self.assertEqual(plan.send.tolist(), [False, True, True, False, True])
+        self.assertEqual(plan.keep.tolist(), [True, False, True])
+        self.assertEqual(splice(source, translation, plan, ["ZWEI!", "DREI", "FÜNF"]), [
+            Cue(0, 2000, "EINS"), Cue(2000, 4000, "ZWEI!"), Cue(4000, 6000, "DREI"), Cue(6000, 8000, "VIER"),
+            Cue(8000, 9000, "FÜNF"),
+        ])
+
+        unchanged = plan_retranslation(source, source, translation)
+        self.assertFalse(unchanged.send.any())
+        self.assertTrue(unchanged.keep.all())
+
+
+class XikoloClientTests(SimpleTestCase):
+    def test_sync_and_async_requests(self):
+        with XikoloStubServer() as server:
+            client = XikoloClient(server.base_url, "token", max_workers=2)
+
+            response = client.get("videos/v1")
+            self.assertEqual(response.json()["id"], "v1")
+
+            response = client.patch("videos/v1/subtitles/en", "WEBVTT\n".encode("utf-8"))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(server.patches, [("/videos/v1/subtitles/en", b"WEBVTT\n")])
+
+            async def get_many():
+                try:
+                    return await client.aget_many(["videos/v2", server.base_url + "videos/v3/subtitles/de"])
+                finally:
+                    await client.aclose()
+
+            video, subtitle = asyncio.run(get_many())
+            self.assertEqual(video.json()["id"], "v2")
+            self.assertIn("Hello from v3", subtitle.text)
+
+
+class XikoloWebhookTests(TestCase):
+    def setUp(self):
+        self.tenant = Tenant.objects.create(name="Test", slug="test", secrets={'XIKOLO_WEBHOOK_SECRET': "s3cret"})
+        language = IsoLanguage.objects.create(iso_code="en", description="English")
+        self.course = Course.objects.create(tenant=self.tenant, ext_id="c1", title="Course", language=language,
+                                            sync_status=SyncStatusChoices.SUCCESS)
+        section = CourseSection.objects.create(tenant=self.tenant, course=self.course, ext_id="s1", title="Section")
+        self.video = Video.objects.create(tenant=self.tenant, course_section=section, ext_id="v1", title="Video",
+                                          original_language=language)
+
+        self.url = reverse('mooclink.webhooks.xikolo', args=[self.tenant.slug])
+
+    def post(self, events, secret="s3cret", timestamp=None):
+        body = json.dumps(events).encode("utf-8")
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signature = "sha256=" + hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body,
+                                         hashlib.sha256).hexdigest()
+
+        return self.client.post(self.url, body, content_type="application/json", HTTP_X_XIKOLO_SIGNATURE=signature,
+                                HTTP_X_XIKOLO_TIMESTAMP=str(timestamp))
+
+    @mock.patch('celery.current_app.send_task')
+    def test_events_queue_targeted_refreshes(self, send_task):
+        self.assertEqual(self.post({"event": "video.updated", "video_id": "v1"}, secret="wrong").status_code, 403)
+        send_task.assert_not_called()
+
+        response = self.post([
+            {"event": "subtitle.updated", "course_id": "c1", "video_id": "v1"},
+            {"event": "video.updated", "course_id": "c1", "video_id": "v1"},
+            {"event": "course.updated", "course_id": "unknown"},
+        ])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'events': 3, 'queued': 1})
+        send_task.assert_called_once_with('core.tasks.task_refresh_video_detail', args=(self.video.pk, "v1"))
+
+        send_task.reset_mock()
+        self.post([
+            {"event": "video.created", "course_id": "c1", "video_id": "v2"},
+            {"event": "video.updated", "course_id": "c1", "video_id": "v1"},
+        ])
+        send_task.assert_called_once_with('core.tasks.task_sync_course', args=(self.course.pk, ["v1"]))
+
+    @mock.patch('celery.current_app.send_task')
+    def test_changed_subtitles_are_downloaded_again(self, send_task):
+        user = TranspipeUser.objects.create(username="test", tenant=self.tenant)
+        subtitle = Subtitle.objects.create(tenant=self.tenant, video=self.video, language_id="en", is_transcript=True,
+                                           user=user)
+
+        response = self.post([
+            {"event": "subtitle.updated", "course_id": "c1", "video_id": "v1", "language": "en"},
+            # Not known yet, created by the details of the video
+            {"event": "subtitle.updated", "course_id": "c1", "video_id": "v1", "language": "de"},
+        ])
+
+        self.assertEqual(response.json(), {'events': 2, 'queued': 2})
+        self.assertEqual(send_task.call_args_list, [
+            mock.call('core.tasks.task_refresh_video_detail', args=(self.video.pk, "v1")),
+            mock.call('core.tasks.task_refresh_subtitle', args=(subtitle.pk,)),
+        ])
+
+    @mock.patch('celery.current_app.send_task')
+    def test_stale_and_replayed_requests_are_rejected(self, send_task):
+        events = {"event": "video.updated", "video_id": "v1"}
+
+        self.assertEqual(self.post(events, timestamp=int(time.time()) - 600).status_code, 403)
+
+        timestamp = int(time.time())
+        self.assertEqual(self.post(events, timestamp=timestamp).status_code, 202)
+        self.assertEqual(self.post(events, timestamp=timestamp).status_code, 403)
+        send_task.assert_called_once()
+
+
+class TemporaryMediaRootMixin:
+    """
+    Writes the files created by a test to a temporary MEDIA_ROOT
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root_override = override_settings(MEDIA_ROOT=self.media_root.name + "/")
+        media_root_override.enable()
+        self.addCleanup(media_root_override.disable)
+
+
+class XikoloStubMixin(TemporaryMediaRootMixin):
+    """
+    A tenant whose Xikolo API is served by a XikoloStubServer, without a rate limit
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.server = XikoloStubServer().__enter__()
+        self.addCleanup(self.server.__exit__)
+
+        self.tenant = Tenant.objects.create(name="Test", slug="test", secrets={
+            'XIKOLO_API_URL': self.server.base_url,
+            'XIKOLO_API_TOKEN': "token",
+            'XIKOLO_RATE_LIMIT': 0,
+        })
+
+
+class XikoloConditionalGetTests(XikoloStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = self.server.base_url + "videos/v1"
+
+    def test_only_remembered_validators_make_requests_conditional(self):
+        response = xikolo_get(self.tenant, self.url, scope="test")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.not_modified)
+
+        # Not remembered yet
+        self.assertEqual(xikolo_get(self.tenant, self.url, scope="test").status_code, 200)
+
+        remember_xikolo_response(response)
+        response = xikolo_get(self.tenant, self.url, scope="test")
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response.not_modified)
+        self.assertEqual(response.content, b"")
+
+        # A 304 does not touch the validators
+        remember_xikolo_response(response)
+        self.assertEqual(XikoloResponseValidator.objects.get().etag, response.headers['ETag'])
+
+        self.assertEqual(xikolo_get(self.tenant, self.url, scope="other").status_code, 200)
+        self.assertEqual(xikolo_get(self.tenant, self.url).status_code, 200)
+        self.assertEqual(xikolo_get(self.tenant, self.url, scope="test", conditional=False).json()["id"], "v1")
+
+    def test_unscoped_responses_are_not_remembered(self):
+        remember_xikolo_response(xikolo_get(self.tenant, self.url + "/subtitles/en"))
+
+        self.assertFalse(XikoloResponseValidator.objects.exists())
+
+
+class XikoloVideoDetailTests(XikoloStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        TranspipeUser.objects.create(username="test", tenant=self.tenant)
+        english = IsoLanguage.objects.create(iso_code="en", description="English")
+        IsoLanguage.objects.create(iso_code="de", description="German")
+        course = Course.objects.create(tenant=self.tenant, ext_id="c1", title="Course", language=english)
+        section = CourseSection.objects.create(tenant=self.tenant, course=course, ext_id="s1", title="Section")
+        self.video = Video.objects.create(tenant=self.tenant, course_section=section, ext_id="v1", title="Video",
+                                          original_language=english)
+
+    def test_failed_downloads_are_fetched_again(self):
+        def download(ext_video_id, language, request=None, tenant=None):
+            return None if language == "de" else get_subtitle_webvtt_content(ext_video_id, language, request, tenant)
+
+        with mock.patch('subtitles.api.xikolo_api.get_subtitle_webvtt_content', side_effect=download):
+            with self.assertLogs('subtitles.api.xikolo_api', 'WARNING') as logs:
+                update_video_detail(self.video.pk, "v1")
+
+        self.assertIn("v1: Could not download the subtitles de", logs.output[0])
+        self.assertEqual(list(Subtitle.objects.values_list('language', flat=True)), ["en"])
+        self.assertFalse(XikoloResponseValidator.objects.exists())
+
+        update_video_detail(self.video.pk, "v1")
+
+        self.assertEqual(set(Subtitle.objects.values_list('language', flat=True)), {"en", "de"})
+        self.assertTrue(XikoloResponseValidator.objects.exists())
+
+    def test_changed_subtitles_are_downloaded_again(self):
+        update_video_detail(self.video.pk, "v1")
+        german = Subtitle.objects.get(language="de")
+        changed = "WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.500\nHallo von v1\n"
+        self.server.subtitles[("v1", "de")] = changed
+
+        # The details of the video did not change, and the subtitle is known already
+        update_video_detail(self.video.pk, "v1")
+        self.assertEqual(Subtitle.objects.get(pk=german.pk).latest_file, german.latest_file)
+
+        subtitle_file = refresh_subtitle(german.pk)
+
+        german = Subtitle.objects.get(pk=german.pk)
+        self.assertEqual((german.latest_file, german.latest_content), (subtitle_file, changed))
+        self.assertEqual(german.published_hash, get_published_hash(changed.encode("utf-8"), False))
+        self.assertEqual(german.subtitlefile_set.count(), 2)
+
+        self.assertIsNone(refresh_subtitle(german.pk))
+        self.assertEqual(german.subtitlefile_set.count(), 2)
+
+
+class XikoloPublishTests(XikoloStubMixin, TransactionTestCase):
+    """
+    The bulk publish job sends the subtitles from worker threads, which only see committed rows.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = TranspipeUser.objects.create(username="test", tenant=self.tenant)
+        language = IsoLanguage.objects.create(iso_code="en", description="English")
+        self.course = Course.objects.create(tenant=self.tenant, ext_id="c1", title="Course", language=language)
+        section = CourseSection.objects.create(tenant=self.tenant, course=self.course, ext_id="s1", title="Section")
+        self.videos = [
+            Video.objects.create(tenant=self.tenant, course_section=section, ext_id=f"v{index}", title="Video",
+                                 original_language=language)
+            for index in range(3)
+        ]
+
+    def create_subtitle(self, video, content):
+        subtitle = Subtitle.objects.create(tenant=self.tenant, video=video, language=video.original_language,
+                                           is_transcript=True, user=self.user, is_automatic=False)
+        SubtitleFile.objects.create_version(subtitle, content, user=self.user)
+        return Subtitle.objects.get(pk=subtitle.pk)
+
+    def test_bulk_publish_job_records_every_subtitle(self):
+        valid_content = write_vtt([Cue(0, 1000, "Hello")])
+        subtitles = [
+            self.create_subtitle(self.videos[0], valid_content),
+            self.create_subtitle(self.videos[1], valid_content),
+            self.create_subtitle(self.videos[2], "WEBVTT\n\n00:00:02.000 --> 00:00:01.000\nBackwards\n"),
+        ]
+        job = BulkPublishJob.objects.create(tenant=self.tenant, course=self.course, initiated_by=self.user,
+                                            subtitle_ids=[subtitle.pk for subtitle in subtitles])
+
+        run_bulk_publish_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkPublishJob.Status.FINISHED)
+        self.assertIsNotNone(job.finished)
+        self.assertEqual(job.as_dict()['published'], 2)
+        self.assertEqual(job.as_dict()['failed'], 1)
+        self.assertIn("not valid WebVTT", job.results[str(subtitles[2].pk)]['message'])
+
+        self.assertEqual(sorted(path for path, _ in self.server.patches), [
+            "/videos/v0/subtitles/en?automatic=false", "/videos/v1/subtitles/en?automatic=false",
+        ])
+        self.assertEqual({body for _, body in self.server.patches}, {valid_content.encode("utf-8")})
+        self.assertEqual(list(Subtitle.objects.filter(status=Subtitle.SubtitleStatus.PUBLISHED)
+                              .order_by('pk').values_list('pk', flat=True)), [subtitles[0].pk, subtitles[1].pk])
+
+    def test_published_versions_are_not_sent_again(self):
+        subtitle = self.create_subtitle(self.videos[0], write_vtt([Cue(0, 1000, "Hello")]))
+
+        self.assertEqual(publish_subtitle(subtitle), (True, "Latest subtitle version was published."))
+        Subtitle.objects.filter(pk=subtitle.pk).update(status=Subtitle.SubtitleStatus.IN_PROGRESS)
+        self.assertEqual(publish_subtitle(Subtitle.objects.get(pk=subtitle.pk)),
+                         (True, "Latest subtitle version is already published."))
+
+        self.assertEqual(len(self.server.patches), 1)
+        self.assertEqual(Subtitle.objects.get(pk=subtitle.pk).status, Subtitle.SubtitleStatus.PUBLISHED)
+
+        # Switching between automatic and manual subtitles is a change of its own
+        Subtitle.objects.filter(pk=subtitle.pk).update(is_automatic=True)
+        publish_subtitle(Subtitle.objects.get(pk=subtitle.pk))
+        SubtitleFile.objects.create_version(subtitle, write_vtt([Cue(0, 1000, "Hello again")]), user=self.user)
+        publish_subtitle(Subtitle.objects.get(pk=subtitle.pk))
+
+        self.assertEqual([path for path, _ in self.server.patches], [
+            "/videos/v0/subtitles/en?automatic=false",
+            "/videos/v0/subtitles/en?automatic=true",
+            "/videos/v0/subtitles/en?automatic=true",
+        ])
+
+
+def make_course_entry(sections):
+    """
+    @param sections: Ext ids of the videos by ext id of their section
+    """
+    return {
+        "id": "c1",
+        "alternative_teacher_text": "",
+        "teachers": [{"name": "Teacher"}],
+        "sections": [
+            {"id": section_id, "title": f"Section {section_id}", "videos": [
+                {"id": video_id, "title": f"Video {video_id}", "start-date": "2024-01-01T00:00:00Z",
+                 "item-id": f"item-{video_id}"}
+                for video_id in video_ids
+            ]}
+            for section_id, video_ids in sections.items()
+        ],
+    }
+
+
+class XikoloCourseSyncTests(XikoloStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        language = IsoLanguage.objects.create(iso_code="en", description="English")
+        self.course = Course.objects.create(tenant=self.tenant, ext_id="c1", title="Course", language=language)
+
+    @mock.patch('celery.current_app.send_task')
+    def test_run_syncs_the_structure_and_queues_the_details(self, send_task):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"], "s2": ["v3"]})
+
+        videos = XikoloCourseSync(self.course).run()
+
+        self.assertEqual([video.ext_id for video in videos], ["v1", "v2", "v3"])
+        self.assertEqual([(video.course_section.ext_id, video.index) for video in videos],
+                         [("s1", 0), ("s1", 1), ("s2", 0)])
+        self.assertEqual(send_task.call_args_list, [
+            mock.call('core.tasks.task_update_video_detail', args=(video.pk, video.ext_id)) for video in videos
+        ])
+
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(course.sync_status, SyncStatusChoices.SUCCESS)
+        self.assertEqual(course.teacher, "Teacher")
+        self.assertEqual({key: course.sync_data[key] for key in ['sections_total', 'videos_total', 'videos_done']},
+                         {'sections_total': 2, 'videos_total': 3, 'videos_done': 3})
+
+    @mock.patch('celery.current_app.send_task')
+    def test_unchanged_structure_is_taken_from_the_db(self, send_task):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"]})
+        XikoloCourseSync(self.course).run()
+
+        Video.objects.filter(ext_id="v1").update(title="Local title")
+        videos = XikoloCourseSync(Course.objects.get(pk=self.course.pk)).run()
+
+        self.assertEqual([video.ext_id for video in videos], ["v1", "v2"])
+        self.assertEqual(Video.objects.get(ext_id="v1").title, "Local title")
+        self.assertTrue(Course.objects.get(pk=self.course.pk).sync_data['structure_not_modified'])
+        self.assertEqual(send_task.call_count, 4)
+
+    def test_resync_updates_sections_and_videos_in_place(self):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"], "s2": ["v3"]})
+        XikoloCourseSync(self.course, disable_deep_fetch=True).run()
+        pks = dict(Video.objects.values_list('ext_id', 'pk'))
+        Video.objects.filter(ext_id="v3").update(summary="Fetched by the deep fetch")
+
+        entry = make_course_entry({"s2": ["v3", "v1"], "s1": ["v2"]})
+        entry["sections"][0]["videos"][0]["title"] = "Renamed"
+        self.server.courses["c1"] = entry
+        XikoloCourseSync(Course.objects.get(pk=self.course.pk), disable_deep_fetch=True).run()
+
+        self.assertEqual(dict(Video.objects.values_list('ext_id', 'pk')), pks)
+        self.assertEqual(list(CourseSection.objects.order_by('index').values_list('ext_id', flat=True)), ["s2", "s1"])
+        self.assertEqual([(video.ext_id, video.course_section.ext_id, video.index)
+                          for video in Video.objects.order_by('course_section__index', 'index')],
+                         [("v3", "s2", 0), ("v1", "s2", 1), ("v2", "s1", 0)])
+        video = Video.objects.get(ext_id="v3")
+        self.assertEqual((video.title, video.summary), ("Renamed", "Fetched by the deep fetch"))
+
+    @mock.patch('celery.current_app.send_task')
+    def test_changed_videos_are_not_taken_from_the_memo(self, send_task):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"]})
+        XikoloCourseSync(self.course, disable_deep_fetch=True).run()
+        video_url = self.server.base_url + "videos/v1"
+        xikolo_get(self.tenant, video_url, memoize=True)
+        requests_before = self.server.requests
+
+        XikoloCourseSync(Course.objects.get(pk=self.course.pk), changed_video_ext_ids=["v1"]).run()
+        xikolo_get(self.tenant, video_url, memoize=True)
+
+        # The course and the forgotten video
+        self.assertEqual(self.server.requests - requests_before, 2)
+        v1, v2 = Video.objects.order_by('index')
+        self.assertEqual(send_task.call_args_list, [
+            mock.call('core.tasks.task_refresh_video_detail', args=(v1.pk, "v1")),
+            mock.call('core.tasks.task_update_video_detail', args=(v2.pk, "v2")),
+        ])
+
+    @override_settings(XIKOLO_ASYNC_VIDEO_DETAIL_FETCH=False)
+    @mock.patch('subtitles.api.xikolo_sync.update_video_detail')
+    def test_synchronous_details_do_not_open_nested_pools(self, update_video_detail):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"]})
+
+        videos = XikoloCourseSync(self.course).run()
+
+        self.assertCountEqual(update_video_detail.call_args_list, [
+            mock.call(video.pk, video.ext_id, max_workers=1) for video in videos
+        ])
+        self.assertEqual(Course.objects.get(pk=self.course.pk).sync_data['videos_done'], 2)
+
+    def test_removed_videos_are_deprecated_and_restored(self):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2", "v3"]})
+        XikoloCourseSync(self.course, disable_deep_fetch=True).run()
+
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1"]})
+        videos = XikoloCourseSync(Course.objects.get(pk=self.course.pk), disable_deep_fetch=True).run()
+
+        self.assertEqual([video.ext_id for video in videos], ["v1"])
+        self.assertEqual(set(Video.objects.filter(deprecated=True).values_list('ext_id', flat=True)), {"v2", "v3"})
+        self.assertEqual(Course.objects.get(pk=self.course.pk).sync_data['videos_deprecated'], 2)
+
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v3"]})
+        XikoloCourseSync(Course.objects.get(pk=self.course.pk), disable_deep_fetch=True).run()
+
+        self.assertEqual(list(Video.objects.filter(deprecated=True).values_list('ext_id', flat=True)), ["v2"])
+        sync_data = Course.objects.get(pk=self.course.pk).sync_data
+        self.assertEqual((sync_data['videos_deprecated'], sync_data['videos_undeprecated']), (0, 1))
+
+    @mock.patch('celery.current_app.send_task')
+    def test_sync_video_writes_only_the_video(self, send_task):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1"], "s2": ["v2", "v3"]})
+
+        video = XikoloCourseSync(self.course).sync_video("v3")
+
+        self.assertEqual((video.ext_id, video.course_section.ext_id, video.index), ("v3", "s2", 1))
+        self.assertEqual(list(Video.objects.values_list('ext_id', flat=True)), ["v3"])
+        self.assertEqual(list(CourseSection.objects.values_list('ext_id', flat=True)), ["s2"])
+        send_task.assert_called_once_with('core.tasks.task_update_video_detail', args=(video.pk, "v3"))
+
+        self.assertIsNone(XikoloCourseSync(self.course).sync_video("unknown"))
+
+    @mock.patch('celery.current_app.send_task')
+    def test_deep_links_queue_a_course_sync_unless_one_is_running(self, send_task):
+        self.server.courses["c1"] = make_course_entry({"s1": ["v1", "v2"]})
+
+        v1 = MainView.fetch_video(None, self.course, "v1")
+        self.assertEqual(send_task.call_args_list, [
+            mock.call('core.tasks.task_update_video_detail', args=(v1.pk, "v1")),
+            mock.call('core.tasks.task_sync_course', args=(self.course.pk,)),
+        ])
+
+        send_task.reset_mock()
+        Course.objects.filter(pk=self.course.pk).update(sync_status=SyncStatusChoices.IN_PROGRESS)
+        v2 = MainView.fetch_video(None, self.course, "v2")
+        send_task.assert_called_once_with('core.tasks.task_update_video_detail', args=(v2.pk, "v2"))
+
+    def test_run_reports_unknown_courses(self):
+        self.assertEqual(XikoloCourseSync(self.course).run(), [])
+
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(course.sync_status, SyncStatusChoices.ERROR)
+        self.assertEqual(course.sync_data['http_status'], 404)
+        self.assertFalse(Video.objects.exists())
+
+
+class SubtitleVersionTestCase(TemporaryMediaRootMixin, TestCase):
+    """
+    A transcript without versions
+    """
+
+    def setUp(self):
+        super().setUp()
+        tenant = Tenant.objects.create(name="Test", slug="test")
+        self.user = TranspipeUser.objects.create(username="test", tenant=tenant)
+        language = IsoLanguage.objects.create(iso_code="en", description="English")
+        course = Course.objects.create(tenant=tenant, ext_id="c1", title="Course", language=language)
+        section = CourseSection.objects.create(tenant=tenant, course=course, ext_id="s1", title="Section")
+        video = Video.objects.create(tenant=tenant, course_section=section, ext_id="v1", title="Video",
+                                     original_language=language)
+        self.subtitle = Subtitle.objects.create(tenant=tenant, video=video, language=language, is_transcript=True,
+                                                user=self.user)
+
+
+class SubtitleBlobTests(SubtitleVersionTestCase):
+    def test_identical_versions_share_one_blob(self):
+        first = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n", user=self.user)
+        second = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n", user=self.user)
+
+        self.assertEqual(first.blob, second.blob)
+        self.assertEqual(first.file.path, second.file.path)
+        self.assertEqual(SubtitleBlob.objects.get(pk=first.blob_id).refcount, 2)
+        self.assertNotEqual(SubtitleBlob.objects.store("WEBVTT\n\nchanged").pk, first.blob_id)
+
+        second.delete()
+        self.assertEqual(SubtitleBlob.objects.get(pk=first.blob_id).refcount, 1)
+        self.assertEqual(SubtitleBlob.objects.prune(), 0)
+        self.assertEqual(self.subtitle.latest_content, "WEBVTT\n")
+
+        first.delete()
+        self.assertEqual(SubtitleBlob.objects.prune(), 1)
+        self.assertFalse(os.path.exists(first.file.path))
+
+    def test_encoded_content_is_stored_as_text(self):
+        text = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n\nÜbersicht", user=self.user)
+        encoded = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n\nÜbersicht".encode("utf-8"),
+                                                      user=self.user)
+
+        self.assertEqual(encoded.blob_id, text.blob_id)
+        self.assertEqual(SubtitleFile.objects.get(pk=encoded.pk).content, "WEBVTT\n\nÜbersicht")
+
+class SubtitleDeltaTests(SubtitleVersionTestCase):
+    @mock.patch('subtitles.models.subtitle_file.SUBTITLE_SNAPSHOT_INTERVAL', 3)
+    def test_older_versions_are_stored_as_deltas(self):
+        cues = [f"{i}\n00:00:{i:02}.000 --> 00:00:{i:02}.500\nCue {i}" for i in range(10)]
+        contents = []
+        for version in range(7):
+            cues[version] = cues[version].upper()
+            contents.append("\n\n".join(["WEBVTT"] + cues) + "\n")
+            SubtitleFile.objects.create_version(self.subtitle, contents[-1], user=self.user)
+
+        versions = list(SubtitleFile.objects.filter(subtitle=self.subtitle).order_by('pk'))
+
+        self.assertEqual([version.blob_id is not None for version in versions],
+                         [True, False, False, True, False, False, True])
+        self.assertEqual([version.content for version in versions], contents)
+        self.assertEqual(self.subtitle.latest_content, contents[-1])
+        self.assertEqual(SubtitleBlob.objects.filter(refcount__gt=0).count(), 3)
+
+        SubtitleFile.objects.all().delete()
+        self.assertEqual(SubtitleBlob.objects.prune(), 7)
+
+    @mock.patch('subtitles.models.subtitle_file.SUBTITLE_SNAPSHOT_INTERVAL', 3)
+    def test_delta_chains_are_fetched_with_one_query(self):
+        contents = [f"WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.000\nVersion {version}\n" for version in range(5)]
+        for content in contents:
+            SubtitleFile.objects.create_version(self.subtitle, content, user=self.user)
+
+        versions = list(SubtitleFile.objects.filter(subtitle=self.subtitle).order_by('pk'))
+        self.assertEqual([version.position for version in versions], [0, 1, 2, 3, 4])
+        self.assertEqual([version.blob_id is not None for version in versions], [True, False, False, True, True])
+
+        subtitle_content_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(versions[1].content, contents[1])
+
+    def test_deleting_a_base_keeps_its_delta_versions(self):
+        contents = [f"WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.000\nVersion {version}\n" for version in range(3)]
+        first, second, third = [SubtitleFile.objects.create_version(self.subtitle, content, user=self.user)
+                                for content in contents]
+        self.assertEqual(SubtitleFile.objects.get(pk=second.pk).delta_base, third)
+
+        third.delete()
+
+        second = SubtitleFile.objects.get(pk=second.pk)
+        self.assertIsNone(second.delta_base)
+        self.assertEqual(second.content, contents[1])
+        subtitle = Subtitle.objects.get(pk=self.subtitle.pk)
+        self.assertEqual(subtitle.latest_file, second)
+        self.assertEqual([cue.text for cue in subtitle.iter_latest_cues()], ["Version 1"])
+        with open(subtitle.latest_subtitle_file, encoding="utf-8") as file:
+            self.assertEqual(file.read(), contents[1])
+
+        # Versions deleted together are not stored in full first
+        subtitle.delete()
+        self.assertEqual(SubtitleBlob.objects.filter(refcount__gt=0).count(), 0)
+        self.assertEqual(SubtitleBlob.objects.prune(), 3)
+
+
+class SubtitleLatestFileTests(SubtitleVersionTestCase):
+    def test_latest_file_is_maintained(self):
+        stale = Subtitle.objects.get(pk=self.subtitle.pk)
+
+        first = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n\n1", user=self.user)
+        second = SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n\n2", user=self.user)
+        self.assertEqual(self.subtitle.latest_file, second)
+
+        # Saving an instance that was loaded before must not reset the pointer
+        stale.status = Subtitle.SubtitleStatus.EDITED
+        stale.save()
+        self.assertEqual(Subtitle.objects.get(pk=self.subtitle.pk).latest_file, second)
+
+        first.delete()
+        second.delete()
+        self.assertIsNone(Subtitle.objects.get(pk=self.subtitle.pk).latest_file)
+
+
+class SubtitleContentCacheTests(SubtitleVersionTestCase):
+    def test_content_and_cues_are_cached_per_version(self):
+        subtitle_content_cache.clear()
+        content = "WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.000\nHello\n"
+        subtitle_file = SubtitleFile.objects.create_version(self.subtitle, content, user=self.user)
+
+        version = SubtitleFile.objects.get(pk=subtitle_file.pk)
+        self.assertEqual(version.content, content)
+        self.assertEqual([cue.text for cue in version.cues], ["Hello"])
+
+        # Later reads are served from memory
+        os.remove(version.file.path)
+        version = SubtitleFile.objects.get(pk=subtitle_file.pk)
+        self.assertEqual(version.content, content)
+        self.assertIs(version.cues, SubtitleFile.objects.get(pk=subtitle_file.pk).cues)
+
+        subtitle_file.delete()
+        self.assertEqual(subtitle_content_cache.stats()['size'], 0)
+
+    def test_downloaded_content_is_cached_as_text(self):
+        subtitle_content_cache.clear()
+        content = "WEBVTT\n\n1\n00:00:01.000 --> 00:00:02.000\nHällo\n"
+
+        # As the AWS and MLLP downloads pass it
+        with self.captureOnCommitCallbacks(execute=True):
+            subtitle_file = SubtitleFile.objects.create_version(self.subtitle, content.encode("utf-8"), user=self.user)
+
+        self.assertEqual(subtitle_content_cache.get(('content', subtitle_file.pk)), content)
+        self.assertEqual([cue.text for cue in SubtitleFile.objects.get(pk=subtitle_file.pk).cues], ["Hällo"])
+
+
+class SubtitleTimingTests(SubtitleVersionTestCase):
+    def test_course_timings_are_fixed_in_one_pass(self):
+        german = Subtitle.objects.create(tenant=self.subtitle.tenant, video=self.subtitle.video, is_transcript=False,
+                                         language=IsoLanguage.objects.create(iso_code="de", description="German"),
+                                         user=self.user)
+        SubtitleFile.objects.create_version(self.subtitle, write_vtt([Cue(0, 2000, "a"), Cue(1500, 3000, "b")]),
+                                            user=self.user)
+        # Starts before the last cue of the transcript ends, which is no overlap
+        SubtitleFile.objects.create_version(german, write_vtt([Cue(1000, 2000, "c")]), user=self.user)
+
+        result = fix_course_timings(self.subtitle.video.course_section.course, self.user, offset=1000, clip=True,
+                                    min_gap=500)
+
+        self.assertEqual(result, {'subtitles': 2, 'changed': 2, 'cues': 3, 'overlaps': 1, 'gaps': 0})
+        self.assertEqual(Subtitle.objects.get(pk=self.subtitle.pk).latest_file.cues,
+                         (Cue(1000, 2500, "a"), Cue(2500, 4000, "b")))
+        self.assertEqual(Subtitle.objects.get(pk=german.pk).latest_file.cues, (Cue(2000, 3000, "c"),))
+
+    def test_only_the_timings_are_changed(self):
+        content = "WEBVTT - Lecture\nKind: captions\n\nSTYLE\n::cue { color: yellow }\n\nNOTE reviewed\n\n" \
+                  "intro\n00:00:01.000 --> 00:00:02.000 align:start\nHello\n\n" \
+                  "00:00:02.000 --> 00:00:03.000\nBye\n\nNOTE the end"
+        SubtitleFile.objects.create_version(self.subtitle, content, user=self.user)
+
+        fix_course_timings(self.subtitle.video.course_section.course, self.user, offset=500)
+
+        self.assertEqual(Subtitle.objects.get(pk=self.subtitle.pk).latest_content,
+                         content.replace("00:00:03.000", "00:00:03.500").replace("00:00:02.000", "00:00:02.500")
+                         .replace("00:00:01.000", "00:00:01.500"))
+
+
+class SubtitlePublishValidationTests(SubtitleVersionTestCase):
+    def test_invalid_subtitles_are_not_sent(self):
+        SubtitleFile.objects.create_version(self.subtitle, "WEBVTT\n\n00:00:02.000 --> 00:00:01.000\nBackwards",
+                                            user=self.user)
+
+        with mock.patch('subtitles.api.xikolo_api.XikoloClient') as client:
+            published, message = publish_subtitle(Subtitle.objects.get(pk=self.subtitle.pk))
+
+        self.assertFalse(published)
+        self.assertIn("The cue has to end after it starts", message)
+        client.for_tenant.assert_not_called()
+
+
+class TranslationMemoryTests(SubtitleVersionTestCase):
+    def test_translation_memory_sends_only_unknown_captions(self):
+        tenant = self.subtitle.tenant
+        tenant.secrets = {'DEEPL_URL': "https://deepl.invalid", 'DEEPL_AUTH_KEY': "key"}
+        german = IsoLanguage.objects.create(iso_code="de", description="German")
+        # Translations are stored for the user with id 1
+        TranspipeUser.objects.get_or_create(pk=1, defaults={'username': "system", 'tenant': tenant})
+
+        SubtitleFile.objects.create_version(self.subtitle, write_vtt([
+            Cue(0, 2000, "Welcome\nto the course"), Cue(2000, 4000, "Hello"), Cue(4000, 6000, "Welcome to the course"),
+        ]), user=self.user)
+
+        with mock.patch('mooclink.services.deepl_translation_service.call_provider',
+                        side_effect=call_fake_deepl) as provider:
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german])
+            self.assertEqual(provider.call_args.kwargs['data']['text'], "Welcome to the course<span>Hello")
+
+            SubtitleFile.objects.create_version(self.subtitle, write_vtt([
+                Cue(0, 2000, "Welcome to the  course"), Cue(2000, 4000, "Goodbye"), Cue(4000, 6000, ""),
+            ]), user=self.user)
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german],
+                                                      incremental=False)
+            self.assertEqual(provider.call_args.kwargs['data']['text'], "Goodbye")
+
+        translation = Subtitle.objects.get(video=self.subtitle.video, language=german)
+        self.assertEqual([cue.text for cue in translation.latest_file.cues], ["WELCOME TO THE COURSE", "GOODBYE", ""])
+        self.assertEqual(TranslationMemory.objects.get(source_text="Welcome to the course").hits, 1)
+
+        use = ServiceProviderUse.objects.latest('pk')
+        self.assertEqual((use.data['characters'], use.data['memory_hits'], use.data['hit_rate']), (7, 1, 0.5))
+
+
+class RetranslationTests(SubtitleVersionTestCase):
+    def test_only_changed_cues_are_translated_again(self):
+        tenant = self.subtitle.tenant
+        tenant.secrets = {'DEEPL_URL': "https://deepl.invalid", 'DEEPL_AUTH_KEY': "key"}
+        german = IsoLanguage.objects.create(iso_code="de", description="German")
+        TranspipeUser.objects.get_or_create(pk=1, defaults={'username': "system", 'tenant': tenant})
+
+        cues = [Cue(0, 2000, "One"), Cue(2000, 4000, "Two"), Cue(4000, 6000, "Three")]
+        SubtitleFile.objects.create_version(self.subtitle, write_vtt(cues), user=self.user)
+
+        with mock.patch('mooclink.services.deepl_translation_service.call_provider',
+                        side_effect=call_fake_deepl) as provider:
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german])
+
+            # Reviewed translation
+            translation = Subtitle.objects.get(video=self.subtitle.video, language=german)
+            SubtitleFile.objects.create_version(translation, write_vtt([
+                Cue(0, 2000, "Eins"), Cue(2000, 4000, "Zwei"), Cue(4000, 6000, "Drei"),
+            ]), user=self.user)
+
+            cues[2] = Cue(4000, 6000, "Three!")
+            source_file = SubtitleFile.objects.create_version(self.subtitle, write_vtt(cues), user=self.user)
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german])
+            self.assertEqual(provider.call_args.kwargs['data']['text'], "Three!")
+
+        latest_file = Subtitle.objects.get(pk=translation.pk).latest_file
+        self.assertEqual([cue.text for cue in latest_file.cues], ["Eins", "Zwei", "THREE!"])
+        self.assertEqual(latest_file.source_file, source_file)
+
+    def test_unchanged_translations_are_kept(self):
+        tenant = self.subtitle.tenant
+        tenant.secrets = {'DEEPL_URL': "https://deepl.invalid", 'DEEPL_AUTH_KEY': "key"}
+        german = IsoLanguage.objects.create(iso_code="de", description="German")
+        TranspipeUser.objects.get_or_create(pk=1, defaults={'username': "system", 'tenant': tenant})
+
+        SubtitleFile.objects.create_version(self.subtitle, write_vtt([Cue(0, 2000, "One"), Cue(2000, 4000, "Two")]),
+                                            user=self.user)
+
+        with mock.patch('mooclink.services.deepl_translation_service.call_provider',
+                        side_effect=call_fake_deepl) as provider:
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german])
+
+            translation = Subtitle.objects.get(video=self.subtitle.video, language=german)
+            Subtitle.objects.filter(pk=translation.pk).update(status=Subtitle.SubtitleStatus.REVIEWED)
+
+            DeeplTranslationService(tenant).translate(Subtitle.objects.get(pk=self.subtitle.pk), [german])
+
+        provider.assert_called_once()
+        self.assertEqual(SubtitleFile.objects.filter(subtitle=translation).count(), 1)
+        self.assertEqual(Subtitle.objects.get(pk=translation.pk).status, Subtitle.SubtitleStatus.REVIEWED)
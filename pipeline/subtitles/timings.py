@@ -0,0 +1,150 @@
+"""Cue timings as integer millisecond arrays, so conversions and corrections run over all cues at once"""
+
+import re
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Position before a timestamp without hours
+MISSING_HOURS_PATTERN = re.compile(r'(?<![\d:])(?=\d{1,2}:\d{2}[.,]\d{3})')
+TIMESTAMP_SEPARATORS = str.maketrans(":.,", "   ")
+TIMESTAMP_FACTORS = np.array([60 * 60 * 1000, 60 * 1000, 1000, 1], dtype=np.int64)
+
+
+def parse_timestamps(timestamps: Sequence[str]) -> np.ndarray:
+    """
+    Parses `HH:MM:SS.mmm` or `MM:SS.mmm` timestamps into an array of milliseconds.
+    """
+    text = " ".join(timestamps)
+    if text.count(":") != 2 * len(timestamps):
+        text = MISSING_HOURS_PATTERN.sub("0:", text)
+
+    fields = np.fromstring(text.translate(TIMESTAMP_SEPARATORS), dtype=np.int64, sep=" ")
+    if len(fields) != 4 * len(timestamps):
+        raise ValueError("Malformed timestamp")
+
+    return fields.reshape(-1, 4) @ TIMESTAMP_FACTORS
+
+
+def format_timestamps(millis: np.ndarray) -> List[str]:
+    seconds, millis = np.divmod(np.asarray(millis, dtype=np.int64), 1000)
+    minutes, seconds = np.divmod(seconds, 60)
+    hours, minutes = np.divmod(minutes, 60)
+
+    return [f"{h:02}:{m:02}:{s:02}.{ms:03}"
+            for h, m, s, ms in zip(hours.tolist(), minutes.tolist(), seconds.tolist(), millis.tolist())]
+
+
+def get_timings(cues: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    @return: Start and end times of the cues
+    """
+    starts = np.fromiter((cue.start for cue in cues), dtype=np.int64, count=len(cues))
+    ends = np.fromiter((cue.end for cue in cues), dtype=np.int64, count=len(cues))
+    return starts, ends
+
+
+def shift(timings: np.ndarray, offset: int) -> np.ndarray:
+    """
+    Moves the timings by `offset` milliseconds, but not before the start of the video.
+    """
+    return np.maximum(timings + offset, 0)
+
+
+def scale(timings: np.ndarray, factor: float) -> np.ndarray:
+    """
+    Stretches the timings, e.g. by 25 / 23.976 for subtitles that were timed against the wrong frame rate.
+    """
+    return np.rint(timings * factor).astype(np.int64)
+
+
+def find_overlaps(starts: np.ndarray, ends: np.ndarray, boundaries: np.ndarray = None) -> np.ndarray:
+    """
+    @param boundaries: Optional mask of the cues that end a subtitle, when the timings of several subtitles are
+        concatenated
+    @return: Indices of the cues that end after the next cue starts
+    """
+    overlapping = ends[:-1] > starts[1:]
+    if boundaries is not None:
+        overlapping &= ~boundaries[:-1]
+    return np.flatnonzero(overlapping)
+
+
+def find_gaps(starts: np.ndarray, ends: np.ndarray, min_gap: int, boundaries: np.ndarray = None) -> np.ndarray:
+    """
+    @return: Indices of the cues that are followed by at least `min_gap` milliseconds without a cue
+    """
+    gaps = starts[1:] - ends[:-1] >= min_gap
+    if boundaries is not None:
+        gaps &= ~boundaries[:-1]
+    return np.flatnonzero(gaps)
+
+
+def clip_overlaps(starts: np.ndarray, ends: np.ndarray, boundaries: np.ndarray = None) -> np.ndarray:
+    """
+    @return: End times, where every cue ends at the latest when the next cue starts
+    """
+    ends = ends.copy()
+    overlaps = find_overlaps(starts, ends, boundaries)
+    ends[overlaps] = starts[overlaps + 1]
+    return ends
+
+
+def fix_course_timings(course, user, offset=0, factor=1.0, clip=False, min_gap=None, languages=None,
+                       dry_run=False) -> dict:
+    """
+    Corrects the timings of the latest versions of all subtitles of the course in one pass over their concatenated
+    timings: scaled by `factor` first, then shifted by `offset` milliseconds and, with `clip`, overlapping cues
+    shortened. Subtitles whose timings change get a new version by `user`, which only differs in the timings: cue
+    identifiers and settings, the header and NOTE, STYLE and REGION blocks are written back as they were.
+
+    @param languages: Only fix the subtitles in these languages (ISO codes)
+    @param min_gap: Count gaps of at least this many milliseconds in the result
+    @return: Numbers of subtitles, changed subtitles, cues, overlaps and gaps
+    """
+    from .cues import with_timings, write_vtt
+    from .models import Subtitle, SubtitleFile
+
+    subtitles = Subtitle.objects.filter(video__course_section__course=course, latest_file__isnull=False) \
+        .select_related('latest_file').order_by('pk')
+    if languages:
+        subtitles = subtitles.filter(language__in=languages)
+
+    subtitles = list(subtitles)
+    cue_lists = [subtitle.latest_file.cues for subtitle in subtitles]
+    all_cues = [cue for cues in cue_lists for cue in cues]
+
+    lengths = np.fromiter(map(len, cue_lists), dtype=np.int64, count=len(cue_lists))
+    boundaries = np.zeros(len(all_cues), dtype=bool)
+    boundaries[np.cumsum(lengths)[lengths > 0] - 1] = True
+
+    starts, ends = get_timings(all_cues)
+    new_starts = shift(scale(starts, factor), offset)
+    new_ends = shift(scale(ends, factor), offset)
+    overlaps = len(find_overlaps(new_starts, new_ends, boundaries))
+
+    if clip:
+        new_ends = clip_overlaps(new_starts, new_ends, boundaries)
+
+    changed_cues = (new_starts != starts) | (new_ends != ends)
+    split_at = np.cumsum(lengths)[:-1]
+
+    changed = 0
+    for subtitle, cues, subtitle_starts, subtitle_ends, subtitle_changed in zip(
+            subtitles, cue_lists, np.split(new_starts, split_at), np.split(new_ends, split_at),
+            np.split(changed_cues, split_at)):
+        if not subtitle_changed.any():
+            continue
+
+        changed += 1
+        if not dry_run:
+            SubtitleFile.objects.create_version(subtitle, write_vtt(with_timings(cues, subtitle_starts, subtitle_ends)),
+                                                user=user)
+
+    return {
+        'subtitles': len(subtitles),
+        'changed': changed,
+        'cues': len(all_cues),
+        'overlaps': overlaps,
+        'gaps': len(find_gaps(new_starts, new_ends, min_gap, boundaries)) if min_gap is not None else None,
+    }
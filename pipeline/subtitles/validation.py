@@ -0,0 +1,109 @@
+"""Local validation of WebVTT files, so broken files are rejected before they are sent to the MOOC platform"""
+
+import re
+from typing import List, NamedTuple, Union
+
+import numpy as np
+
+from .timings import parse_timestamps
+
+HEADER_PATTERN = re.compile(r'WEBVTT(?:[ \t].*)?$')
+# Stricter than the parser in `cues`, which also reads slightly malformed files
+TIMINGS_PATTERN = re.compile(r'((?:\d{2,}:)?[0-5]\d:[0-5]\d\.\d{3})[ \t]+-->[ \t]+((?:\d{2,}:)?[0-5]\d:[0-5]\d\.\d{3})'
+                             r'(?:[ \t].*)?$')
+OTHER_BLOCK_PATTERN = re.compile(r'(?:NOTE|STYLE|REGION)(?:[ \t].*)?$')
+
+# Number of messages per check, a broken file would otherwise report every single cue
+MAX_MESSAGES = 10
+
+
+class VttValidation(NamedTuple):
+    errors: List[str]
+    warnings: List[str]
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def summary(self, limit=3) -> str:
+        summary = "; ".join(self.errors[:limit])
+        if len(self.errors) > limit:
+            summary += f" (and {len(self.errors) - limit} more)"
+        return summary
+
+
+def _add(messages: List[str], line_numbers, message: str):
+    for line_number in line_numbers[:MAX_MESSAGES]:
+        messages.append(f"Line {line_number}: {message}")
+    if len(line_numbers) > MAX_MESSAGES:
+        messages.append(f"{len(line_numbers) - MAX_MESSAGES} more lines: {message}")
+
+
+def validate_vtt(content: Union[str, bytes]) -> VttValidation:
+    """
+    Checks the encoding, the header, the cue timings, their order and overlaps in one pass over the lines.
+    Errors make the file invalid, warnings are reported only.
+    """
+    errors, warnings = [], []
+
+    if isinstance(content, bytes):
+        try:
+            content = content.decode("utf-8")
+        except UnicodeDecodeError as exception:
+            return VttValidation([f"The file is not UTF-8 encoded (byte {exception.start})"], [])
+
+    if "\0" in content:
+        errors.append("The file contains NUL characters")
+
+    lines = content.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+    if not HEADER_PATTERN.match(lines[0]):
+        errors.append("Line 1: The file has to start with 'WEBVTT'")
+
+    timestamps, timing_lines = [], []
+    malformed, misplaced, untimed = [], [], []
+
+    # Position in the current block, the header is the first block
+    block_line = 0
+    in_header = True
+    block_start = None
+    block_timed = False
+    for line_number, line in enumerate(lines[1:], start=2):
+        if not line.strip():
+            if block_start is not None and not in_header:
+                untimed.append(block_start)
+            block_line, in_header, block_start, block_timed = 0, False, None, False
+            continue
+
+        if "-->" in line:
+            if in_header or block_timed or block_line > 1:
+                misplaced.append(line_number)
+            elif match := TIMINGS_PATTERN.match(line):
+                timestamps += match.groups()
+                timing_lines.append(line_number)
+            else:
+                malformed.append(line_number)
+            block_start, block_timed = None, True
+        elif block_line == 0 and not in_header:
+            block_start = None if OTHER_BLOCK_PATTERN.match(line) else line_number
+
+        block_line += 1
+
+    if block_start is not None and not in_header:
+        untimed.append(block_start)
+
+    _add(errors, malformed, "Malformed cue timings, expected 'HH:MM:SS.mmm --> HH:MM:SS.mmm'")
+    _add(errors, misplaced, "'-->' is only allowed in cue timings, after a blank line or a cue identifier")
+    _add(warnings, untimed, "Block without cue timings is ignored")
+
+    if timing_lines:
+        timings = parse_timestamps(timestamps)
+        starts, ends = timings[::2], timings[1::2]
+        timing_lines = np.array(timing_lines)
+
+        _add(errors, timing_lines[ends <= starts].tolist(), "The cue has to end after it starts")
+        _add(errors, timing_lines[1:][starts[1:] < starts[:-1]].tolist(), "The cue starts before the previous one")
+        _add(warnings, timing_lines[1:][(starts[1:] >= starts[:-1]) & (starts[1:] < ends[:-1])].tolist(),
+             "The cue overlaps the previous one")
+
+    return VttValidation(errors, warnings)
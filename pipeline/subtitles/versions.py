@@ -0,0 +1,45 @@
+"""Cue-level deltas between two versions of a subtitle, used to store the version history compactly"""
+
+import json
+import zlib
+from difflib import SequenceMatcher
+from typing import List
+
+
+def split_cues(content: str) -> List[str]:
+    """
+    Splits WebVTT content into its blocks (header, cues, notes), which are separated by blank lines.
+    `"\\n\\n".join(split_cues(content)) == content` holds for every content.
+    """
+    return content.split("\n\n")
+
+
+def make_delta(base: str, target: str) -> bytes:
+    """
+    Returns a compressed delta that turns `base` into `target`. Cues of `base` that are kept are referenced by
+    their position, only changed or added cues are part of the delta.
+    """
+    base_cues = split_cues(base)
+    target_cues = split_cues(target)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_cues, target_cues, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append(["=", i1, i2])
+        elif j1 < j2:
+            ops.append(["+", target_cues[j1:j2]])
+
+    return zlib.compress(json.dumps(ops, ensure_ascii=False).encode("utf-8"), 9)
+
+
+def apply_delta(base: str, delta: bytes) -> str:
+    base_cues = split_cues(base)
+
+    target_cues = []
+    for op in json.loads(zlib.decompress(delta).decode("utf-8")):
+        if op[0] == "=":
+            target_cues.extend(base_cues[op[1]:op[2]])
+        else:
+            target_cues.extend(op[1])
+
+    return "\n\n".join(target_cues)